@@ -0,0 +1,145 @@
+"""Measure checkpoint cost per chapter as a novel grows.
+
+"before" reproduces the original behaviour: every chapter dumps all volumes
+with ``model_dump()``, walks the result again with ``to_dict`` and rewrites a
+single ``checkpoint.json``. "after" journals each stage result and compacts
+the journal into the sharded, content-addressed snapshot of ``FileStorage``.
+
+    python -m benchmarks.checkpoint_benchmark --chapters 500
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from novel_genie.schema import (
+    Chapter,
+    ChapterOutline,
+    DetailedOutline,
+    NovelSaver,
+    NovelVolume,
+)
+from novel_genie.storage import FileStorage, to_dict
+
+
+class CountingFileStorage(FileStorage):
+    """FileStorage that counts the bytes it writes."""
+
+    bytes_written = 0
+
+    def _write_durable(self, path: Path, text: str) -> None:
+        self.bytes_written += len(text.encode("utf-8"))
+        super()._write_durable(path, text)
+
+    def save_record(self, novel_id: str, path, value: Any) -> None:
+        record = json.dumps({"path": path, "value": value}, ensure_ascii=False)
+        self.bytes_written += len(record.encode("utf-8")) + 1
+        super().save_record(novel_id, path, value)
+
+
+def make_chapter(chapter_num: int):
+    return (
+        ChapterOutline(
+            chapter_overview=f"第{chapter_num}章概述" * 40,
+            characters_content="角色介绍" * 40,
+        ),
+        DetailedOutline(storyline=f"第{chapter_num}章情节" * 200),
+        Chapter(title=f"第{chapter_num}章", content="正文内容。" * 800),
+    )
+
+
+def run_before(base_dir: str, chapters: int, per_volume: int) -> List[Dict]:
+    volumes: List[NovelVolume] = []
+    checkpoint_path = Path(base_dir) / "checkpoint.json"
+    rows = []
+    for chapter_num in range(1, chapters + 1):
+        volume_index = (chapter_num - 1) // per_volume
+        if volume_index == len(volumes):
+            volumes.append(NovelVolume(volume_num=volume_index + 1))
+        outline, detailed, chapter = make_chapter(chapter_num)
+        volume = volumes[volume_index]
+        volume.chapter_outlines.append(outline)
+        volume.detailed_outlines.append(detailed)
+        volume.chapters.append(chapter)
+
+        start = time.perf_counter()
+        state = {"volumes": [v.model_dump() for v in volumes]}
+        text = json.dumps(to_dict(state), ensure_ascii=False, indent=2)
+        FileStorage._write_durable(checkpoint_path, text)
+        rows.append(
+            {"seconds": time.perf_counter() - start, "bytes": len(text.encode())}
+        )
+    return rows
+
+
+def run_after(base_dir: str, chapters: int, per_volume: int) -> List[Dict]:
+    backend = CountingFileStorage(base_dir)
+    saver = NovelSaver(base_dir=base_dir, backend=backend, write_queue_size=0)
+    novel_id = "bench"
+    saver.save_checkpoint(novel_id, {"volumes": []})
+    volume_count = 0
+    rows = []
+    for chapter_num in range(1, chapters + 1):
+        volume_index = (chapter_num - 1) // per_volume
+        index = (chapter_num - 1) % per_volume
+        outline, detailed, chapter = make_chapter(chapter_num)
+
+        start = time.perf_counter()
+        before_bytes = backend.bytes_written
+        if volume_index == volume_count:
+            volume_count += 1
+            saver.append_journal(
+                novel_id,
+                ["volumes", volume_index],
+                NovelVolume(volume_num=volume_count),
+            )
+        for kind, value in (
+            ("chapter_outlines", outline),
+            ("detailed_outlines", detailed),
+            ("chapters", chapter),
+        ):
+            saver.append_journal(
+                novel_id, ["volumes", volume_index, kind, index], value
+            )
+            if saver.needs_compaction(novel_id):
+                saver.compact(novel_id)
+        rows.append(
+            {
+                "seconds": time.perf_counter() - start,
+                "bytes": backend.bytes_written - before_bytes,
+            }
+        )
+    saver.close()
+    return rows
+
+
+def summarize(name: str, rows: List[Dict], window: int) -> None:
+    print(f"{name}:")
+    for end in range(window, len(rows) + 1, window):
+        chunk = rows[end - window : end]
+        ms = sum(row["seconds"] for row in chunk) / len(chunk) * 1000
+        kb = sum(row["bytes"] for row in chunk) / len(chunk) / 1024
+        print(f"  chapters {end - window + 1:>4}-{end:<4} {ms:8.2f} ms  {kb:9.1f} KiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=500)
+    parser.add_argument("--chapters-per-volume", type=int, default=50)
+    parser.add_argument("--window", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as before_dir:
+        before = run_before(before_dir, args.chapters, args.chapters_per_volume)
+    with tempfile.TemporaryDirectory() as after_dir:
+        after = run_after(after_dir, args.chapters, args.chapters_per_volume)
+
+    print("Average checkpoint cost per chapter")
+    summarize("before (full snapshot per chapter)", before, args.window)
+    summarize("after (journal + delta compaction)", after, args.window)
+
+
+if __name__ == "__main__":
+    main()
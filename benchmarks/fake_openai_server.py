@@ -0,0 +1,344 @@
+"""A minimal stand-in for an OpenAI-compatible chat completions endpoint.
+
+Used by the benchmarks to exercise the real HTTP path of ``LLM.ask`` without
+a network connection or an API key. With ``--novel`` every prompt of the
+generation pipeline gets a canned reply its parser accepts, so a whole
+novel can be generated offline. Latency, streaming rate and injected errors
+are configurable.
+
+    python -m benchmarks.fake_openai_server --port 8765 --latency 0.01
+    python -m benchmarks.fake_openai_server --novel --tokens-per-second 200 \\
+        --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Callable, List, Optional, Union
+
+from aiohttp import web
+
+
+DEFAULT_REPLY = "这是一个用于基准测试的模拟回复。"
+# Reply without the tags or heading the format checks of the stages expect
+MALFORMED_REPLY = "抱歉，我暂时无法按照要求的格式回答这个问题。"
+# Error types of the injected errors, by HTTP status
+ERROR_TYPES = {429: "rate_limit_exceeded", 500: "server_error", 503: "overloaded"}
+
+CHAPTER_PATTERN = re.compile(r"## 指定章节\s*第\s*(\d+)\s*章")
+VOLUME_COUNT_PATTERN = re.compile(r"计划卷数：\s*(\d+)")
+
+
+class NovelReplies:
+    """
+    Canned replies for the prompts of the novel generation pipeline.
+
+    Each prompt is recognised by its first heading, and answered in the
+    format its stage parses: the intent as a JSON code block, outlines in
+    the tags `extract_outline` reads, chapters starting with the heading
+    `CHAPTER_TITLE_PATTERN` matches, and optimizations as edit commands.
+
+    Args:
+        chapter_chars (int): Approximate length of a chapter
+        thinking (bool): Start chapters with a thinking block, as models
+            following the thinking protocol do
+        malformed_rate (float): Fraction of outline and chapter replies
+            answered without their tags or heading. Only these stages check
+            the format and retry, so the other stages are always answered.
+        seed (Optional[int]): Seed of the malformed replies
+    """
+
+    def __init__(
+        self,
+        chapter_chars: int = 2000,
+        thinking: bool = True,
+        malformed_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.chapter_chars = chapter_chars
+        self.thinking = thinking
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.malformed_count = 0
+
+    def _malformed(self) -> bool:
+        if self.malformed_rate and self.random.random() < self.malformed_rate:
+            self.malformed_count += 1
+            return True
+        return False
+
+    @staticmethod
+    def _chapter_num(prompt: str) -> int:
+        match = CHAPTER_PATTERN.search(prompt)
+        return int(match.group(1)) if match else 1
+
+    def intent(self, prompt: str) -> str:
+        intent = {
+            "title": "雾港灯塔",
+            "description": "一名年轻的灯塔守护人在雾港揭开家族世代守护的秘密。",
+            "genre": "悬疑",
+            "work_length": "中篇",
+        }
+        return f"```json\n{json.dumps(intent, ensure_ascii=False)}\n```"
+
+    def rough_outline(self, prompt: str) -> str:
+        match = VOLUME_COUNT_PATTERN.search(prompt)
+        volume_count = int(match.group(1)) if match else 1
+        volumes = "".join(
+            f"<volume_design>第{volume_num}卷：雾港的第{volume_num}个谜团逐渐浮出水面，"
+            f"主角与守夜人的关系随之变化。</volume_design>\n"
+            for volume_num in range(1, volume_count + 1)
+        )
+        return (
+            "<worldview_system>常年被浓雾笼罩的港口小城，灯塔的光能驱散雾中的异物。"
+            "</worldview_system>\n"
+            "<character_system>林默：新任灯塔守护人，沉默而执拗。"
+            "苏晚：港口医生，知道灯塔的旧事。</character_system>\n" + volumes
+        )
+
+    def chapter_outline(self, prompt: str) -> str:
+        chapter_num = self._chapter_num(prompt)
+        return (
+            f"<chapter_overview>第{chapter_num}章：林默在雾夜里发现灯塔日志缺了一页，"
+            f"他决定去找苏晚打听。</chapter_overview>\n"
+            "<characters_content>林默：警觉、克制。苏晚：欲言又止。</characters_content>"
+        )
+
+    def detailed_outline(self, prompt: str) -> str:
+        chapter_num = self._chapter_num(prompt)
+        return (
+            f"<storyline>第{chapter_num}章故事线：雾夜巡塔，发现日志缺页；"
+            f"清晨走访诊所，苏晚回避问题；傍晚雾中传来钟声。</storyline>"
+        )
+
+    def chapter(self, prompt: str) -> str:
+        chapter_num = self._chapter_num(prompt)
+        paragraph = "雾从海面上漫过来，林默提着灯沿着螺旋楼梯一级一级往上走，铁栏杆冰凉潮湿。\n"
+        paragraphs = paragraph * max(1, self.chapter_chars // len(paragraph))
+        thinking = "```thinking\n先写雾夜的氛围，再让人物登场。\n```\n" if self.thinking else ""
+        return f"{thinking}## 第{chapter_num}章 雾夜钟声\n\n{paragraphs}"
+
+    def optimization(self, prompt: str) -> str:
+        edit = "edit 1:1 <<EOF\\n海雾无声地漫上礁石，林默提灯上塔。\\nEOF"
+        return f'```python\ncmds = ["{edit}"]\n```'
+
+    def summary(self, prompt: str) -> str:
+        return "林默发现灯塔日志缺页，苏晚对旧事讳莫如深，雾中响起不该出现的钟声。"
+
+    def __call__(self, prompt: str) -> str:
+        heading = re.search(r"^# (.+)$", prompt, re.MULTILINE)
+        heading = heading.group(1) if heading else ""
+        if heading.startswith("根据以下用户输入"):
+            return self.intent(prompt)
+        checked = {
+            "网文粗纲生成器": self.rough_outline,
+            "网文章纲生成器": self.chapter_outline,
+            "网文细纲生成器": self.detailed_outline,
+            "网文章节生成器": self.chapter,
+        }
+        for name, reply in checked.items():
+            if heading.startswith(name):
+                return MALFORMED_REPLY if self._malformed() else reply(prompt)
+        if heading.startswith("网文章节内容优化器"):
+            return self.optimization(prompt)
+        if heading.startswith(("网文章节摘要生成器", "网文细纲总结生成器")):
+            return self.summary(prompt)
+        return DEFAULT_REPLY
+
+
+class FakeOpenAIServer:
+    """
+    Serve canned chat completions with artificial latency and errors.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on
+        latency (float): Seconds before the first token of every reply
+        reply (Union[str, Callable[[str], str]]): The reply, or a function
+            mapping the last user message to it, such as `NovelReplies`
+        chunk_size (int): Characters per streamed chunk
+        tokens_per_second (float): Streaming rate, counting a character as
+            a token; 0 sends the whole reply at once
+        error_rate (float): Fraction of requests failed with `error_status`
+        error_status (int): HTTP status of the injected errors
+        seed (Optional[int]): Seed of the error injection
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        latency: float = 0.0,
+        reply: Union[str, Callable[[str], str]] = DEFAULT_REPLY,
+        chunk_size: int = 8,
+        tokens_per_second: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.error_count = 0
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _reply_for(self, messages: List[dict]) -> str:
+        if isinstance(self.reply, str):
+            return self.reply
+        prompts = [m["content"] for m in messages if m.get("role") == "user"]
+        return self.reply(prompts[-1] if prompts else "")
+
+    def _chunks(self, reply: str) -> List[str]:
+        return [
+            reply[i : i + self.chunk_size]
+            for i in range(0, len(reply), self.chunk_size)
+        ]
+
+    def _error_response(self) -> web.Response:
+        self.error_count += 1
+        return web.json_response(
+            {
+                "error": {
+                    "message": "Injected error of the fake server",
+                    "type": ERROR_TYPES.get(self.error_status, "server_error"),
+                }
+            },
+            status=self.error_status,
+            headers={"Retry-After": "0"} if self.error_status == 429 else None,
+        )
+
+    async def handle_chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self._error_response()
+        reply = self._reply_for(body.get("messages", []))
+
+        created = int(time.time())
+        if not body.get("stream"):
+            if self.tokens_per_second:
+                await asyncio.sleep(len(reply) / self.tokens_per_second)
+            return web.json_response(
+                {
+                    "id": f"chatcmpl-{self.request_count}",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        for piece in self._chunks(reply):
+            event = {
+                "id": f"chatcmpl-{self.request_count}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": piece}}],
+            }
+            await response.write(
+                f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+            )
+            if self.tokens_per_second:
+                await asyncio.sleep(len(piece) / self.tokens_per_second)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        return app
+
+    async def start(self) -> "FakeOpenAIServer":
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument(
+        "--novel",
+        action="store_true",
+        help="Answer the prompts of the generation pipeline",
+    )
+    parser.add_argument("--chapter-chars", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of outline and chapter replies without their format",
+    )
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args()
+
+
+async def serve_forever(args: argparse.Namespace) -> None:
+    server = await FakeOpenAIServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        reply=(
+            NovelReplies(
+                args.chapter_chars, malformed_rate=args.malformed_rate, seed=args.seed
+            )
+            if args.novel
+            else DEFAULT_REPLY
+        ),
+        chunk_size=args.chunk_size,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    ).start()
+    print(f"Fake OpenAI server listening on {server.base_url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve_forever(parse_arguments()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,100 @@
+"""Compare per-request HTTP sessions with the pooled session owned by ``LLM``.
+
+"before" reproduces the old behaviour: module-global openai credentials and a
+fresh aiohttp session (new TCP connection) for every request. "after" goes
+through ``LLM.ask``, which reuses one keep-alive connection pool per instance.
+
+    python -m benchmarks.llm_client_benchmark --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+import openai
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from novel_genie.config import LLMSettings
+from novel_genie.llm import LLM
+from novel_genie.stream_sink import NullSink
+
+
+async def run_load(
+    call: Callable[[], Awaitable[str]], requests: int, concurrency: int
+) -> List[float]:
+    """Issue ``requests`` calls with at most ``concurrency`` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], wall: float) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(
+        f"{name:<8} requests={len(latencies):<5} wall={wall:.3f}s "
+        f"throughput={len(latencies) / wall:.1f} req/s "
+        f"p50={p50:.2f}ms p95={p95:.2f}ms"
+    )
+
+
+async def main(requests: int, concurrency: int, latency: float, stream: bool):
+    server = await FakeOpenAIServer(latency=latency).start()
+    settings = LLMSettings(
+        model="fake-model", base_url=server.base_url, api_key="sk-fake"
+    )
+    messages = [{"role": "user", "content": "hello"}]
+
+    async def before() -> str:
+        openai.api_key = settings.api_key
+        openai.api_base = settings.base_url
+        response = await openai.ChatCompletion.acreate(
+            model=settings.model, messages=messages, stream=stream
+        )
+        if not stream:
+            return response["choices"][0]["message"]["content"]
+        return "".join(
+            [
+                chunk["choices"][0].get("delta", {}).get("content", "")
+                async for chunk in response
+            ]
+        )
+
+    llm = LLM(settings)
+
+    async def after() -> str:
+        return await llm.ask("hello", stream=stream, system_prompt="", sink=NullSink())
+
+    try:
+        await run_load(after, min(requests, concurrency), concurrency)
+        start = time.perf_counter()
+        before_latencies = await run_load(before, requests, concurrency)
+        before_wall = time.perf_counter() - start
+        start = time.perf_counter()
+        after_latencies = await run_load(after, requests, concurrency)
+        after_wall = time.perf_counter() - start
+        report("before", before_latencies, before_wall)
+        report("after", after_latencies, after_wall)
+    finally:
+        await llm.close()
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency, args.stream))
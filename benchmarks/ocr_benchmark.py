@@ -0,0 +1,127 @@
+"""Measure screenshot OCR latency and how long it blocks the event loop.
+
+"before" builds a new easyocr reader for every screenshot and reads it on
+the event loop, as screenshot mode used to. "after" reads every screenshot
+with the cached reader on the OCR thread, after warming it up the way
+``--ocr-warmup`` does. A heartbeat task ticking every few milliseconds
+records the longest gap between its ticks, which is how long generation
+streams would have stalled.
+
+Needs the screenshot extra (``pip install "novel-genie[screenshot]"``).
+Images are taken from ``--images``, or rendered with PIL when not given.
+
+    python -m benchmarks.ocr_benchmark --screenshots 5
+"""
+import argparse
+import asyncio
+import importlib.util
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import novel_genie.app as app
+
+
+HEARTBEAT_INTERVAL = 0.005
+SAMPLE_LINES = [
+    "Chapter 1: The Lighthouse Keeper",
+    "A storm was coming, and the old keeper climbed the stairs once more.",
+    "Write a mystery novel set on a remote island.",
+]
+
+
+def render_images(directory: Path, count: int) -> List[str]:
+    from PIL import Image, ImageDraw
+
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", (900, 200), "white")
+        draw = ImageDraw.Draw(image)
+        for line_num, line in enumerate(SAMPLE_LINES):
+            draw.text((20, 30 + 50 * line_num), f"{line} ({index})", fill="black")
+        path = directory / f"screenshot_{index}.png"
+        image.save(path)
+        paths.append(str(path))
+    return paths
+
+
+async def measure(mode: str, images: List[str]) -> Tuple[List[float], float]:
+    """
+    Read every image in `mode`, with a heartbeat running alongside.
+
+    Returns:
+        Tuple: Seconds per screenshot and the longest heartbeat gap.
+    """
+    longest_gap = 0.0
+    running = True
+
+    async def heartbeat() -> None:
+        nonlocal longest_gap
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.perf_counter()
+            longest_gap = max(longest_gap, now - last - HEARTBEAT_INTERVAL)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+    latencies = []
+    for path in images:
+        start = time.perf_counter()
+        if mode == "before":
+            import easyocr
+
+            reader = easyocr.Reader(app.OCR_LANGUAGES)
+            reader.readtext(path, detail=0, paragraph=True)
+        else:
+            await app.extract_text_from_image_async(path)
+        latencies.append(time.perf_counter() - start)
+    running = False
+    await beat
+    return latencies, longest_gap
+
+
+def report(mode: str, latencies: List[float], longest_gap: float) -> None:
+    print(
+        f"{mode:>6}: first {latencies[0]:.2f}s, "
+        f"median {statistics.median(latencies):.2f}s, "
+        f"max {max(latencies):.2f}s per screenshot; "
+        f"event loop blocked up to {longest_gap * 1000:.0f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", nargs="*", help="Screenshots to read")
+    parser.add_argument("--screenshots", type=int, default=5)
+    parser.add_argument("--skip-before", action="store_true")
+    args = parser.parse_args()
+
+    missing = [
+        name for name in ("easyocr", "PIL") if importlib.util.find_spec(name) is None
+    ]
+    if missing:
+        sys.exit(
+            f"The OCR benchmark needs {', '.join(missing)}; "
+            'install them with `pip install "novel-genie[screenshot]"`'
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        images = args.images or render_images(Path(tmp_dir), args.screenshots)
+        if not args.skip_before:
+            report("before", *asyncio.run(measure("before", images)))
+
+        # Warm-up runs while the user has not pressed the shortcut yet
+        start = time.perf_counter()
+        app.warm_up_ocr()
+        app.get_ocr_executor().submit(lambda: None).result()
+        print(f"warm-up: {time.perf_counter() - start:.2f}s")
+        report("after", *asyncio.run(measure("after", images)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Generate whole novels offline and report where the time goes.
+
+Every run generates a novel of ``--volumes`` volumes with ``--chapters``
+chapters each through ``NovelGenie.generate_novel``, against the fake
+OpenAI server started in a separate process with ``--novel`` replies, so
+its CPU time and memory are not counted. Each run reports:
+
+- wall time, and the time at least one LLM request was in flight
+  (including retries) next to the time none was, when only local work
+  such as prompt building, parsing and scheduling could progress;
+- CPU time of this process, LLM client and background writer included;
+- time spent in checkpoint writes of the storage backend;
+- peak RSS of this process.
+
+    python -m benchmarks.pipeline_benchmark --volumes 2 --chapters 10 \\
+        --latency 0.2 --tokens-per-second 500 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Dict, List
+
+from pydantic import PrivateAttr
+
+from novel_genie.config import LLMSettings, NovelGenerationConfig
+from novel_genie.generate_novel import NovelGenie
+from novel_genie.llm import LLM
+from novel_genie.logger import define_log_level
+from novel_genie.schema import NovelSaver
+from novel_genie.storage import StorageBackend
+from novel_genie.stream_sink import NullSink
+
+
+USER_INPUT = "写一部发生在常年大雾的港口小城的悬疑小说，主角是新上任的灯塔守护人。"
+WRITE_METHODS = ("save_snapshot", "save_record", "compact", "save_chapter_text")
+
+
+class TimedLLM(LLM):
+    """LLM that records how long requests, retries included, are in flight."""
+
+    requests: int = 0
+    request_seconds: float = 0.0
+    in_flight_seconds: float = 0.0
+
+    _in_flight: int = PrivateAttr(0)
+    _busy_since: float = PrivateAttr(0.0)
+
+    async def _request_with_retry(self, *args, **kwargs):
+        start = time.perf_counter()
+        if self._in_flight == 0:
+            self._busy_since = start
+        self._in_flight += 1
+        try:
+            return await super()._request_with_retry(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.in_flight_seconds += end - self._busy_since
+            self.requests += 1
+            self.request_seconds += end - start
+
+
+def time_writes(backend: StorageBackend) -> Dict[str, float]:
+    """Time the write methods of `backend`, which may run on a writer thread."""
+    seconds: Dict[str, float] = defaultdict(float)
+    lock = threading.Lock()
+
+    def timed(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with lock:
+                    seconds[method.__name__] += time.perf_counter() - start
+
+        return wrapper
+
+    for name in WRITE_METHODS:
+        setattr(backend, name, timed(getattr(backend, name)))
+    return seconds
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    """Start the fake server in its own process and wait until it listens."""
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.fake_openai_server",
+        "--novel",
+        "--port",
+        str(port),
+        "--latency",
+        str(args.latency),
+        "--tokens-per-second",
+        str(args.tokens_per_second),
+        "--chapter-chars",
+        str(args.chapter_chars),
+        "--error-rate",
+        str(args.error_rate),
+        "--error-status",
+        str(args.error_status),
+        "--malformed-rate",
+        str(args.malformed_rate),
+        "--seed",
+        "0",
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if "listening" not in line:
+        server.kill()
+        sys.exit(f"FAIL: the fake server did not start: {line.strip()}")
+    return server
+
+
+async def run_once(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    llm = TimedLLM(
+        LLMSettings(
+            model="fake-model",
+            base_url=base_url,
+            api_key="sk-fake",
+            retry_base_delay=0.05,
+            max_concurrent_requests=args.max_requests,
+            stream_sink="null",
+        )
+    )
+    with tempfile.TemporaryDirectory() as workspace:
+        novel_saver = NovelSaver(base_dir=workspace, storage_backend=args.storage)
+        write_seconds = time_writes(novel_saver.backend)
+        novel_genie = NovelGenie(
+            llm=llm,
+            novel_saver=novel_saver,
+            stream_sink=NullSink(),
+            generation_config=NovelGenerationConfig(
+                workspace=workspace,
+                volume_count=args.volumes,
+                chapter_count_per_volume=args.chapters,
+                need_optimize=args.optimize,
+                max_concurrency=args.concurrency,
+                outline_lookahead=args.lookahead,
+                parallel_volumes=args.parallel_volumes,
+            ),
+        )
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        try:
+            await novel_genie.generate_novel(user_input=USER_INPUT)
+            # Pending background checkpoint writes belong to the run
+            novel_saver.close()
+        finally:
+            await llm.close()
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+    return {
+        "wall_seconds": wall,
+        "llm_in_flight_seconds": llm.in_flight_seconds,
+        "llm_idle_seconds": wall - llm.in_flight_seconds,
+        "llm_request_seconds": llm.request_seconds,
+        "llm_requests": llm.requests,
+        "cpu_seconds": cpu,
+        "checkpoint_write_seconds": sum(write_seconds.values()),
+        "checkpoint_writes": dict(write_seconds),
+        "chapters": sum(len(volume.chapters) for volume in novel_genie.volumes),
+        "tokens": novel_genie.cost_tracker.total_tokens,
+        # Linux reports kilobytes
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def report(runs: List[Dict[str, Any]]) -> None:
+    def median(key: str) -> float:
+        return statistics.median(run[key] for run in runs)
+
+    wall = median("wall_seconds")
+    print(
+        f"{runs[0]['chapters']} chapters, {runs[0]['llm_requests']} LLM requests, "
+        f"median of {len(runs)} runs:"
+    )
+    print(f"  wall               {wall:8.2f}s")
+    for label, key in (
+        ("LLM in flight", "llm_in_flight_seconds"),
+        ("no LLM in flight", "llm_idle_seconds"),
+        ("CPU", "cpu_seconds"),
+        ("checkpoint writes", "checkpoint_write_seconds"),
+    ):
+        seconds = median(key)
+        print(f"  {label:<18} {seconds:8.2f}s  {seconds / wall:6.1%} of wall")
+    print(f"  summed LLM request {median('llm_request_seconds'):8.2f}s")
+    print(f"  peak RSS           {max(run['peak_rss_mb'] for run in runs):8.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--volumes", type=int, default=1)
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--chapter-chars", type=int, default=2000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--storage", choices=("file", "sqlite"), default="file")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-requests", type=int, default=16)
+    parser.add_argument("--lookahead", type=int, default=0)
+    parser.add_argument("--parallel-volumes", action="store_true")
+    parser.add_argument("--optimize", action="store_true")
+    parser.add_argument("--json", help="Also write the runs to this JSON file")
+    args = parser.parse_args()
+
+    define_log_level(print_level="WARNING", name="pipeline_benchmark")
+    port = free_port()
+    server = start_server(args, port)
+    try:
+        runs = [
+            asyncio.run(run_once(args, f"http://127.0.0.1:{port}/v1"))
+            for _ in range(args.runs)
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+
+    report(runs)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
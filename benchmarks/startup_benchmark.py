@@ -0,0 +1,118 @@
+"""Measure how long the CLI takes to import, and guard it.
+
+Every run imports ``novel_genie.app`` in a fresh interpreter with
+``python -X importtime`` and reports the wall time and the slowest modules.
+It also imports just the packages text generation cannot do without
+(openai, which brings aiohttp and requests, pydantic, PyYAML and loguru):
+their cost depends on the machine and is not ours to cut, so the guard
+applies to the time novel_genie adds on top of them. It fails if that
+exceeds the limit or if one of the screenshot mode packages (easyocr with
+torch, pyautogui, PIL, pynput) was imported, since text generation does not
+need them.
+
+    python -m benchmarks.startup_benchmark --runs 5 --max-seconds 0.5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+
+MODULE = "novel_genie.app"
+REQUIRED_PACKAGES = "openai, pydantic, yaml, loguru"
+HEAVY_PACKAGES = ("easyocr", "torch", "pyautogui", "PIL", "pynput")
+
+
+def import_once(module: str) -> Tuple[float, Dict[str, Tuple[int, int]], List[str]]:
+    """
+    Import `module` in a fresh interpreter.
+
+    Returns:
+        Tuple: Wall seconds, (self, cumulative) microseconds per imported
+            module, and the heavy packages that were imported.
+    """
+    check = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_PACKAGES!r} if m in sys.modules))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        sys.exit(f"FAIL: importing {module} failed:\n" + "\n".join(errors[-5:]))
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return wall, modules, result.stdout.split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=0.5,
+        help="Limit of the median import time on top of the required packages",
+    )
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # The first run warms the bytecode and file system caches
+    import_once(args.module)
+    walls, required_walls, imports_us = [], [], []
+    for _ in range(args.runs):
+        # Alternate the two imports so that both see the same machine load
+        required_walls.append(import_once(REQUIRED_PACKAGES)[0])
+        wall, modules, heavy = import_once(args.module)
+        walls.append(wall)
+        imports_us.append(modules[args.module][1])
+
+    median = statistics.median(walls)
+    required = statistics.median(required_walls)
+    added = median - required
+    print(
+        f"import {args.module}: median {median * 1000:.0f} ms wall "
+        f"({statistics.median(imports_us) / 1000:.0f} ms in imports) "
+        f"over {args.runs} runs"
+    )
+    print(
+        f"import {REQUIRED_PACKAGES}: median {required * 1000:.0f} ms wall, "
+        f"so {args.module} adds {added * 1000:.0f} ms"
+    )
+    print("slowest modules of the last run (self time, cumulative):")
+    slowest = sorted(modules.items(), key=lambda item: -item[1][0])[: args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {self_us / 1000:7.1f} ms  {cumulative_us / 1000:7.1f} ms  {name}")
+
+    failures = []
+    if heavy:
+        failures.append(f"screenshot mode packages imported: {', '.join(heavy)}")
+    if added > args.max_seconds:
+        failures.append(
+            f"{args.module} adds {added:.2f}s to its required packages, "
+            f"more than {args.max_seconds:.2f}s"
+        )
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Measure build, reload and query time of the story memory index.
+
+A synthetic novel is generated in which every chapter mentions a few of a
+large cast of characters, places and items, like a long web novel. The index
+is built chapter by chapter as the generator does (text chunks, summary and
+detailed outline per chapter), reloaded from disk, and queried with the
+detailed outline of a chapter, restricted to the chapters before it.
+
+    python -m benchmarks.story_memory_benchmark --chapters 500
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from novel_genie.story_memory import StoryMemory, chunk_text
+
+
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+GIVEN = "天云风雪青玄明月星辰寒霜剑心灵素清远子墨长歌无忌若水"
+PLACES = ["青云宗", "万妖谷", "落霞城", "天机阁", "血河渡", "九幽殿", "碧水湖", "苍梧山"]
+ITEMS = ["玄铁剑", "天机盘", "九转丹", "琉璃灯", "镇魂铃", "赤霄符", "星河图", "太虚镜"]
+FILLER = "夜色渐深，风声掠过屋檐，众人各怀心事，彼此间的沉默压得人喘不过气来。"
+
+
+def make_cast(rng: random.Random, size: int) -> List[str]:
+    names = set()
+    while len(names) < size:
+        names.add(rng.choice(SURNAMES) + rng.choice(GIVEN) + rng.choice(GIVEN))
+    return sorted(names)
+
+
+def make_chapter(
+    rng: random.Random, cast: List[str], chapter_num: int
+) -> Tuple[str, str, str]:
+    """Text, summary and detailed outline of one synthetic chapter."""
+    names = rng.sample(cast, 3)
+    place, item = rng.choice(PLACES), rng.choice(ITEMS)
+    events = [
+        f"{names[0]}在{place}遇见{names[1]}，两人为{item}起了争执。",
+        f"{names[2]}暗中跟随，发现{item}上刻着第{chapter_num}道封印。",
+        f"{names[1]}负伤退走，{names[0]}立誓要查清{place}的秘密。",
+    ]
+    paragraphs = []
+    for event in events:
+        paragraphs.extend(
+            [event, FILLER * 4, f"{names[rng.randrange(3)]}低声道：“此事没那么简单。”"]
+        )
+    text = "\n".join(paragraphs * 3)
+    summary = "".join(events)
+    outline = "\n".join(f"情节点{i + 1}：{event}" for i, event in enumerate(events))
+    return text, summary, outline
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=500)
+    parser.add_argument("--cast", type=int, default=200)
+    parser.add_argument("--passage-chars", type=int, default=400)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cast = make_cast(rng, args.cast)
+    chapters = [make_chapter(rng, cast, n) for n in range(1, args.chapters + 1)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "story_memory.jsonl"
+        memory = StoryMemory(path)
+        add_times = []
+        start = time.perf_counter()
+        for chapter_num, (text, summary, outline) in enumerate(chapters, 1):
+            chapter_start = time.perf_counter()
+            memory.add("detailed_outline", 1, chapter_num, [outline])
+            memory.add("chapter", 1, chapter_num, chunk_text(text, args.passage_chars))
+            memory.add("summary", 1, chapter_num, [summary])
+            add_times.append(time.perf_counter() - chapter_start)
+        build_seconds = time.perf_counter() - start
+        file_size = path.stat().st_size
+
+        start = time.perf_counter()
+        memory = StoryMemory(path)
+        load_seconds = time.perf_counter() - start
+
+        query_times = {"detailed_outline": [], "content": []}
+        relevant = returned = 0
+        for _ in range(args.queries):
+            chapter_num = rng.randrange(args.chapters // 2, args.chapters + 1)
+            outline = chapters[chapter_num - 1][2]
+            for stage, kinds in (
+                ("detailed_outline", ("detailed_outline",)),
+                ("content", ("chapter", "summary")),
+            ):
+                start = time.perf_counter()
+                passages = memory.query(
+                    outline, args.top_k, before_chapter=chapter_num - 3, kinds=kinds
+                )
+                query_times[stage].append(time.perf_counter() - start)
+            names = [name for name in cast if name in outline]
+            returned += len(passages)
+            relevant += sum(
+                any(name in passage.text for name in names) for passage in passages
+            )
+
+    print(
+        f"{args.chapters} chapters, {len(memory)} passages, "
+        f"index file {file_size / 1024 / 1024:.1f} MiB"
+    )
+    print(
+        f"build: {build_seconds * 1000:.0f} ms total, "
+        f"{statistics.mean(add_times) * 1000:.2f} ms per chapter "
+        f"(p95 {percentile(add_times, 0.95) * 1000:.2f} ms)"
+    )
+    print(f"reload from disk: {load_seconds * 1000:.0f} ms")
+    for stage, times in query_times.items():
+        print(
+            f"query ({stage} stage, top {args.top_k}): "
+            f"p50 {percentile(times, 0.5) * 1000:.2f} ms, "
+            f"p95 {percentile(times, 0.95) * 1000:.2f} ms"
+        )
+    print(
+        f"content passages mentioning a character of the queried chapter: "
+        f"{relevant}/{returned}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import importlib.util
 import os
 import platform
 import queue
@@ -7,23 +8,27 @@ import subprocess
 import sys
 import threading
 import time
-from typing import Optional
-
-import easyocr
-import pyautogui
-from PIL import ImageGrab
-from pynput import keyboard
-from pynput.keyboard import Key, KeyCode
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
 
 from novel_genie.config import NOVEL_GENIE_ROOT
 from novel_genie.generate_novel import NovelGenie
 from novel_genie.logger import logger
 
 
-# Define the shortcut combination: Ctrl + Shift + S
-SHORTCUT_COMBINATION = {Key.ctrl, Key.shift, KeyCode.from_char("s")}
+# Packages of the optional "screenshot" extra. They are imported on first
+# use: easyocr pulls in torch, and pyautogui and pynput need a display, so
+# text generation starts faster and also works on headless machines.
+SCREENSHOT_PACKAGES = ("easyocr", "pyautogui", "PIL", "pynput")
 SCREENSHOT_PATH = f"{NOVEL_GENIE_ROOT}/workspace/screenshot"
-os.makedirs(SCREENSHOT_PATH, exist_ok=True)
+OCR_LANGUAGES = ["ch_sim", "en"]  # Simplified Chinese and English
+
+# One easyocr reader per process: building it loads the detection and
+# recognition models, which takes far longer than reading a screenshot
+_ocr_reader: Optional[Any] = None
+_ocr_reader_lock = threading.Lock()
+# OCR runs off the event loop on a single thread, which owns the reader
+_ocr_executor: Optional[ThreadPoolExecutor] = None
 
 # Create a thread-safe queue for communication between threads
 shortcut_queue = queue.Queue()
@@ -39,13 +44,56 @@ async def generate_and_display_novel(
         )
     except Exception as e:
         logger.error(f"Failed to generate novel: {e}")
+    finally:
+        await novel_genie.llm.close()
+        novel_genie.novel_saver.close()
+
+
+def check_screenshot_dependencies() -> None:
+    """Fail early if screenshot mode cannot run."""
+    missing = [
+        name for name in SCREENSHOT_PACKAGES if importlib.util.find_spec(name) is None
+    ]
+    if missing:
+        raise RuntimeError(
+            f"Screenshot mode requires {', '.join(missing)}; "
+            'install them with `pip install "novel-genie[screenshot]"`'
+        )
+
+
+def get_ocr_reader() -> Any:
+    """The process-wide easyocr reader, created on first use."""
+    global _ocr_reader
+    with _ocr_reader_lock:
+        if _ocr_reader is None:
+            import easyocr
+
+            start = time.perf_counter()
+            _ocr_reader = easyocr.Reader(OCR_LANGUAGES)
+            logger.info(f"Loaded OCR models in {time.perf_counter() - start:.1f}s")
+        return _ocr_reader
+
+
+def get_ocr_executor() -> ThreadPoolExecutor:
+    global _ocr_executor
+    if _ocr_executor is None:
+        _ocr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+    return _ocr_executor
+
+
+def warm_up_ocr() -> None:
+    """Load the OCR models in the background, before the first screenshot."""
+
+    def log_failure(future) -> None:
+        if future.exception() is not None:
+            logger.error(f"OCR warm-up failed: {future.exception()}")
+
+    get_ocr_executor().submit(get_ocr_reader).add_done_callback(log_failure)
 
 
 def extract_text_from_image(image_path: str) -> Optional[str]:
     try:
-        reader = easyocr.Reader(
-            ["ch_sim", "en"]
-        )  # Supports Simplified Chinese and English
+        reader = get_ocr_reader()
         results = reader.readtext(image_path, detail=0, paragraph=True)
         extracted_text = "\n".join(results)
         logger.info(f"Extracted Text from Screenshot:\n{extracted_text}")
@@ -55,6 +103,14 @@ def extract_text_from_image(image_path: str) -> Optional[str]:
         return None
 
 
+async def extract_text_from_image_async(image_path: str) -> Optional[str]:
+    """Run OCR on the OCR thread, keeping the event loop responsive."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_ocr_executor(), extract_text_from_image, image_path
+    )
+
+
 def take_screenshot_mac(screenshot_path: str) -> Optional[str]:
     """
     Use macOS's screencapture tool for region-based screenshots
@@ -75,6 +131,9 @@ def take_screenshot_windows(screenshot_path: str) -> Optional[str]:
     Use Windows' built-in screenshot tool for region-based screenshots
     """
     try:
+        import pyautogui
+        from PIL import ImageGrab
+
         logger.info("Launching Windows region screenshot tool...")
         # Simulate pressing Win + Shift + S
         pyautogui.hotkey("win", "shift", "s")
@@ -114,11 +173,16 @@ def keyboard_listener_thread(shortcut_queue: queue.Queue):
     Run the keyboard listener in a separate thread.
     When the shortcut is detected, put a task in the queue.
     """
+    from pynput import keyboard
+    from pynput.keyboard import Key, KeyCode
+
+    # Define the shortcut combination: Ctrl + Shift + S
+    shortcut_combination = {Key.ctrl, Key.shift, KeyCode.from_char("s")}
     current_keys = set()
 
     def on_press(key):
         current_keys.add(key)
-        if all(k in current_keys for k in SHORTCUT_COMBINATION):
+        if all(k in current_keys for k in shortcut_combination):
             logger.info("Screenshot shortcut detected, enqueueing screenshot task.")
             shortcut_queue.put_nowait("screenshot")
 
@@ -140,13 +204,13 @@ async def handle_shortcut_queue(shortcut_queue: queue.Queue):
             task = await asyncio.to_thread(shortcut_queue.get)
             if task == "screenshot":
                 logger.info("Processing screenshot task...")
-                # Execute screenshot
-                screenshot_path = take_screenshot()
+                # Execute screenshot, which waits for the user
+                screenshot_path = await asyncio.to_thread(take_screenshot)
                 if not screenshot_path:
                     logger.error("Screenshot failed, skipping task.")
                     continue
                 # Perform OCR
-                extracted_text = extract_text_from_image(screenshot_path)
+                extracted_text = await extract_text_from_image_async(screenshot_path)
                 if not extracted_text:
                     logger.error(
                         "Failed to extract text from screenshot, skipping task."
@@ -172,12 +236,45 @@ def parse_arguments():
         action="store_true",
         help="Enable screenshot shortcut to generate a novel",
     )
+    parser.add_argument(
+        "--ocr-warmup",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Load the OCR models when screenshot mode starts instead of on "
+        "the first screenshot",
+    )
     group.add_argument(
         "-r",
         "--resume_novel_id",
-        action="store_true",
+        type=str,
+        metavar="NOVEL_ID",
         help="Resume the novel generation from the last checkpoint",
     )
+    group.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        metavar="PATH",
+        help="Generate a novel per prompt of a JSON lines file or a directory "
+        "of .txt files; run again to resume an interrupted batch",
+    )
+    group.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run an HTTP service accepting novel generation jobs",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Novels generated concurrently in batch and service mode",
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address the service listens on"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="Port the service listens on"
+    )
     return parser.parse_args()
 
 
@@ -189,7 +286,19 @@ async def run_main():
     elif args.input:
         user_input = args.input
         await generate_and_display_novel(user_input)
+    elif args.batch:
+        from novel_genie.batch import BatchRunner
+
+        await BatchRunner(args.batch, workers=args.workers).run()
+    elif args.serve:
+        # aiohttp.web is only needed by the service
+        from novel_genie.server import serve
+
+        await serve(args.host, args.port, workers=args.workers)
     elif args.screenshot:
+        check_screenshot_dependencies()
+        if args.ocr_warmup:
+            warm_up_ocr()
         logger.info("Screenshot mode enabled. Press Ctrl+Shift+S to generate a novel.")
         # Start the keyboard listener thread
         listener_thread = threading.Thread(
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from novel_genie.config import config
+from novel_genie.exceptions import BudgetExceededError
+from novel_genie.generate_novel import NovelGenie
+from novel_genie.llm import LLM
+from novel_genie.logger import logger
+from novel_genie.stream_sink import FileSink, NullSink, StreamSink
+
+
+JOB_STATUSES = ("pending", "running", "done", "stopped", "failed")
+
+
+def _job_id(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+class BatchJob(BaseModel):
+    """One novel of a batch and how far it got."""
+
+    job_id: str
+    user_input: str
+    status: str = "pending"
+    novel_id: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+
+def load_jobs(source: str) -> List[BatchJob]:
+    """
+    Read the prompts of a batch.
+
+    `source` is either a JSON lines file with one object per line, holding
+    the prompt under "input" (or "prompt") and optionally an "id", or a
+    directory of .txt files with one prompt each, named after their job.
+
+    Raises:
+        ValueError: If a prompt is missing or two jobs share an id.
+    """
+    path = Path(source)
+    jobs = []
+    if path.is_dir():
+        for file in sorted(path.glob("*.txt")):
+            user_input = file.read_text(encoding="utf-8").strip()
+            if user_input:
+                jobs.append(BatchJob(job_id=_job_id(file.stem), user_input=user_input))
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                user_input = entry.get("input") or entry.get("prompt")
+                if not user_input:
+                    raise ValueError(f"{path}:{line_num} has no input")
+                job_id = _job_id(str(entry.get("id") or f"{path.stem}_{line_num}"))
+                jobs.append(BatchJob(job_id=job_id, user_input=user_input))
+
+    job_ids = Counter(job.job_id for job in jobs)
+    duplicates = [job_id for job_id, count in job_ids.items() if count > 1]
+    if duplicates:
+        raise ValueError(f"Duplicate batch job ids: {', '.join(duplicates)}")
+    return jobs
+
+
+class BatchStatus:
+    """
+    Per-job status of a batch, kept as a JSON file in the workspace so an
+    interrupted batch can be restarted where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.jobs: Dict[str, BatchJob] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for job in json.load(f)["jobs"]:
+                    self.jobs[job["job_id"]] = BatchJob(**job)
+
+    def merge(self, jobs: List[BatchJob]) -> List[BatchJob]:
+        """Jobs of the batch, with the state recorded by earlier runs."""
+        merged = []
+        for job in jobs:
+            known = self.jobs.get(job.job_id)
+            if known is not None and known.user_input == job.user_input:
+                job = known
+            self.jobs[job.job_id] = job
+            merged.append(job)
+        self.save()
+        return merged
+
+    def update(self, job: BatchJob, **changes) -> None:
+        for name, value in changes.items():
+            setattr(job, name, value)
+        self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"jobs": [job.model_dump() for job in self.jobs.values()]},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        tmp_path.replace(self.path)
+
+    def counts(self) -> Dict[str, int]:
+        counts = Counter(job.status for job in self.jobs.values())
+        return {status: counts[status] for status in JOB_STATUSES if counts[status]}
+
+
+class JobRunner:
+    """
+    Runs novel generation jobs on one shared LLM client, recording their
+    progress in a `BatchStatus`.
+
+    All jobs share the client's connection pool, rate limits and response
+    cache. A job that already has a checkpoint is resumed instead of
+    started over.
+
+    Args:
+        status (BatchStatus): Where job progress is recorded
+        llm (Optional[LLM]): Client shared by the jobs
+    """
+
+    def __init__(self, status: BatchStatus, llm: Optional[LLM] = None):
+        self.status = status
+        self.llm = llm or LLM()
+
+    def _sink(self, job: BatchJob) -> StreamSink:
+        # Every novel uses the same stream ids, such as content_1_3, and
+        # concurrent novels would interleave on the console, so replies are
+        # only kept with the file sink, in a directory per job
+        if self.llm.stream_sink == "file":
+            return FileSink(str(Path(self.llm.stream_dir) / job.job_id))
+        return NullSink()
+
+    def _update(self, job: BatchJob, **changes) -> None:
+        self.status.update(job, **changes)
+
+    async def run_job(self, job: BatchJob) -> None:
+        """Generate, or resume, the novel of `job`. Failures are recorded."""
+        novel_genie = NovelGenie(
+            llm=self.llm,
+            stream_sink=self._sink(job),
+            on_novel_id=lambda novel_id: self._update(job, novel_id=novel_id),
+        )
+        resume_novel_id = None
+        if job.novel_id and novel_genie.novel_saver.load_checkpoint(job.novel_id):
+            resume_novel_id = job.novel_id
+        logger.info(
+            f"Job {job.job_id}: "
+            + (f"resuming novel {resume_novel_id}" if resume_novel_id else "starting")
+        )
+        self._update(
+            job,
+            status="running",
+            attempts=job.attempts + 1,
+            error=None,
+            started_at=datetime.now().isoformat(timespec="seconds"),
+            finished_at=None,
+        )
+        status, error = "failed", None
+        try:
+            await novel_genie.generate_novel(
+                user_input=job.user_input, resume_novel_id=resume_novel_id
+            )
+            status = "done"
+        except BudgetExceededError as e:
+            status, error = "stopped", str(e)
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            error = str(e)
+        finally:
+            novel_genie.novel_saver.close()
+        self._update(
+            job,
+            status=status,
+            error=error,
+            finished_at=datetime.now().isoformat(timespec="seconds"),
+        )
+
+
+class BatchRunner(JobRunner):
+    """
+    Generates the novels of a batch with a pool of concurrent workers.
+
+    Finished jobs are skipped when a batch is run again, and the others are
+    resumed from their checkpoints.
+
+    Args:
+        source (str): JSON lines file or directory of prompts, see `load_jobs`
+        workers (Optional[int]): Novels generated at once
+        status_path (Optional[str]): Status file, by default named after the
+            source in the `batch` directory of the workspace
+        llm (Optional[LLM]): Client shared by the workers
+    """
+
+    def __init__(
+        self,
+        source: str,
+        workers: Optional[int] = None,
+        status_path: Optional[str] = None,
+        llm: Optional[LLM] = None,
+    ):
+        super().__init__(
+            BatchStatus(
+                status_path
+                or Path(config.novel.workspace) / "batch" / f"{Path(source).stem}.json"
+            ),
+            llm,
+        )
+        self.source = source
+        self.workers = workers or config.novel.batch_workers
+
+    async def run(self) -> Dict[str, int]:
+        """
+        Run every unfinished job of the batch.
+
+        Returns:
+            Dict[str, int]: Number of jobs per status.
+        """
+        jobs = self.status.merge(load_jobs(self.source))
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            if job.status != "done":
+                queue.put_nowait(job)
+        logger.info(
+            f"Batch {self.source}: {queue.qsize()} of {len(jobs)} jobs to run "
+            f"with {self.workers} workers"
+        )
+
+        async def worker() -> None:
+            while not queue.empty():
+                await self.run_job(queue.get_nowait())
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.workers)))
+        finally:
+            await self.llm.close()
+        counts = self.status.counts()
+        logger.info(f"Batch {self.source} finished: {counts}")
+        return counts
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from novel_genie.config import config
+from novel_genie.cost import Cost
+from novel_genie.exceptions import BudgetExceededError
+
+
+# Stages that run once per chapter, used to project the cost of the rest of a run
+CHAPTER_STAGES = (
+    "chapter_outline",
+    "detailed_outline",
+    "content",
+    "optimize",
+    "chapter_summary",
+)
+
+
+class Budget(BaseModel):
+    """
+    Hard token and cost limits for a generation run.
+
+    Before a stage starts, the spend so far plus the projected spend of every
+    stage already running and of the new stage must stay within the limits.
+    Stage projections are the observed average per call of that stage, or
+    of all calls while the stage has not run yet. Limits of 0 are unlimited.
+    """
+
+    max_tokens: int = Field(default_factory=lambda: config.novel.max_budget_tokens)
+    max_cost: float = Field(default_factory=lambda: config.novel.max_budget_cost)
+
+    _in_flight_tokens: float = PrivateAttr(0.0)
+    _in_flight_cost: float = PrivateAttr(0.0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens > 0 or self.max_cost > 0
+
+    @staticmethod
+    def projected_stage_usage(cost: Cost, stage: str) -> Tuple[float, float]:
+        """Expected (tokens, cost) of one more call of `stage`."""
+        usage = cost.stages.get(stage)
+        if usage is not None and usage.calls > usage.cached_calls:
+            calls = usage.calls - usage.cached_calls
+            tokens = usage.prompt_tokens + usage.completion_tokens
+            return tokens / calls, usage.cost / calls
+        if cost.calls:
+            return cost.total_tokens / cost.calls, cost.accumulated_cost / cost.calls
+        return 0.0, 0.0
+
+    def check(self, cost: Cost, stage: str) -> Tuple[float, float]:
+        """
+        Projected (tokens, cost) of `stage` if it fits in the budget.
+
+        Raises:
+            BudgetExceededError: If starting the stage could exceed a limit.
+        """
+        tokens, stage_cost = self.projected_stage_usage(cost, stage)
+        if self.max_tokens > 0:
+            projected = cost.total_tokens + self._in_flight_tokens + tokens
+            if projected > self.max_tokens:
+                raise BudgetExceededError(
+                    stage, "tokens", cost.total_tokens, projected, self.max_tokens
+                )
+        if self.max_cost > 0:
+            projected = cost.accumulated_cost + self._in_flight_cost + stage_cost
+            if projected > self.max_cost:
+                raise BudgetExceededError(
+                    stage, "cost", cost.accumulated_cost, projected, self.max_cost
+                )
+        return tokens, stage_cost
+
+    @contextmanager
+    def admit(self, cost: Cost, stage: str) -> Iterator[None]:
+        """Check `stage` against the budget and reserve its projection while it runs."""
+        if not self.enabled:
+            yield
+            return
+        tokens, stage_cost = self.check(cost, stage)
+        self._in_flight_tokens += tokens
+        self._in_flight_cost += stage_cost
+        try:
+            yield
+        finally:
+            self._in_flight_tokens -= tokens
+            self._in_flight_cost -= stage_cost
+
+    def report(
+        self,
+        cost: Cost,
+        chapters_done: int,
+        chapters_total: int,
+        stop_reason: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Where the budget went and what the whole run is projected to cost."""
+        per_chapter_tokens = per_chapter_cost = 0.0
+        for stage in CHAPTER_STAGES:
+            if stage in cost.stages:
+                tokens, stage_cost = self.projected_stage_usage(cost, stage)
+                per_chapter_tokens += tokens
+                per_chapter_cost += stage_cost
+        remaining = max(chapters_total - chapters_done, 0)
+        return {
+            "stop_reason": stop_reason,
+            "max_tokens": self.max_tokens,
+            "max_cost": self.max_cost,
+            "spent_tokens": cost.total_tokens,
+            "spent_cost": cost.accumulated_cost,
+            "chapters_done": chapters_done,
+            "chapters_total": chapters_total,
+            "per_chapter_tokens": per_chapter_tokens,
+            "per_chapter_cost": per_chapter_cost,
+            "projected_total_tokens": cost.total_tokens
+            + remaining * per_chapter_tokens,
+            "projected_total_cost": cost.accumulated_cost
+            + remaining * per_chapter_cost,
+            "stages": {
+                stage: usage.model_dump() for stage, usage in cost.stages.items()
+            },
+        }
+
+
+def within_budget(stage: str) -> Callable:
+    """
+    Decorator admitting a generator stage through the generator's `budget`
+    before it runs, based on the spend recorded in its `cost_tracker`.
+
+    Args:
+        stage (str): Stage name as recorded by `track_stage`
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable]:
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with self.budget.admit(self.cost_tracker, stage):
+                return await func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,8 +1,9 @@
 import os
 import threading
+from typing import Optional
 
 import yaml
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 
 def get_project_root() -> str:
@@ -21,6 +22,44 @@ class LLMSettings(BaseModel):
     api_key: str = Field(..., description="API密钥")
     max_tokens: int = Field(4096, description="每个请求的最大token数")
     temperature: float = Field(1.0, description="采样温度")
+    max_connections: int = Field(100, description="连接池最大连接数")
+    keepalive_timeout: float = Field(60.0, description="空闲连接保活时间(秒)")
+    requests_per_minute: int = Field(0, ge=0, description="每分钟最大请求数，0 表示不限制")
+    tokens_per_minute: int = Field(0, ge=0, description="每分钟最大token数，0 表示不限制")
+    max_concurrent_requests: int = Field(16, ge=0, description="同时进行的最大请求数，0 表示不限制")
+    max_retries: int = Field(5, ge=0, description="限流或临时错误的最大重试次数")
+    retry_base_delay: float = Field(1.0, ge=0, description="指数退避的初始等待时间(秒)")
+    retry_max_delay: float = Field(60.0, ge=0, description="指数退避的最大等待时间(秒)")
+    response_cache: str = Field("off", description="响应缓存模式: off、on 或 replay(只读回放)")
+    response_cache_path: str = Field("workspace/llm_cache.db", description="响应缓存数据库路径")
+    response_cache_max_mb: int = Field(512, ge=1, description="响应缓存最大容量(MB)")
+    prompt_price: Optional[float] = Field(
+        None, ge=0, description="每百万输入token价格(美元)，为空时查内置价格表"
+    )
+    completion_price: Optional[float] = Field(
+        None, ge=0, description="每百万输出token价格(美元)，为空时查内置价格表"
+    )
+    stream_sink: str = Field(
+        "console", description="流式输出目标: null、console(按行输出并标注来源) 或 file(每个流一个文件)"
+    )
+    stream_dir: str = Field("workspace/streams", description="file 流式输出目标的目录")
+    stream_batch_chars: int = Field(256, ge=1, description="流式输出累积多少字符后写出一次")
+    stream_flush_interval: float = Field(0.2, ge=0, description="流式输出的最长写出间隔(秒)")
+    max_format_retries: int = Field(2, ge=0, description="回复格式不符合要求时附加纠正提示后的最大重试次数")
+    hedge_candidates: int = Field(1, ge=1, description="意图分析和粗纲等关键阶段最多发起的候选请求数，1 表示不对冲")
+    hedge_delay: float = Field(
+        0.0, ge=0, description="延迟数据不足时发起下一个候选请求前等待的秒数，0 表示同时发起全部候选请求"
+    )
+    hedge_percentile: float = Field(
+        0.9, gt=0, le=1, description="候选请求等待超过该阶段历史延迟的此分位数时发起下一个候选请求"
+    )
+
+    @field_validator("response_cache", mode="before")
+    def validate_response_cache(cls, value):
+        """YAML 会把未加引号的 off/on 解析为布尔值"""
+        if isinstance(value, bool):
+            return "on" if value else "off"
+        return value
 
 
 class NovelSettings(BaseModel):
@@ -31,6 +70,33 @@ class NovelSettings(BaseModel):
     section_word_count: int = Field(2000, description="每节字数")
     sliding_window_size: int = Field(5, description="滑动窗口大小")
     need_optimize: bool = Field(False, description="是否需要优化章节内容")
+    outline_lookahead: int = Field(0, ge=0, description="章纲与细纲预生成的前瞻章节数")
+    max_concurrency: int = Field(4, ge=1, description="生成任务的最大并发数")
+    parallel_volumes: bool = Field(False, description="是否并行生成各卷")
+    max_parallel_volumes: int = Field(2, ge=1, description="并行生成的最大卷数")
+    checkpoint_compact_interval: int = Field(50, ge=1, description="检查点日志合并为快照的记录间隔")
+    storage_backend: str = Field("file", description="存储后端: file 或 sqlite")
+    checkpoint_queue_size: int = Field(64, ge=0, description="后台检查点写入队列长度，0 表示同步写入")
+    use_chapter_summaries: bool = Field(
+        True, description="是否为每章生成摘要，并在后续章节提示词中以摘要代替较早章节的正文"
+    )
+    chapter_summary_word_count: int = Field(300, ge=50, description="章节摘要的最大字数")
+    story_memory_top_k: int = Field(
+        4, ge=0, description="细纲和正文生成时从较早章节检索的相关片段数，0 表示关闭长程记忆"
+    )
+    story_memory_passage_chars: int = Field(400, ge=50, description="长程记忆索引中每个片段的最大字数")
+    format_check_chars: int = Field(
+        1500, ge=0, description="流式回复在前多少个字符内未出现章节标题或大纲标签即提前中止，0 表示只在回复结束时检查"
+    )
+    max_prompt_tokens: int = Field(
+        32000, ge=0, description="单次请求的最大输入token数，超出时裁剪滑动窗口内容，0 表示不限制"
+    )
+    max_budget_tokens: int = Field(0, ge=0, description="单次生成的最大token预算，0 表示不限制")
+    max_budget_cost: float = Field(0.0, ge=0, description="单次生成的最大费用预算(美元)，0 表示不限制")
+    batch_workers: int = Field(2, ge=1, description="批量模式和服务模式下同时生成的小说数")
+    trace_format: str = Field(
+        "off", description="各阶段耗时追踪的导出格式: off、chrome 或 otlp，写入小说目录的 traces 下"
+    )
     workspace: str = Field("workspace", description="工作目录")
 
 
@@ -91,6 +157,59 @@ class Config:
                 "api_key": raw_config.get("llm", {}).get("api_key"),
                 "max_tokens": raw_config.get("llm", {}).get("max_tokens", 4096),
                 "temperature": raw_config.get("llm", {}).get("temperature", 1.0),
+                "max_connections": raw_config.get("llm", {}).get(
+                    "max_connections", 100
+                ),
+                "keepalive_timeout": raw_config.get("llm", {}).get(
+                    "keepalive_timeout", 60.0
+                ),
+                "requests_per_minute": raw_config.get("llm", {}).get(
+                    "requests_per_minute", 0
+                ),
+                "tokens_per_minute": raw_config.get("llm", {}).get(
+                    "tokens_per_minute", 0
+                ),
+                "max_concurrent_requests": raw_config.get("llm", {}).get(
+                    "max_concurrent_requests", 16
+                ),
+                "max_retries": raw_config.get("llm", {}).get("max_retries", 5),
+                "retry_base_delay": raw_config.get("llm", {}).get(
+                    "retry_base_delay", 1.0
+                ),
+                "retry_max_delay": raw_config.get("llm", {}).get(
+                    "retry_max_delay", 60.0
+                ),
+                "response_cache": raw_config.get("llm", {}).get(
+                    "response_cache", "off"
+                ),
+                "response_cache_path": raw_config.get("llm", {}).get(
+                    "response_cache_path", "workspace/llm_cache.db"
+                ),
+                "response_cache_max_mb": raw_config.get("llm", {}).get(
+                    "response_cache_max_mb", 512
+                ),
+                "prompt_price": raw_config.get("llm", {}).get("prompt_price"),
+                "completion_price": raw_config.get("llm", {}).get("completion_price"),
+                "stream_sink": raw_config.get("llm", {}).get("stream_sink", "console"),
+                "stream_dir": raw_config.get("llm", {}).get(
+                    "stream_dir", "workspace/streams"
+                ),
+                "stream_batch_chars": raw_config.get("llm", {}).get(
+                    "stream_batch_chars", 256
+                ),
+                "stream_flush_interval": raw_config.get("llm", {}).get(
+                    "stream_flush_interval", 0.2
+                ),
+                "max_format_retries": raw_config.get("llm", {}).get(
+                    "max_format_retries", 2
+                ),
+                "hedge_candidates": raw_config.get("llm", {}).get(
+                    "hedge_candidates", 1
+                ),
+                "hedge_delay": raw_config.get("llm", {}).get("hedge_delay", 0.0),
+                "hedge_percentile": raw_config.get("llm", {}).get(
+                    "hedge_percentile", 0.9
+                ),
             },
             "novel": {
                 "volume_count": raw_config.get("novel", {}).get("volume_count", 1),
@@ -106,6 +225,53 @@ class Config:
                 "need_optimize": raw_config.get("novel", {}).get(
                     "need_optimize", False
                 ),
+                "outline_lookahead": raw_config.get("novel", {}).get(
+                    "outline_lookahead", 0
+                ),
+                "max_concurrency": raw_config.get("novel", {}).get(
+                    "max_concurrency", 4
+                ),
+                "parallel_volumes": raw_config.get("novel", {}).get(
+                    "parallel_volumes", False
+                ),
+                "max_parallel_volumes": raw_config.get("novel", {}).get(
+                    "max_parallel_volumes", 2
+                ),
+                "checkpoint_compact_interval": raw_config.get("novel", {}).get(
+                    "checkpoint_compact_interval", 50
+                ),
+                "storage_backend": raw_config.get("novel", {}).get(
+                    "storage_backend", "file"
+                ),
+                "checkpoint_queue_size": raw_config.get("novel", {}).get(
+                    "checkpoint_queue_size", 64
+                ),
+                "use_chapter_summaries": raw_config.get("novel", {}).get(
+                    "use_chapter_summaries", True
+                ),
+                "chapter_summary_word_count": raw_config.get("novel", {}).get(
+                    "chapter_summary_word_count", 300
+                ),
+                "story_memory_top_k": raw_config.get("novel", {}).get(
+                    "story_memory_top_k", 4
+                ),
+                "story_memory_passage_chars": raw_config.get("novel", {}).get(
+                    "story_memory_passage_chars", 400
+                ),
+                "format_check_chars": raw_config.get("novel", {}).get(
+                    "format_check_chars", 1500
+                ),
+                "max_prompt_tokens": raw_config.get("novel", {}).get(
+                    "max_prompt_tokens", 32000
+                ),
+                "max_budget_tokens": raw_config.get("novel", {}).get(
+                    "max_budget_tokens", 0
+                ),
+                "max_budget_cost": raw_config.get("novel", {}).get(
+                    "max_budget_cost", 0.0
+                ),
+                "batch_workers": raw_config.get("novel", {}).get("batch_workers", 2),
+                "trace_format": raw_config.get("novel", {}).get("trace_format", "off"),
                 "workspace": raw_config.get("novel", {}).get("workspace", "workspace"),
             },
         }
@@ -141,6 +307,31 @@ class NovelGenerationConfig(BaseModel):
         default_factory=lambda: config.novel.sliding_window_size
     )
     need_optimize: bool = Field(default_factory=lambda: config.novel.need_optimize)
+    outline_lookahead: int = Field(
+        default_factory=lambda: config.novel.outline_lookahead
+    )
+    max_concurrency: int = Field(default_factory=lambda: config.novel.max_concurrency)
+    parallel_volumes: bool = Field(
+        default_factory=lambda: config.novel.parallel_volumes
+    )
+    max_parallel_volumes: int = Field(
+        default_factory=lambda: config.novel.max_parallel_volumes
+    )
+    use_chapter_summaries: bool = Field(
+        default_factory=lambda: config.novel.use_chapter_summaries
+    )
+    chapter_summary_word_count: int = Field(
+        default_factory=lambda: config.novel.chapter_summary_word_count
+    )
+    story_memory_top_k: int = Field(
+        default_factory=lambda: config.novel.story_memory_top_k
+    )
+    story_memory_passage_chars: int = Field(
+        default_factory=lambda: config.novel.story_memory_passage_chars
+    )
+    format_check_chars: int = Field(
+        default_factory=lambda: config.novel.format_check_chars
+    )
     workspace: str = Field(default_factory=lambda: config.novel.workspace)
 
 
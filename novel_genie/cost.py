@@ -1,11 +1,103 @@
-from typing import Any, Dict, List
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
+
+from novel_genie.logger import logger
+from novel_genie.rate_limiter import estimate_tokens
+
+
+try:
+    import tiktoken
+except ImportError:  # Optional: pip install novel-genie[tokenizer]
+    tiktoken = None
+
+
+# USD per million (prompt, completion) tokens. Looked up by exact model name,
+# then by the longest matching prefix, e.g. "gpt-4o-mini-2024-07-18".
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (3.00, 12.00),
+    "o1": (15.00, 60.00),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+    "qwen-plus": (0.40, 1.20),
+    "qwen-max": (1.60, 6.40),
+}
+
+
+@lru_cache(maxsize=None)
+def model_price(model: str) -> Tuple[float, float]:
+    """Prompt and completion price per million tokens for `model`."""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    prefixes = [name for name in MODEL_PRICES if model.startswith(name)]
+    if prefixes:
+        return MODEL_PRICES[max(prefixes, key=len)]
+    logger.warning(f"No price known for model {model}, costs will be reported as 0")
+    return 0.0, 0.0
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    """
+    The tiktoken encoding of `model`, or None if it cannot be loaded.
+
+    Encodings are downloaded on first use, so a failure, e.g. on an offline
+    machine, is remembered rather than retried on every count.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable for {model}, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Token count of `text`, using tiktoken when it is installed."""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        encoding = _encoding_for(model)
+        if encoding is not None:
+            try:
+                return len(encoding.encode(text))
+            except Exception as e:
+                logger.debug(f"tiktoken failed to encode for {model}: {e}")
+    return estimate_tokens(text)
+
+
+class StageUsage(BaseModel):
+    """Running token and cost totals of one generation stage."""
+
+    calls: int = 0
+    cached_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
 
 
 class Cost(BaseModel):
+    """
+    Token and cost accounting for a novel run.
+
+    Only running aggregates are kept, in total and per stage, so the size of
+    the tracker does not grow with the number of calls.
+    """
+
     accumulated_cost: float = 0.0
-    costs: List[float] = []
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    stages: Dict[str, StageUsage] = Field(default_factory=dict)
 
     @field_validator("accumulated_cost")
     def validate_accumulated_cost(cls, value: float) -> float:
@@ -13,15 +105,88 @@ class Cost(BaseModel):
             raise ValueError("Total cost cannot be negative.")
         return value
 
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
     def add_cost(self, value: float) -> None:
         if value < 0:
             raise ValueError("Added cost cannot be negative.")
         self.accumulated_cost += value
-        self.costs.append(value)
+
+    def add_usage(
+        self,
+        stage: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        cached: bool = False,
+    ) -> None:
+        """Record one LLM call of `stage`. Cached calls cost nothing."""
+        usage = self.stages.setdefault(stage, StageUsage())
+        usage.calls += 1
+        if cached:
+            usage.cached_calls += 1
+            return
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        usage.cost += cost
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.add_cost(cost)
 
     def get(self) -> Dict[str, Any]:
-        return {"accumulated_cost": self.accumulated_cost, "costs": self.costs}
+        return self.model_dump()
+
+    @classmethod
+    def from_info(cls, cost_info: Optional[Dict[str, Any]]) -> "Cost":
+        """Restore a tracker from saved `cost_info`, ignoring legacy fields."""
+        return cls.model_validate(cost_info or {})
 
     def log(self) -> str:
-        cost = self.get()
-        return "\n".join(f"{key}: {value}" for key, value in cost.items())
+        lines = [
+            f"accumulated_cost: {self.accumulated_cost:.4f}",
+            f"tokens: {self.prompt_tokens} prompt + "
+            f"{self.completion_tokens} completion in {self.calls} calls",
+        ]
+        for stage, usage in self.stages.items():
+            lines.append(
+                f"{stage}: {usage.prompt_tokens} + {usage.completion_tokens} tokens, "
+                f"{usage.calls} calls ({usage.cached_calls} cached), "
+                f"cost {usage.cost:.4f}"
+            )
+        return "\n".join(lines)
+
+
+class UsageScope(NamedTuple):
+    tracker: Cost
+    stage: str
+
+
+# The tracker and stage LLM calls are attributed to. Context variables are
+# copied into every asyncio task, so concurrent stages do not interfere.
+usage_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+
+
+def track_stage(stage: str) -> Callable:
+    """
+    Decorator attributing the LLM calls of a generator method to `stage` in
+    the generator's `cost_tracker`.
+
+    Args:
+        stage (str): Stage name used as the aggregation key
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable]:
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            token = usage_scope.set(UsageScope(self.cost_tracker, stage))
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                usage_scope.reset(token)
+
+        return wrapper
+
+    return decorator
@@ -32,3 +32,39 @@ class NovelSaveError(NovelGenerationBaseError):
         self.novel_id = novel_id
         self.operation = operation
         super().__init__(f"Failed to {operation} novel {novel_id}")
+
+
+class LLMCacheMissError(NovelGenerationBaseError):
+    """Exception raised when a replayed LLM request is not in the response cache."""
+
+    def __init__(self, cache_key: str):
+        self.cache_key = cache_key
+        super().__init__(f"No cached LLM response for request {cache_key}")
+
+
+class BudgetExceededError(NovelGenerationBaseError):
+    """Exception raised when starting a stage could exceed the run budget."""
+
+    def __init__(
+        self, stage: str, limit_type: str, spent: float, projected: float, limit: float
+    ):
+        self.stage = stage
+        self.limit_type = limit_type
+        self.spent = spent
+        self.projected = projected
+        self.limit = limit
+        self.report: Optional[dict] = None
+        super().__init__(
+            f"Budget exhausted before {stage}: {limit_type} spent {spent:g}, "
+            f"projected {projected:g} > limit {limit:g}"
+        )
+
+
+class MalformedResponseError(NovelGenerationBaseError):
+    """Exception raised when an LLM reply does not have the format its stage needs."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        # The reply received until the request was aborted
+        self.partial = ""
+        super().__init__(f"Malformed LLM response: {reason}")
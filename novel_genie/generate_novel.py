@@ -1,16 +1,24 @@
-import re
+import asyncio
+import time
+import uuid
 from datetime import datetime
-from typing import List, Optional
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 from pydantic import BaseModel, Field
 
+from novel_genie.budget import Budget, within_budget
 from novel_genie.config import NovelGenerationConfig
-from novel_genie.cost import Cost
+from novel_genie.cost import Cost, count_tokens, track_stage
+from novel_genie.exceptions import BudgetExceededError
 from novel_genie.llm import LLM
 from novel_genie.logger import logger
+from novel_genie.prompt_budget import PromptBudgeter, PromptSection
 from novel_genie.prompts.chapter_outline_generator_prompt import (
     CHAPTER_OUTLINE_GENERATOR_PROMPT,
 )
+from novel_genie.prompts.chapter_summary_prompt import CHAPTER_SUMMARY_PROMPT
 from novel_genie.prompts.content_generator_prompt import CONTENT_GENERATOR_PROMPT_V2
 from novel_genie.prompts.content_optimizer_prompt import CONTENT_OPTIMIZER_PROMPT
 from novel_genie.prompts.detail_outline_generator_prompt import (
@@ -19,6 +27,8 @@ from novel_genie.prompts.detail_outline_generator_prompt import (
 )
 from novel_genie.prompts.intent_analyzer_prompt import INTENT_ANALYZER_PROMPT
 from novel_genie.prompts.rough_outline_prompt import ROUGH_OUTLINE_GENERATOR_PROMPT_V2
+from novel_genie.prompts.system_prompt import SYSTEM_PROMPT
+from novel_genie.scheduler import TaskGraph
 from novel_genie.schema import (
     Chapter,
     ChapterOutline,
@@ -31,7 +41,13 @@ from novel_genie.schema import (
     OutlineType,
     RoughOutline,
 )
+from novel_genie.story_memory import StoryMemory, chunk_text
+from novel_genie.stream_parser import StreamParser
+from novel_genie.stream_sink import StreamSink
+from novel_genie.stream_validator import ChapterValidator, OutlineValidator
+from novel_genie.tracing import Tracer, trace_span, traced
 from novel_genie.utils import (
+    CHAPTER_TITLE_PATTERN,
     T,
     extract_commands_from_response,
     extract_outline,
@@ -46,6 +62,9 @@ class NovelGenie(BaseModel):
 
     llm: LLM = Field(default_factory=LLM)
     cost_tracker: Cost = Field(default_factory=Cost)
+    budget: Budget = Field(default_factory=Budget)
+    tracer: Tracer = Field(default_factory=Tracer)
+    prompt_budgeter: PromptBudgeter = Field(default_factory=PromptBudgeter)
     novel_saver: NovelSaver = Field(default_factory=NovelSaver)
     generation_config: NovelGenerationConfig = Field(
         default_factory=NovelGenerationConfig
@@ -62,6 +81,17 @@ class NovelGenie(BaseModel):
 
     current_volume_num: Optional[int] = Field(None, exclude=True)
     current_chapter_num: Optional[int] = Field(None, exclude=True)
+    task_graph: Optional[TaskGraph] = Field(None, exclude=True)
+    story_memory: Optional[StoryMemory] = Field(None, exclude=True)
+    # Where streamed replies go, the LLM's configured sink if unset
+    stream_sink: Optional[StreamSink] = Field(None, exclude=True)
+    # First chapter outline drafted from a partially streamed rough outline
+    early_chapter_outline: Optional[Tuple[RoughOutline, asyncio.Task]] = Field(
+        None, exclude=True
+    )
+    # Called with the novel id once its first checkpoint is saved, e.g. to
+    # resume a batch job under the same id
+    on_novel_id: Optional[Callable[[str], None]] = Field(None, exclude=True)
 
     class Config:
         arbitrary_types_allowed = True
@@ -70,23 +100,46 @@ class NovelGenie(BaseModel):
     def generate_novel_id(title: str) -> str:
         """Generate unique novel ID."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"{title}_{timestamp}"
+        # Concurrent batch and service jobs can reach the same title within
+        # a second, and must not share a novel directory
+        return f"{title}_{timestamp}_{uuid.uuid4().hex[:6]}"
 
+    @traced("intent")
+    @track_stage("intent")
     async def analyze_intent(self) -> NovelIntent:
         """Analyze user input to extract story details."""
         logger.info("Analyzing user input to extract story details")
         prompt = INTENT_ANALYZER_PROMPT.format(user_input=self.user_input)
-        response = await self.llm.ask(prompt)
-        title, description, genre, work_length = parse_intent(response)
-        return NovelIntent(
-            title=title,
-            description=description,
-            genre=genre,
-            work_length=work_length,
+
+        def to_intent(response: str) -> NovelIntent:
+            title, description, genre, work_length = parse_intent(response)
+            return NovelIntent(
+                title=title,
+                description=description,
+                genre=genre,
+                work_length=work_length,
+            )
+
+        return await self.llm.ask_first_valid(
+            prompt, to_intent, "intent", sink=self.stream_sink
         )
 
-    async def generate_rough_outline(self) -> RoughOutline:
-        """Generate rough outline based on story intent."""
+    @traced("rough_outline")
+    @track_stage("rough_outline")
+    async def generate_rough_outline(
+        self, parser: Optional[StreamParser] = None
+    ) -> RoughOutline:
+        """
+        Generate rough outline based on story intent.
+
+        With hedging enabled, concurrent candidates race and the first
+        complete outline wins.
+
+        Args:
+            parser (Optional[StreamParser]): Parser of the streamed reply, to
+                act on outline elements before the whole outline arrives.
+                Only the first candidate uses it.
+        """
         logger.info(f"Generating rough outline for novel '{self.intent.title}'")
         prompt = ROUGH_OUTLINE_GENERATOR_PROMPT_V2.format(
             user_input=self.user_input,
@@ -97,118 +150,371 @@ class NovelGenie(BaseModel):
             volume_count=self.generation_config.volume_count,
             chapter_count_per_volume=self.generation_config.chapter_count_per_volume,
         )
-        response = await self.llm.ask(prompt)
-        return extract_outline(response, OutlineType.ROUGH)
+        return await self.llm.ask_first_valid(
+            prompt,
+            partial(extract_outline, outline_type=OutlineType.ROUGH),
+            "rough_outline",
+            sink=self.stream_sink,
+            parser_factory=lambda index: (
+                parser
+                if parser is not None and index == 0
+                else self._outline_parser(OutlineType.ROUGH)
+            ),
+        )
 
+    @traced("detailed_outline")
+    @track_stage("detailed_outline")
     async def generate_detailed_outline(
-        self, prev_volume_summary: Optional[str] = None
+        self,
+        prev_volume_summary: Optional[str] = None,
+        volume_num: Optional[int] = None,
+        chapter_num: Optional[int] = None,
+        chapter_outline: Optional[ChapterOutline] = None,
     ) -> DetailedOutline:
         """Generate detailed outline for a single chapter."""
+        volume_num = volume_num or self.current_volume_num
+        chapter_num = chapter_num or self.current_chapter_num
+        chapter_outline = chapter_outline or self.chapter_outline
         # Apply sliding window to get latest n detailed outlines from previous detailed outlines
         existing_detailed_outlines = self._get_latest_elements(
-            attribute_name="detailed_outlines"
+            attribute_name="detailed_outlines", volume_num=volume_num
         )
 
         # FIXME: rough_outline should be fix
-        prompt = DETAILED_OUTLINE_GENERATOR_PROMPT_V2.format(
+        prompt = self._fit_prompt(
+            DETAILED_OUTLINE_GENERATOR_PROMPT_V2,
+            [
+                self._window_section(
+                    "existing_detailed_outlines",
+                    existing_detailed_outlines,
+                    prev_volume_summary,
+                ),
+                PromptSection(
+                    name="rough_outline",
+                    items=[str(self.rough_outline)],
+                    priority=1,
+                    keep="head",
+                ),
+                self._memory_section(
+                    str(chapter_outline),
+                    volume_num,
+                    chapter_num,
+                    kinds=("detailed_outline",),
+                ),
+            ],
             work_length=self.intent.work_length,
             chapter_count_per_volume=self.generation_config.chapter_count_per_volume,
-            designated_volume=self.current_volume_num,
-            designated_chapter=self.current_chapter_num,
+            designated_volume=volume_num,
+            designated_chapter=chapter_num,
             description=self.intent.description,
-            rough_outline=str(self.rough_outline),
             worldview_system=self.rough_outline.worldview_system,
             character_system=self.rough_outline.character_system,
-            volume_design=self.rough_outline.volume_design[self.current_volume_num - 1],
+            volume_design=self.rough_outline.volume_design[volume_num - 1],
             section_word_count=self.generation_config.section_word_count,
             prev_volume_summary=prev_volume_summary,
-            chapter_outline=self.chapter_outline,
-            existing_detailed_outlines="\n\n".join(
-                str(outline) for outline in existing_detailed_outlines
-            ),
+            chapter_outline=chapter_outline,
         )
-        response = await self.llm.ask(prompt)
-        return extract_outline(response, OutlineType.DETAILED)
+        response = await self._ask(
+            prompt,
+            f"detailed_outline_{volume_num}_{chapter_num}",
+            parser=self._outline_parser(OutlineType.DETAILED),
+        )
+        with trace_span("parse", "parse"):
+            return extract_outline(response, OutlineType.DETAILED)
 
+    @traced("content")
     @save_checkpoint(CheckpointType.CHAPTER)
-    async def generate_chapter(self) -> Chapter:
+    @track_stage("content")
+    async def generate_chapter(
+        self,
+        prev_volume_summary: Optional[str] = None,
+        volume_num: Optional[int] = None,
+        chapter_num: Optional[int] = None,
+        chapter_outline: Optional[ChapterOutline] = None,
+        detailed_outline: Optional[DetailedOutline] = None,
+    ) -> Chapter:
         """Generate a single chapter."""
-        existing_chapters = self._get_latest_elements(attribute_name="chapters")
-        prompt = CONTENT_GENERATOR_PROMPT_V2.format(
+        volume_num = volume_num or self.current_volume_num
+        chapter_num = chapter_num or self.current_chapter_num
+        existing_chapters = self._get_latest_elements(
+            attribute_name="chapters", volume_num=volume_num
+        )
+        prompt = self._fit_prompt(
+            CONTENT_GENERATOR_PROMPT_V2,
+            [
+                self._chapter_window_section(existing_chapters, prev_volume_summary),
+                self._memory_section(
+                    str(detailed_outline or self.detailed_outline),
+                    volume_num,
+                    chapter_num,
+                    kinds=("chapter", "summary"),
+                ),
+            ],
             description=self.intent.description,
             work_length=self.intent.work_length,
             chapter_count_per_volume=self.generation_config.chapter_count_per_volume,
-            designated_volume=self.current_volume_num,
-            designated_chapter=self.current_chapter_num,
+            designated_volume=volume_num,
+            designated_chapter=chapter_num,
             worldview_system=self.rough_outline.worldview_system,
             character_system=self.rough_outline.character_system,
-            volume_design=self.rough_outline.volume_design[self.current_volume_num - 1],
-            chapter_outline=self.chapter_outline,
-            detailed_outline=self.detailed_outline,
+            volume_design=self.rough_outline.volume_design[volume_num - 1],
+            chapter_outline=chapter_outline or self.chapter_outline,
+            detailed_outline=detailed_outline or self.detailed_outline,
             section_word_count=self.generation_config.section_word_count,
-            existing_chapters="\n\n".join(
-                str(outline) for outline in existing_chapters
+        )
+        response = await self._ask(
+            prompt,
+            f"content_{volume_num}_{chapter_num}",
+            parser=StreamParser(
+                validator=ChapterValidator(self.generation_config.format_check_chars)
             ),
         )
-        response = await self.llm.ask(prompt)
         # Extract chapter title and content
-        title = re.search(r"## 第\s*[0-9零一二三四五六七八九]+\s*章\s+.+", response).group()
-        content = response.split(title, 1)[1].strip()
-        return Chapter(title=title, content=content)
+        with trace_span("parse", "parse"):
+            title = CHAPTER_TITLE_PATTERN.search(response).group()
+            content = response.split(title, 1)[1].strip()
+            return Chapter(title=title, content=content)
 
+    @traced("optimize")
     @save_checkpoint(CheckpointType.CHAPTER)
-    async def optimize_chapter_content(self, chapter: Chapter) -> Chapter:
+    @track_stage("optimize")
+    async def optimize_chapter_content(
+        self,
+        chapter: Chapter,
+        volume_num: Optional[int] = None,
+        chapter_num: Optional[int] = None,
+    ) -> Chapter:
         """Optimize a single chapter."""
         prompt = CONTENT_OPTIMIZER_PROMPT.format(
             original_chapter_content=chapter.content
         )
-        rsp = await self.llm.ask(prompt)
-        commands = extract_commands_from_response(rsp)
+        rsp = await self._ask(prompt, f"optimize_{volume_num}_{chapter_num}")
+        with trace_span("parse", "parse"):
+            commands = extract_commands_from_response(rsp)
 
-        # 应用编辑命令
-        modified_content = process_edit_commands(chapter.content, commands)
+            # 应用编辑命令
+            modified_content = process_edit_commands(chapter.content, commands)
         chapter.content = modified_content
+        chapter.optimized = True
         return chapter
 
+    @traced("chapter_summary")
+    @track_stage("chapter_summary")
+    async def generate_chapter_summary(
+        self, chapter: Chapter, volume_num: int, chapter_num: int
+    ) -> str:
+        """Summarize a chapter for the prompts of later chapters."""
+        logger.info(f"Summarizing chapter {chapter_num} of volume {volume_num}")
+        prompt = CHAPTER_SUMMARY_PROMPT.format(
+            volume_num=volume_num,
+            chapter_num=chapter_num,
+            chapter=str(chapter),
+            summary_word_count=self.generation_config.chapter_summary_word_count,
+        )
+        return await self._ask(prompt, f"chapter_summary_{volume_num}_{chapter_num}")
+
+    @traced("chapter_outline")
+    @track_stage("chapter_outline")
     async def generate_chapter_outline(
-        self, prev_volume_summary: Optional[str] = None
+        self,
+        prev_volume_summary: Optional[str] = None,
+        volume_num: Optional[int] = None,
+        chapter_num: Optional[int] = None,
+        rough_outline: Optional[RoughOutline] = None,
     ) -> ChapterOutline:
         """Generate chapter outline for a volume."""
+        volume_num = volume_num or self.current_volume_num
+        chapter_num = chapter_num or self.current_chapter_num
+        rough_outline = rough_outline or self.rough_outline
         existing_chapter_outlines = self._get_latest_elements(
-            attribute_name="chapter_outlines"
+            attribute_name="chapter_outlines", volume_num=volume_num
         )
-        prompt = CHAPTER_OUTLINE_GENERATOR_PROMPT.format(
+        prompt = self._fit_prompt(
+            CHAPTER_OUTLINE_GENERATOR_PROMPT,
+            [
+                self._window_section(
+                    "existing_chapter_outlines",
+                    existing_chapter_outlines,
+                    prev_volume_summary,
+                )
+            ],
             user_input=self.user_input,
             work_length=self.intent.work_length,
             chapter_count_per_volume=self.generation_config.chapter_count_per_volume,
-            designated_volume=self.current_volume_num,
-            designated_chapter=self.current_chapter_num,
+            designated_volume=volume_num,
+            designated_chapter=chapter_num,
             description=self.intent.description,
-            worldview_system=self.rough_outline.worldview_system,
-            character_system=self.rough_outline.character_system,
-            volume_design=self.rough_outline.volume_design[self.current_volume_num - 1],
+            worldview_system=rough_outline.worldview_system,
+            character_system=rough_outline.character_system,
+            volume_design=rough_outline.volume_design[volume_num - 1],
             section_word_count=self.generation_config.section_word_count,
-            existing_chapter_outlines="\n\n".join(
-                str(outline) for outline in existing_chapter_outlines
-            ),
             prev_volume_summary=prev_volume_summary,
         )
-        response = await self.llm.ask(prompt)
-        return extract_outline(response, OutlineType.CHAPTER)
+        response = await self._ask(
+            prompt,
+            f"chapter_outline_{volume_num}_{chapter_num}",
+            parser=self._outline_parser(OutlineType.CHAPTER),
+        )
+        with trace_span("parse", "parse"):
+            return extract_outline(response, OutlineType.CHAPTER)
 
-    def _get_latest_elements(self, attribute_name: str) -> List[T]:
+    @staticmethod
+    def _window_section(
+        name: str, elements: List[Any], prev_volume_summary: Optional[str]
+    ) -> PromptSection:
+        """Sliding window section, falling back to the previous volume summary."""
+        items = [str(element) for element in elements]
+        if not items and prev_volume_summary:
+            items = [prev_volume_summary]
+        return PromptSection(name=name, items=items)
+
+    def _chapter_window_section(
+        self, chapters: List[Chapter], prev_volume_summary: Optional[str]
+    ) -> PromptSection:
+        """
+        Previous chapters for the content prompt: the immediately preceding
+        chapter in full, older ones by their summary when one exists.
+        """
+        section = self._window_section(
+            "existing_chapters", chapters, prev_volume_summary
+        )
+        if self.generation_config.use_chapter_summaries and chapters:
+            section.items = [
+                f"{chapter.title}\n（前情摘要）{chapter.summary}"
+                if chapter.summary
+                else str(chapter)
+                for chapter in chapters[:-1]
+            ] + [str(chapters[-1])]
+        return section
+
+    def _memory_section(
+        self, query: str, volume_num: int, chapter_num: int, kinds: Tuple[str, ...]
+    ) -> PromptSection:
+        """
+        Passages relevant to `query` from chapters older than the sliding
+        window. Only kinds whose stages are guaranteed to have finished for
+        those chapters are searched, keeping prompts reproducible.
+        """
+        passages = []
+        memory = self.get_story_memory()
+        if memory is not None:
+            passages = memory.query(
+                query,
+                k=self.generation_config.story_memory_top_k,
+                before_chapter=chapter_num - self.generation_config.sliding_window_size,
+                kinds=kinds,
+                volume_num=(
+                    volume_num if self.generation_config.parallel_volumes else None
+                ),
+            )
+        # Shrinks before the sliding window and the outlines
+        return PromptSection(
+            name="story_memory",
+            items=[str(passage) for passage in passages],
+            priority=-1,
+            min_items=0,
+        )
+
+    def get_story_memory(self) -> Optional[StoryMemory]:
+        """The retrieval index of the current novel, opened on first use."""
+        if self.generation_config.story_memory_top_k <= 0 or not self.novel_id:
+            return None
+        path = Path(self.novel_saver.base_dir) / self.novel_id / "story_memory.jsonl"
+        if self.story_memory is None or self.story_memory.path != path:
+            self.story_memory = StoryMemory(path)
+            self._sync_story_memory()
+        return self.story_memory
+
+    def _sync_story_memory(self) -> None:
+        """Index restored stage results the memory file does not have yet."""
+        for volume in self.volumes:
+            chapter_nums = self._chapter_range(volume.volume_num)
+            for index, chapter_num in enumerate(chapter_nums):
+                if index < len(volume.detailed_outlines) and not self.story_memory.has(
+                    "detailed_outline", chapter_num
+                ):
+                    self.remember(
+                        "detailed_outline",
+                        volume.volume_num,
+                        chapter_num,
+                        str(volume.detailed_outlines[index]),
+                    )
+                if index >= len(volume.chapters):
+                    continue
+                chapter = volume.chapters[index]
+                if not self.story_memory.has("chapter", chapter_num):
+                    self.remember(
+                        "chapter", volume.volume_num, chapter_num, chapter.content
+                    )
+                if chapter.summary and not self.story_memory.has(
+                    "summary", chapter_num
+                ):
+                    self.remember(
+                        "summary", volume.volume_num, chapter_num, chapter.summary
+                    )
+
+    def remember(self, kind: str, volume_num: int, chapter_num: int, text: str):
+        """Add a finished stage result to the retrieval index."""
+        memory = self.get_story_memory()
+        if memory is not None:
+            memory.add(
+                kind,
+                volume_num,
+                chapter_num,
+                chunk_text(text, self.generation_config.story_memory_passage_chars),
+            )
+
+    async def _ask(
+        self, prompt: str, stream_id: str, parser: Optional[StreamParser] = None
+    ) -> str:
+        """Ask the LLM, streaming the reply to this generator's sink."""
+        return await self.llm.ask(
+            prompt, sink=self.stream_sink, stream_id=stream_id, parser=parser
+        )
+
+    def _outline_parser(self, outline_type: OutlineType) -> StreamParser:
+        """Parser aborting replies that lack the tags of `outline_type`."""
+        return StreamParser.for_outline(
+            outline_type,
+            validator=OutlineValidator(
+                outline_type, self.generation_config.format_check_chars
+            ),
+        )
+
+    def _fit_prompt(
+        self, template: str, sections: List[PromptSection], **fields: Any
+    ) -> str:
+        """Format a prompt, trimming its sections to the input-token ceiling."""
+        with trace_span("prompt", "prompt"):
+            prompt, _ = self.prompt_budgeter.fit(
+                template,
+                sections,
+                model=self.llm.model,
+                reserved_tokens=count_tokens(SYSTEM_PROMPT, self.llm.model),
+                **fields,
+            )
+        return prompt
+
+    def _get_latest_elements(
+        self, attribute_name: str, volume_num: Optional[int] = None
+    ) -> List[T]:
         """从当前卷或上一卷中获取指定属性的最新元素。"""
+        volume_num = volume_num or self.current_volume_num
         # 尝试从当前卷获取指定属性
         current_volume_elements = (
-            getattr(self.volumes[self.current_volume_num - 1], attribute_name, [])
-            if self.volumes and self.current_volume_num > 0
+            getattr(self.volumes[volume_num - 1], attribute_name, [])
+            if self.volumes and volume_num > 0
             else []
         )
 
-        # 如果当前卷的元素为空，尝试从上一卷获取
-        if not current_volume_elements and self.current_volume_num > 1:
+        # 如果当前卷的元素为空，尝试从上一卷获取（并行分卷模式下各卷互不依赖）
+        if (
+            not current_volume_elements
+            and volume_num > 1
+            and not self.generation_config.parallel_volumes
+        ):
             previous_volume_elements = getattr(
-                self.volumes[self.current_volume_num - 2], attribute_name, []
+                self.volumes[volume_num - 2], attribute_name, []
             )
             # 从上一卷获取最新的几条元素
             current_volume_elements = previous_volume_elements[
@@ -223,73 +529,461 @@ class NovelGenie(BaseModel):
         return current_volume_elements[-self.generation_config.sliding_window_size :]
 
     @save_checkpoint(CheckpointType.VOLUME)
-    async def generate_volume(
-        self,
-        volume: NovelVolume,
-        prev_volume_summary: Optional[str] = None,
-    ) -> NovelVolume:
-        """Generate a complete volume of the novel."""
-        # Generate chapters one by one
+    async def complete_volume(self, volume: NovelVolume) -> NovelVolume:
+        """Mark a volume as fully generated and checkpoint it."""
+        logger.info(f"Completed generation of volume {volume.volume_num}")
+        return volume
+
+    def _chapter_range(self, volume_num: int) -> range:
+        """Global chapter numbers belonging to a volume."""
         chapter_count_per_volume = self.generation_config.chapter_count_per_volume
-        start_chapter = chapter_count_per_volume * (self.current_volume_num - 1) + 1
-        self.current_chapter_num = (
-            self.current_chapter_num + 1
-            if self.current_chapter_num is not None
-            else None
-        )
-        start_chapter = self.current_chapter_num or start_chapter
-        end_chapter = self.current_volume_num * chapter_count_per_volume
-        for chapter_num in range(start_chapter, end_chapter + 1):
-            self.current_chapter_num = chapter_num
-            logger.info(
-                f"Generating chapter {self.current_chapter_num} for volume {self.current_volume_num}"
-            )
-            await self._generate_single_chapter(
-                volume=volume, prev_volume_summary=prev_volume_summary
-            )
-            logger.info(
-                f"Successfully generated chapter {self.current_chapter_num} in volume {self.current_volume_num}"
+        start_chapter = chapter_count_per_volume * (volume_num - 1) + 1
+        return range(start_chapter, start_chapter + chapter_count_per_volume)
+
+    def chapter_index(self, volume_num: int, chapter_num: int) -> int:
+        """Position of a global chapter number within its volume."""
+        return chapter_num - self._chapter_range(volume_num).start
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """
+        Full novel state as stored in a checkpoint snapshot.
+
+        Models are left as-is and serialized once by the saver.
+        """
+        return {
+            "user_input": self.user_input,
+            "intent": self.intent,
+            "rough_outline": self.rough_outline,
+            "volumes": list(self.volumes),
+            "current_volume_num": self.current_volume_num,
+            "current_chapter_num": self.current_chapter_num,
+        }
+
+    def record_stage(self, path: List[Union[str, int]], value: Any) -> None:
+        """
+        Journal a finished stage result that is already attached to the state.
+
+        The journal is folded into the snapshot every
+        `checkpoint_compact_interval` records. Compaction only rewrites the
+        volumes and elements touched by those records, keeping the cost per
+        stage constant regardless of the novel length.
+        """
+        with trace_span(
+            "journal", "checkpoint", path="/".join(str(key) for key in path)
+        ) as span:
+            self.novel_saver.append_journal(self.novel_id, path, value)
+            if self.novel_saver.needs_compaction(self.novel_id):
+                self.novel_saver.compact(self.novel_id)
+                if span is not None:
+                    span.set(compacted=True)
+                logger.info(f"Compacted checkpoint journal for novel {self.novel_id}")
+
+    def save_progress(self, **fields: Any) -> None:
+        """Journal novel-level fields and fold the journal into the snapshot."""
+        with trace_span("save_progress", "checkpoint"):
+            for key, value in fields.items():
+                self.novel_saver.append_journal(self.novel_id, [key], value)
+            self.novel_saver.compact(self.novel_id)
+
+    def build_generation_graph(self) -> TaskGraph:
+        """
+        Build the dependency graph of all generation stages.
+
+        Chapter outlines, detailed outlines and chapter contents each form an
+        ordered chain (every stage reads the sliding window of its predecessors,
+        across volume boundaries). Outline generation may run up to
+        `outline_lookahead` chapters ahead of the finished chapters, and the
+        optimization of a chapter runs alongside drafting of the next one.
+
+        In `parallel_volumes` mode the chains restart at every volume, seeded
+        by a bridging summary of the previous volume's design, so up to
+        `max_parallel_volumes` volumes are generated concurrently.
+        """
+        graph = TaskGraph(max_concurrency=self.generation_config.max_concurrency)
+        graph.add_node("intent", self._run_intent_stage)
+        graph.add_node("rough_outline", self._run_rough_outline_stage, deps=["intent"])
+
+        lookahead = self.generation_config.outline_lookahead
+        parallel_volumes = self.generation_config.parallel_volumes
+        max_parallel_volumes = self.generation_config.max_parallel_volumes
+        final_nodes: List[str] = []
+        use_summaries = self.generation_config.use_chapter_summaries
+        prev_chapter_outline = prev_detailed_outline = prev_content = None
+        prev_summaries: List[str] = []
+        for volume_num in range(1, self.generation_config.volume_count + 1):
+            volume_final_nodes = []
+            volume_deps = ["rough_outline"]
+            if parallel_volumes:
+                final_nodes = []
+                prev_chapter_outline = prev_detailed_outline = prev_content = None
+                prev_summaries = []
+                if volume_num > 1:
+                    graph.add_node(
+                        f"bridge:{volume_num}",
+                        partial(self._run_bridge_stage, volume_num),
+                        deps=["rough_outline"],
+                    )
+                    volume_deps.append(f"bridge:{volume_num}")
+                if volume_num > max_parallel_volumes:
+                    volume_deps.append(f"volume:{volume_num - max_parallel_volumes}")
+
+            for chapter_num in self._chapter_range(volume_num):
+                key = f"{volume_num}:{chapter_num}"
+                # Throttle outline generation to `lookahead` unfinished chapters
+                throttle = (
+                    final_nodes[-lookahead - 1]
+                    if len(final_nodes) > lookahead
+                    else None
+                )
+                graph.add_node(
+                    f"chapter_outline:{key}",
+                    partial(self._run_chapter_outline_stage, volume_num, chapter_num),
+                    deps=[*volume_deps, prev_chapter_outline, throttle],
+                )
+                graph.add_node(
+                    f"detailed_outline:{key}",
+                    partial(self._run_detailed_outline_stage, volume_num, chapter_num),
+                    deps=[f"chapter_outline:{key}", prev_detailed_outline],
+                )
+                # The previous chapter goes into the prompt verbatim, older
+                # ones only by summary, so the latest summary is not awaited
+                graph.add_node(
+                    f"content:{key}",
+                    partial(self._run_content_stage, volume_num, chapter_num),
+                    deps=[
+                        f"detailed_outline:{key}",
+                        prev_content,
+                        prev_summaries[-2] if len(prev_summaries) > 1 else None,
+                    ],
+                )
+                if use_summaries:
+                    graph.add_node(
+                        f"summary:{key}",
+                        partial(self._run_summary_stage, volume_num, chapter_num),
+                        deps=[f"content:{key}"],
+                    )
+                    prev_summaries.append(f"summary:{key}")
+                    volume_final_nodes.append(f"summary:{key}")
+                final_node = f"content:{key}"
+                if self.generation_config.need_optimize:
+                    graph.add_node(
+                        f"optimize:{key}",
+                        partial(self._run_optimize_stage, volume_num, chapter_num),
+                        deps=[f"content:{key}"],
+                    )
+                    final_node = f"optimize:{key}"
+
+                prev_chapter_outline = f"chapter_outline:{key}"
+                prev_detailed_outline = f"detailed_outline:{key}"
+                prev_content = f"content:{key}"
+                final_nodes.append(final_node)
+                volume_final_nodes.append(final_node)
+
+            graph.add_node(
+                f"volume:{volume_num}",
+                partial(self.complete_volume, self.volumes[volume_num - 1]),
+                deps=volume_final_nodes,
             )
+        return graph
 
-        return volume
+    def _completed_nodes_from_state(self) -> Set[str]:
+        """Derive which graph nodes are already done from the restored state."""
+        completed = set()
+        if self.intent:
+            completed.add("intent")
+        if self.rough_outline:
+            completed.add("rough_outline")
+        for volume in self.volumes:
+            volume_num = volume.volume_num
+            if volume.prev_volume_summary:
+                completed.add(f"bridge:{volume_num}")
+            chapter_nums = self._chapter_range(volume_num)
+            for index, chapter_num in enumerate(chapter_nums):
+                key = f"{volume_num}:{chapter_num}"
+                if index < len(volume.chapter_outlines):
+                    completed.add(f"chapter_outline:{key}")
+                if index < len(volume.detailed_outlines):
+                    completed.add(f"detailed_outline:{key}")
+                if index < len(volume.chapters):
+                    completed.add(f"content:{key}")
+                    if volume.chapters[index].summary:
+                        completed.add(f"summary:{key}")
+                    if volume.chapters[index].optimized:
+                        completed.add(f"optimize:{key}")
+            if len(volume.chapters) >= len(chapter_nums) and all(
+                chapter.optimized or not self.generation_config.need_optimize
+                for chapter in volume.chapters
+            ):
+                completed.add(f"volume:{volume_num}")
+        return completed
 
-    async def _generate_single_chapter(
-        self,
-        volume: NovelVolume,
-        prev_volume_summary: Optional[str],
-    ) -> None:
-        """Generate a single chapter including its outlines and content."""
-        # Generate chapter outline for current chapter
-        self.chapter_outline = await self.generate_chapter_outline(
-            prev_volume_summary=prev_volume_summary
+    @within_budget("intent")
+    async def _run_intent_stage(self) -> None:
+        self.intent = await self.analyze_intent()
+        self.novel_id = self.generate_novel_id(self.intent.title)
+        logger.info(f"Generating novel ID for description: {self.intent.title}")
+        self._save_initial_checkpoint()
+
+    def _save_initial_checkpoint(self) -> None:
+        self._trace_to_novel_dir()
+        # Initial snapshot; every later stage is journaled on top of it
+        self.novel_saver.save_checkpoint(self.novel_id, self.checkpoint_state())
+        if self.on_novel_id is not None:
+            self.on_novel_id(self.novel_id)
+
+    def _trace_to_novel_dir(self) -> None:
+        """Write the trace of this run next to the novel once it ends."""
+        self.tracer.directory = str(
+            Path(self.novel_saver.base_dir) / self.novel_id / "traces"
         )
-        volume.chapter_outlines.append(self.chapter_outline)
 
-        # Generate detailed outline for current chapter
-        self.detailed_outline = await self.generate_detailed_outline(
-            prev_volume_summary=prev_volume_summary
+    @within_budget("rough_outline")
+    async def _run_rough_outline_stage(self) -> None:
+        parser = self._outline_parser(OutlineType.ROUGH)
+
+        def on_tag(tag: str, index: int, content: str) -> None:
+            # Worldview and characters come first, so the first volume design
+            # completes everything the first chapter outline needs
+            if tag == "volume_design" and index == 0:
+                worldview = parser.elements["worldview_system"]
+                characters = parser.elements["character_system"]
+                if worldview and characters:
+                    self._start_early_chapter_outline(
+                        RoughOutline(
+                            worldview_system=worldview[0],
+                            character_system=characters[0],
+                            volume_design=[content],
+                        )
+                    )
+
+        parser.on_tag = on_tag
+        self.rough_outline = await self.generate_rough_outline(parser=parser)
+        self.record_stage(["rough_outline"], self.rough_outline)
+
+    def _start_early_chapter_outline(self, rough_outline: RoughOutline) -> None:
+        """
+        Draft the first chapter outline while the rest of the rough outline
+        is still streaming. A retried rough outline request restarts the draft.
+        """
+        self._cancel_early_chapter_outline()
+        logger.info("Starting the first chapter outline from the streamed outline")
+
+        async def draft() -> ChapterOutline:
+            with self.budget.admit(self.cost_tracker, "chapter_outline"):
+                return await self.generate_chapter_outline(
+                    volume_num=1,
+                    chapter_num=self._chapter_range(1).start,
+                    rough_outline=rough_outline,
+                )
+
+        self.early_chapter_outline = (rough_outline, asyncio.create_task(draft()))
+
+    def _cancel_early_chapter_outline(self) -> None:
+        if self.early_chapter_outline is None:
+            return
+        _, task = self.early_chapter_outline
+        self.early_chapter_outline = None
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # Retrieved, so it is not logged as lost
+        else:
+            task.cancel()
+
+    async def _take_early_chapter_outline(
+        self, volume_num: int, chapter_num: int
+    ) -> Optional[ChapterOutline]:
+        """The early draft of this chapter outline if it used the final outline."""
+        if (
+            self.early_chapter_outline is None
+            or volume_num != 1
+            or chapter_num != self._chapter_range(1).start
+        ):
+            return None
+        draft_outline, task = self.early_chapter_outline
+        if (
+            draft_outline.worldview_system != self.rough_outline.worldview_system
+            or draft_outline.character_system != self.rough_outline.character_system
+            or draft_outline.volume_design[0] != self.rough_outline.volume_design[0]
+        ):
+            self._cancel_early_chapter_outline()
+            return None
+        self.early_chapter_outline = None
+        try:
+            return await task
+        except Exception as e:
+            logger.warning(f"Early chapter outline failed, generating it again: {e}")
+            return None
+
+    @within_budget("volume_summary")
+    async def _run_bridge_stage(self, volume_num: int) -> None:
+        # Summarize the planned (not generated) previous volume so this volume
+        # does not have to wait for it.
+        volume = self.volumes[volume_num - 1]
+        volume.prev_volume_summary = await self.generate_detailed_outline_summary(
+            volume_num=volume_num - 1,
+            rough_outline=str(self.rough_outline),
+            detailed_outline=self.rough_outline.volume_design[volume_num - 2],
+        )
+        self.record_stage(
+            ["volumes", volume_num - 1, "prev_volume_summary"],
+            volume.prev_volume_summary,
+        )
+
+    @within_budget("chapter_outline")
+    async def _run_chapter_outline_stage(self, volume_num: int, chapter_num: int):
+        logger.info(f"Generating chapter outline {chapter_num} for volume {volume_num}")
+        volume = self.volumes[volume_num - 1]
+        chapter_outline = await self._take_early_chapter_outline(
+            volume_num, chapter_num
+        ) or await self.generate_chapter_outline(
+            prev_volume_summary=volume.prev_volume_summary,
+            volume_num=volume_num,
+            chapter_num=chapter_num,
+        )
+        volume.chapter_outlines.append(chapter_outline)
+        self.record_stage(
+            [
+                "volumes",
+                volume_num - 1,
+                "chapter_outlines",
+                len(volume.chapter_outlines) - 1,
+            ],
+            chapter_outline,
         )
-        # volume.detailed_outlines = self.detailed_outline
-        volume.detailed_outlines.append(self.detailed_outline)
 
-        # Generate current chapter
-        chapter = await self.generate_chapter()
-        if self.generation_config.need_optimize:
-            logger.info(f"Optimizing content for chapter {chapter.title}")
-            chapter = await self.optimize_chapter_content(chapter)
+    @within_budget("detailed_outline")
+    async def _run_detailed_outline_stage(self, volume_num: int, chapter_num: int):
+        volume = self.volumes[volume_num - 1]
+        index = self.chapter_index(volume_num, chapter_num)
+        detailed_outline = await self.generate_detailed_outline(
+            prev_volume_summary=volume.prev_volume_summary,
+            volume_num=volume_num,
+            chapter_num=chapter_num,
+            chapter_outline=volume.chapter_outlines[index],
+        )
+        volume.detailed_outlines.append(detailed_outline)
+        self.record_stage(
+            [
+                "volumes",
+                volume_num - 1,
+                "detailed_outlines",
+                len(volume.detailed_outlines) - 1,
+            ],
+            detailed_outline,
+        )
+        self.remember(
+            "detailed_outline", volume_num, chapter_num, str(detailed_outline)
+        )
 
+    @within_budget("content")
+    async def _run_content_stage(self, volume_num: int, chapter_num: int):
+        volume = self.volumes[volume_num - 1]
+        index = self.chapter_index(volume_num, chapter_num)
+        self.current_volume_num = volume_num
+        self.current_chapter_num = chapter_num
+        self.chapter_outline = volume.chapter_outlines[index]
+        self.detailed_outline = volume.detailed_outlines[index]
+        logger.info(f"Generating chapter {chapter_num} for volume {volume_num}")
+        chapter = await self.generate_chapter(
+            prev_volume_summary=volume.prev_volume_summary,
+            volume_num=volume_num,
+            chapter_num=chapter_num,
+            chapter_outline=self.chapter_outline,
+            detailed_outline=self.detailed_outline,
+        )
         volume.chapters.append(chapter)
+        self.record_stage(["volumes", volume_num - 1, "chapters", index], chapter)
+        self.remember("chapter", volume_num, chapter_num, chapter.content)
+        logger.info(
+            f"Successfully generated chapter {chapter_num} in volume {volume_num}"
+        )
+
+    @within_budget("optimize")
+    async def _run_optimize_stage(self, volume_num: int, chapter_num: int):
+        volume = self.volumes[volume_num - 1]
+        index = self.chapter_index(volume_num, chapter_num)
+        chapter = volume.chapters[index]
+        logger.info(f"Optimizing content for chapter {chapter.title}")
+        volume.chapters[index] = await self.optimize_chapter_content(
+            chapter, volume_num=volume_num, chapter_num=chapter_num
+        )
+        self.record_stage(
+            ["volumes", volume_num - 1, "chapters", index], volume.chapters[index]
+        )
+
+    @within_budget("chapter_summary")
+    async def _run_summary_stage(self, volume_num: int, chapter_num: int):
+        volume = self.volumes[volume_num - 1]
+        index = self.chapter_index(volume_num, chapter_num)
+        summary = await self.generate_chapter_summary(
+            volume.chapters[index], volume_num=volume_num, chapter_num=chapter_num
+        )
+        # Optimization may have replaced the chapter in the meantime
+        chapter = volume.chapters[index]
+        chapter.summary = summary
+        self.record_stage(["volumes", volume_num - 1, "chapters", index], chapter)
+        self.remember("summary", volume_num, chapter_num, summary)
 
     async def generate_volumes(self):
-        """Generate volumes for the novel."""
-        start_volume = self.current_volume_num or 1
-        for volume_num in range(start_volume, self.generation_config.volume_count + 1):
-            self.current_volume_num = volume_num
-            logger.info(f"Starting generation of volume {self.current_volume_num}")
-            volume = NovelVolume(volume_num=self.current_volume_num)
+        """Generate all remaining stages of the novel through the task graph."""
+        for volume_num in range(
+            len(self.volumes) + 1, self.generation_config.volume_count + 1
+        ):
+            volume = NovelVolume(volume_num=volume_num)
             self.volumes.append(volume)
-            await self.generate_volume(volume)
+            if self.novel_id:
+                self.record_stage(["volumes", volume_num - 1], volume)
 
+        self.task_graph = self.build_generation_graph()
+        completed = self._completed_nodes_from_state()
+        start = time.perf_counter()
+        try:
+            await self.task_graph.run(
+                completed=completed, drain_on=(BudgetExceededError,)
+            )
+        except BudgetExceededError as e:
+            self._stop_for_budget(e)
+            raise
+        finally:
+            self._cancel_early_chapter_outline()
+        logger.info(
+            f"Generation graph finished {len(self.task_graph.nodes)} nodes "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    def budget_report(self, stop_reason: Optional[str] = None) -> Dict[str, Any]:
+        """Spend so far, per stage, and the projected cost of the whole novel."""
+        return self.budget.report(
+            self.cost_tracker,
+            chapters_done=sum(len(volume.chapters) for volume in self.volumes),
+            chapters_total=self.generation_config.volume_count
+            * self.generation_config.chapter_count_per_volume,
+            stop_reason=stop_reason,
+        )
+
+    def _stop_for_budget(self, error: BudgetExceededError) -> None:
+        """Checkpoint the finished stages and report where the budget went."""
+        error.report = self.budget_report(stop_reason=str(error))
+        if self.novel_id:
+            self.save_progress(
+                current_volume_num=self.current_volume_num,
+                current_chapter_num=self.current_chapter_num,
+                cost_info=self.cost_tracker.get(),
+                budget_report=error.report,
+            )
+            self.novel_saver.flush()
+        logger.warning(
+            f"{error}. Resume novel {self.novel_id} after raising the budget.\n"
+            f"Spent {error.report['spent_tokens']} tokens / "
+            f"{error.report['spent_cost']:.4f} USD on "
+            f"{error.report['chapters_done']}/{error.report['chapters_total']} "
+            f"chapters, projected total "
+            f"{error.report['projected_total_tokens']:.0f} tokens / "
+            f"{error.report['projected_total_cost']:.4f} USD\n"
+            f"{self.cost_tracker.log()}"
+        )
+
+    @traced("novel")
     @save_checkpoint(CheckpointType.NOVEL)
     async def generate_novel(
         self,
@@ -301,17 +995,16 @@ class NovelGenie(BaseModel):
         # Resume from checkpoint if provided
         if resume_novel_id:
             self.novel_id = resume_novel_id
+            self._trace_to_novel_dir()
             return await self._resume_generation()
 
         self.user_input = user_input
         logger.info("Starting new novel generation")
 
-        self.intent = await self.analyze_intent() if not intent else intent
-
-        self.novel_id = self.generate_novel_id(self.intent.title)
-        logger.info(f"Generating novel ID for description: {self.intent.title}")
-
-        self.rough_outline = await self.generate_rough_outline()
+        if intent:
+            self.intent = intent
+            self.novel_id = self.generate_novel_id(self.intent.title)
+            self._save_initial_checkpoint()
 
         await self.generate_volumes()
 
@@ -323,6 +1016,7 @@ class NovelGenie(BaseModel):
         )
 
         logger.info(f"Successfully generated novel for {self.novel_id}")
+        logger.info(f"Token usage:\n{self.cost_tracker.log()}")
         return novel
 
     async def _resume_generation(self) -> Novel:
@@ -334,6 +1028,7 @@ class NovelGenie(BaseModel):
         logger.info(f"Resuming novel generation for novel ID {self.novel_id}")
         try:
             # Restore instance variables
+            self.user_input = checkpoint_data.get("user_input")
             self.intent = (
                 NovelIntent(**checkpoint_data["intent"])
                 if checkpoint_data.get("intent")
@@ -346,24 +1041,13 @@ class NovelGenie(BaseModel):
             )
             self.current_volume_num = checkpoint_data.get("current_volume_num")
             self.current_chapter_num = checkpoint_data.get("current_chapter_num")
+            self.cost_tracker = Cost.from_info(checkpoint_data.get("cost_info"))
 
             # Reconstruct volumes with their outlines and chapters
-            volumes = []
-            for vol_data in checkpoint_data.get("volumes", []):
-                chapter_outline_data = vol_data.get("chapter_outline")
-                detailed_outline_data = vol_data.get("detailed_outline")
-
-                volume = NovelVolume(
-                    volume_num=vol_data["volume_num"],
-                    chapter_outline=ChapterOutline(**chapter_outline_data)
-                    if chapter_outline_data
-                    else None,
-                    detailed_outline=DetailedOutline(**detailed_outline_data)
-                    if detailed_outline_data
-                    else None,
-                    chapters=[Chapter(**ch) for ch in vol_data.get("chapters", [])],
-                )
-                volumes.append(volume)
+            self.volumes = [
+                NovelVolume.model_validate(vol_data)
+                for vol_data in checkpoint_data.get("volumes", [])
+            ]
 
             await self.generate_volumes()
 
@@ -372,16 +1056,20 @@ class NovelGenie(BaseModel):
                 intent=self.intent,
                 rough_outline=self.rough_outline,
                 volumes=self.volumes,
-                cost_info=checkpoint_data.get("cost_info", {}),
+                cost_info=self.cost_tracker.get(),
             )
 
             logger.info(f"Successfully resumed novel generation for {self.novel_id}")
             return novel
 
+        except BudgetExceededError:
+            raise
         except Exception as e:
             logger.error(f"Failed to resume novel generation: {str(e)}")
             raise RuntimeError(f"Resume generation failed: {str(e)}") from e
 
+    @traced("volume_summary")
+    @track_stage("volume_summary")
     async def generate_detailed_outline_summary(
         self,
         volume_num: int,
@@ -395,4 +1083,4 @@ class NovelGenie(BaseModel):
             rough_outline=rough_outline,
             detailed_outline=detailed_outline,
         )
-        return await self.llm.ask(prompt)
+        return await self._ask(prompt, f"volume_summary_{volume_num}")
@@ -1,13 +1,56 @@
-from typing import Optional
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple, TypeVar
 
+import aiohttp
 import openai
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, PrivateAttr
 
 from novel_genie.config import LLMSettings, config
+from novel_genie.cost import count_tokens, model_price, usage_scope
+from novel_genie.exceptions import LLMCacheMissError, MalformedResponseError
+from novel_genie.logger import logger
 from novel_genie.prompts.system_prompt import SYSTEM_PROMPT
+from novel_genie.rate_limiter import (
+    RateLimiter,
+    backoff_delay,
+    estimate_tokens,
+    parse_retry_after,
+)
+from novel_genie.response_cache import CACHE_MODES, ResponseCache, cache_key
+from novel_genie.stream_parser import StreamParser
+from novel_genie.stream_sink import StreamSink, StreamWriter, create_sink
+from novel_genie.tracing import current_span, trace_span
 from novel_genie.utils import filter_thinking_blocks
 
 
+# Errors worth retrying: throttling, overload and transport failures
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+# Sequence numbers of streams without an explicit id
+_stream_ids = itertools.count(1)
+
+# Recent latencies of hedged requests per (model, stream id), shared by all
+# clients, so the hedge threshold carries over from one novel to the next
+_hedge_latencies: Dict[Tuple[str, str], Deque[float]] = defaultdict(
+    lambda: deque(maxlen=100)
+)
+# Latencies needed before the percentile replaces the configured hedge delay
+MIN_HEDGE_SAMPLES = 5
+
+T = TypeVar("T")
+
+
 class LLM(BaseModel):
     config: LLMSettings = Field(...)
     model: str = Field(...)
@@ -15,13 +58,33 @@ class LLM(BaseModel):
     base_url: Optional[str] = Field(None)
     max_tokens: int = Field(1000)
     temperature: float = Field(0.7)
+    max_connections: int = Field(100)
+    keepalive_timeout: float = Field(60.0)
+    requests_per_minute: int = Field(0)
+    tokens_per_minute: int = Field(0)
+    max_concurrent_requests: int = Field(16)
+    max_retries: int = Field(5)
+    retry_base_delay: float = Field(1.0)
+    retry_max_delay: float = Field(60.0)
+    response_cache: str = Field("off")
+    response_cache_path: str = Field("workspace/llm_cache.db")
+    response_cache_max_mb: int = Field(512)
+    prompt_price: Optional[float] = Field(None)
+    completion_price: Optional[float] = Field(None)
+    stream_sink: str = Field("console")
+    stream_dir: str = Field("workspace/streams")
+    stream_batch_chars: int = Field(256)
+    stream_flush_interval: float = Field(0.2)
+    max_format_retries: int = Field(2)
+    hedge_candidates: int = Field(1)
+    hedge_delay: float = Field(0.0)
+    hedge_percentile: float = Field(0.9)
 
-    @model_validator(mode="after")
-    def initialize_openai(self) -> "LLM":
-        openai.api_key = self.api_key
-        if self.base_url:
-            openai.api_base = self.base_url
-        return self
+    _rate_limiter: Optional[RateLimiter] = PrivateAttr(None)
+    _response_cache: Optional[ResponseCache] = PrivateAttr(None)
+    _sink: Optional[StreamSink] = PrivateAttr(None)
+    _session: Optional[aiohttp.ClientSession] = PrivateAttr(None)
+    _session_loop: Optional[asyncio.AbstractEventLoop] = PrivateAttr(None)
 
     def __init__(self, llm_config: Optional[LLMSettings] = None, **data):
         if llm_config is None:
@@ -34,51 +97,559 @@ class LLM(BaseModel):
             base_url=llm_config.base_url,
             max_tokens=llm_config.max_tokens,
             temperature=llm_config.temperature,
-            **data
+            max_connections=llm_config.max_connections,
+            keepalive_timeout=llm_config.keepalive_timeout,
+            requests_per_minute=llm_config.requests_per_minute,
+            tokens_per_minute=llm_config.tokens_per_minute,
+            max_concurrent_requests=llm_config.max_concurrent_requests,
+            max_retries=llm_config.max_retries,
+            retry_base_delay=llm_config.retry_base_delay,
+            retry_max_delay=llm_config.retry_max_delay,
+            response_cache=llm_config.response_cache,
+            response_cache_path=llm_config.response_cache_path,
+            response_cache_max_mb=llm_config.response_cache_max_mb,
+            prompt_price=llm_config.prompt_price,
+            completion_price=llm_config.completion_price,
+            stream_sink=llm_config.stream_sink,
+            stream_dir=llm_config.stream_dir,
+            stream_batch_chars=llm_config.stream_batch_chars,
+            stream_flush_interval=llm_config.stream_flush_interval,
+            max_format_retries=llm_config.max_format_retries,
+            hedge_candidates=llm_config.hedge_candidates,
+            hedge_delay=llm_config.hedge_delay,
+            hedge_percentile=llm_config.hedge_percentile,
+            **data,
+        )
+        # Clients of the same endpoint and key share one quota
+        self._rate_limiter = RateLimiter.shared(
+            (self.base_url, self.model, self.api_key),
+            requests_per_minute=self.requests_per_minute,
+            tokens_per_minute=self.tokens_per_minute,
+            max_concurrent_requests=self.max_concurrent_requests,
+        )
+        if self.response_cache not in CACHE_MODES:
+            raise ValueError(f"Unknown response cache mode: {self.response_cache}")
+        if self.response_cache != "off":
+            self._response_cache = ResponseCache.shared(
+                self.response_cache_path, self.response_cache_max_mb * 1024 * 1024
+            )
+        self._sink = create_sink(self.stream_sink, self.stream_dir)
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        return self._rate_limiter
+
+    @property
+    def cache(self) -> Optional[ResponseCache]:
+        return self._response_cache
+
+    @property
+    def sink(self) -> StreamSink:
+        """Default destination of streamed replies."""
+        return self._sink
+
+    def _stream_writer(
+        self, sink: Optional[StreamSink], stream_id: str
+    ) -> StreamWriter:
+        return StreamWriter(
+            sink or self._sink,
+            stream_id,
+            batch_chars=self.stream_batch_chars,
+            flush_interval=self.stream_flush_interval,
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the pooled HTTP session owned by this instance.
+
+        The session is created lazily on the running event loop and reused by
+        every subsequent request, so connections stay warm across calls.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._session is None
+            or self._session.closed
+            or self._session_loop is not loop
+        ):
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session and release its connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying after `error`, or None if the error
+        is not retryable or the retries are exhausted.
+        """
+        if isinstance(error, openai.error.APIError) and not isinstance(
+            error, RETRYABLE_ERRORS
+        ):
+            # Only server-side failures of generic API errors are transient
+            if error.http_status is not None and error.http_status < 500:
+                return None
+        elif not isinstance(error, RETRYABLE_ERRORS):
+            return None
+        if attempt >= self.max_retries:
+            return None
+
+        delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay)
+        retry_after = parse_retry_after(getattr(error, "headers", None))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if isinstance(error, openai.error.RateLimitError):
+            # Hold back every request sharing the quota, not just this one
+            self._rate_limiter.stats["rate_limited"] += 1
+            self._rate_limiter.pause(delay)
+        return delay
+
+    async def _request(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool,
+        sink: Optional[StreamSink] = None,
+        stream_id: str = "llm",
+        parser: Optional[StreamParser] = None,
+    ) -> Tuple[str, Optional[Dict]]:
+        """
+        Send a single chat completion request and collect the reply.
+
+        Streamed replies run through `parser` while they arrive, which drops
+        thinking blocks and reports completed tags, and the remaining text
+        is passed on to `sink` (default: the configured sink) in batches.
+
+        Returns:
+            Tuple[str, Optional[Dict]]: The reply and the provider's token
+                usage, if it reported one.
+
+        Raises:
+            MalformedResponseError: If the parser's validator rejects the
+                reply; a streamed reply is aborted as soon as it does.
+        """
+        # Route the request through this instance's session and credentials
+        # instead of the module-global openai state.
+        span = current_span.get()
+        start = time.perf_counter()
+        session_token = openai.aiosession.set(self._get_session())
+        try:
+            response = await openai.ChatCompletion.acreate(
+                api_key=self.api_key,
+                api_base=self.base_url,
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=stream,
+            )
+        finally:
+            openai.aiosession.reset(session_token)
+
+        parser = parser or StreamParser()
+        if not stream:
+            if span is not None:
+                span.set(ttft_ms=(time.perf_counter() - start) * 1000)
+            text = response["choices"][0]["message"]["content"].strip()
+            parse_start = time.perf_counter()
+            try:
+                parser.parse(text)
+            except MalformedResponseError as e:
+                e.partial = text
+                raise
+            finally:
+                if span is not None:
+                    span.add("parser_ms", (time.perf_counter() - parse_start) * 1000)
+            return text, response.get("usage")
+
+        # Handle streaming response, keeping only the text of each chunk
+        collected_messages = []
+        usage = None
+        first_token_at = None
+        parse_seconds = 0.0
+        parser.reset()
+        try:
+            async with self._stream_writer(sink, stream_id) as writer:
+                async for chunk in response:
+                    # Some providers report usage on the final chunk
+                    usage = chunk.get("usage") or usage
+                    if not chunk["choices"]:
+                        continue
+                    chunk_message = (
+                        chunk["choices"][0].get("delta", {}).get("content") or ""
+                    )
+                    if chunk_message and first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    collected_messages.append(chunk_message)
+                    parse_start = time.perf_counter()
+                    text = parser.feed(chunk_message)
+                    parse_seconds += time.perf_counter() - parse_start
+                    await writer.write(text)
+                await writer.write(parser.close())
+        except MalformedResponseError as e:
+            # Closing the stream drops the connection, so the provider stops
+            # generating the rest of a reply that cannot be used
+            e.partial = "".join(collected_messages)
+            await response.aclose()
+            raise
+        except asyncio.CancelledError:
+            # A cancelled reply, e.g. of a hedged request that lost the race,
+            # was still generated up to here
+            await response.aclose()
+            self._record_usage(
+                sum(count_tokens(m["content"], self.model) for m in messages),
+                count_tokens("".join(collected_messages), self.model),
+            )
+            raise
+        finally:
+            if span is not None:
+                if first_token_at is not None:
+                    span.set(ttft_ms=(first_token_at - start) * 1000)
+                span.add("parser_ms", parse_seconds * 1000)
+        return "".join(collected_messages).strip(), usage
+
+    async def _request_with_retry(
+        self,
+        messages: List[Dict[str, str]],
+        prompt_tokens: int,
+        stream: bool,
+        sink: Optional[StreamSink] = None,
+        stream_id: str = "llm",
+        parser: Optional[StreamParser] = None,
+    ) -> Tuple[str, Optional[Dict]]:
+        """Send a request through the rate limiter, retrying transient errors."""
+        span = current_span.get()
+        attempt = 0
+        while True:
+            wait_start = time.perf_counter()
+            async with self._rate_limiter.request(
+                prompt_tokens + self.max_tokens
+            ) as reservation:
+                if span is not None:
+                    span.add("queue_ms", (time.perf_counter() - wait_start) * 1000)
+                try:
+                    response, usage = await self._request(
+                        messages, stream, sink, stream_id, parser
+                    )
+                except MalformedResponseError as e:
+                    # The reply was generated up to the abort
+                    reservation.settle(prompt_tokens + estimate_tokens(e.partial))
+                    raise
+                except Exception as e:
+                    reservation.settle(0)
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    logger.warning(
+                        f"LLM request failed ({type(e).__name__}: {e}), "
+                        f"retrying in {delay:.1f}s "
+                        f"(attempt {attempt + 1}/{self.max_retries})"
+                    )
+                else:
+                    reservation.settle(
+                        usage["total_tokens"]
+                        if usage and usage.get("total_tokens")
+                        else prompt_tokens + estimate_tokens(response)
+                    )
+                    return response, usage
+
+            # Back off outside the limiter so waiting does not hold a slot
+            self._rate_limiter.stats["retries"] += 1
+            if span is not None:
+                span.add("retries", 1)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _record_usage(
+        self, prompt_tokens: int, completion_tokens: int, cached: bool = False
+    ) -> None:
+        """Attribute a call to the cost tracker and stage of the caller."""
+        span = current_span.get()
+        if span is not None and span.category == "llm":
+            span.add("prompt_tokens", prompt_tokens)
+            span.add("completion_tokens", completion_tokens)
+        scope = usage_scope.get()
+        if scope is None:
+            return
+        prompt_price, completion_price = model_price(self.model)
+        if self.prompt_price is not None:
+            prompt_price = self.prompt_price
+        if self.completion_price is not None:
+            completion_price = self.completion_price
+        cost = (
+            prompt_tokens * prompt_price + completion_tokens * completion_price
+        ) / 1_000_000
+        scope.tracker.add_usage(
+            scope.stage, prompt_tokens, completion_tokens, cost, cached=cached
+        )
+
+    def _cache_key(self, system_prompt: str, prompt: str) -> str:
+        return cache_key(
+            self.model, system_prompt, prompt, self.temperature, self.max_tokens
         )
 
     @filter_thinking_blocks()
     async def ask(
-        self, prompt: str, stream: bool = True, system_prompt: str = SYSTEM_PROMPT
+        self,
+        prompt: str,
+        stream: bool = True,
+        system_prompt: str = SYSTEM_PROMPT,
+        sink: Optional[StreamSink] = None,
+        stream_id: Optional[str] = None,
+        parser: Optional[StreamParser] = None,
+        use_cache: bool = True,
     ) -> str:
         """
         Send a prompt to the LLM and get the response.
 
+        Requests pass through the shared rate limiter, and throttled or
+        transient failures are retried with jittered exponential backoff.
+        With the response cache enabled, identical requests are answered from
+        disk; in replay mode a cache miss raises instead of calling the API.
+
         Args:
             prompt (str): The prompt to send
             stream (bool): Whether to stream the response
             system_prompt (str): The system prompt to send
+            sink (Optional[StreamSink]): Where to stream the reply, defaults
+                to the configured sink
+            stream_id (Optional[str]): Name of the stream, defaults to the
+                current stage and a sequence number
+            parser (Optional[StreamParser]): Parser fed with the reply as it
+                arrives, e.g. to act on outline tags before the reply ends.
+                A retried request restarts the parser. If the parser has a
+                validator, a reply it rejects is aborted and requested again
+                with the validator's correction appended to the prompt, up to
+                `max_format_retries` times.
+            use_cache (bool): Whether to use the response cache, if enabled
 
         Returns:
             str: The generated response
+
+        Raises:
+            LLMCacheMissError: In replay mode, if the response is not cached.
+            MalformedResponseError: If the format retries are exhausted.
         """
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": prompt})
-
-        response = await openai.ChatCompletion.acreate(
-            model=self.model,
-            messages=messages,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
+        if stream_id is None:
+            scope = usage_scope.get()
+            stream_id = f"{scope.stage if scope else 'llm'}_{next(_stream_ids)}"
+
+        with trace_span(
+            "llm",
+            "llm",
+            stream_id=stream_id,
             stream=stream,
-        )
+            prompt_chars=len(system_prompt) + len(prompt),
+        ) as span:
+            parser = parser or StreamParser()
+            key = None
+            if self._response_cache is not None and use_cache:
+                key = self._cache_key(system_prompt, prompt)
+                cached = self._response_cache.get(key)
+                if cached is not None:
+                    try:
+                        text = parser.parse(cached)
+                    except MalformedResponseError as e:
+                        # Cached before its stage validated replies
+                        if self.response_cache == "replay":
+                            raise
+                        logger.warning(f"Ignoring cached reply for {stream_id}: {e}")
+                    else:
+                        self._record_usage(0, 0, cached=True)
+                        if span is not None:
+                            span.set(cached=True, completion_chars=len(cached))
+                        if stream:
+                            async with self._stream_writer(sink, stream_id) as writer:
+                                await writer.write(text)
+                        return cached
+                elif self.response_cache == "replay":
+                    raise LLMCacheMissError(key)
 
-        if not stream:
-            return response["choices"][0]["message"]["content"].strip()
+            request_prompt = prompt
+            for attempt in itertools.count():
+                messages = []
+                if system_prompt:
+                    messages.append({"role": "system", "content": system_prompt})
+                messages.append({"role": "user", "content": request_prompt})
 
-        # Handle streaming response
-        collected_chunks = []
-        collected_messages = []
+                prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(
+                    request_prompt
+                )
+                try:
+                    response, usage = await self._request_with_retry(
+                        messages, prompt_tokens, stream, sink, stream_id, parser
+                    )
+                except MalformedResponseError as e:
+                    self._record_usage(
+                        count_tokens(system_prompt, self.model)
+                        + count_tokens(request_prompt, self.model),
+                        count_tokens(e.partial, self.model),
+                    )
+                    if attempt >= self.max_format_retries:
+                        raise
+                    logger.warning(
+                        f"Aborted {stream_id} after {len(e.partial)} characters "
+                        f"({e.reason}), retrying with a format reminder "
+                        f"(attempt {attempt + 1}/{self.max_format_retries})"
+                    )
+                    request_prompt = (
+                        f"{prompt}\n\n注意：你上一次的回复格式不正确。"
+                        f"{parser.validator.correction}"
+                    )
+                    continue
+                break
+
+            if usage:
+                self._record_usage(usage["prompt_tokens"], usage["completion_tokens"])
+            else:
+                # Streamed replies usually carry no usage; count them locally
+                self._record_usage(
+                    count_tokens(system_prompt, self.model)
+                    + count_tokens(request_prompt, self.model),
+                    count_tokens(response, self.model),
+                )
+            if key is not None:
+                # Stored under the original prompt, so a replay skips the retries
+                self._response_cache.put(key, response)
+            if span is not None:
+                span.set(completion_chars=len(response), format_retries=attempt)
+            return response
+
+    def _hedge_after(self, stream_id: str) -> float:
+        """Seconds a hedged request may run before the next candidate starts."""
+        if self.hedge_delay <= 0:
+            return 0.0
+        latencies = sorted(_hedge_latencies[(self.model, stream_id)])
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return self.hedge_delay
+        index = min(int(len(latencies) * self.hedge_percentile), len(latencies) - 1)
+        return latencies[index]
+
+    async def ask_first_valid(
+        self,
+        prompt: str,
+        accept: Callable[[str], T],
+        stream_id: str,
+        candidates: Optional[int] = None,
+        system_prompt: str = SYSTEM_PROMPT,
+        sink: Optional[StreamSink] = None,
+        parser_factory: Optional[Callable[[int], StreamParser]] = None,
+    ) -> T:
+        """
+        Ask for a reply `accept` can parse, hedging against slow or bad replies.
+
+        Up to `candidates` (default: `hedge_candidates`) requests for the same
+        prompt are made. With `hedge_delay` 0 they all start at once;
+        otherwise the next one starts once the running ones take longer than
+        `hedge_percentile` of this stream's recent latencies (`hedge_delay`
+        until enough are known), or as soon as one fails. The first reply
+        `accept` parses wins and the other requests are cancelled.
+
+        Args:
+            prompt (str): The prompt to send
+            accept (Callable[[str], T]): Parses a reply, raising if it cannot
+            stream_id (str): Name of the stream; later candidates add a suffix
+            candidates (Optional[int]): Maximum number of requests
+            system_prompt (str): The system prompt to send
+            sink (Optional[StreamSink]): Where to stream the replies
+            parser_factory (Optional[Callable[[int], StreamParser]]): Parser
+                of the candidate with the given index
+
+        Returns:
+            T: The parsed reply of the winning candidate.
+
+        Raises:
+            Exception: The error of the first candidate, if all of them fail.
+        """
+        candidates = candidates or self.hedge_candidates
+        parser_factory = parser_factory or (lambda index: StreamParser())
+
+        key = None
+        if self._response_cache is not None:
+            key = self._cache_key(system_prompt, prompt)
+            if self.response_cache == "replay" or self._response_cache.get(key):
+                candidates = 1
+        if candidates <= 1:
+            response = await self.ask(
+                prompt,
+                system_prompt=system_prompt,
+                sink=sink,
+                stream_id=stream_id,
+                parser=parser_factory(0),
+            )
+            with trace_span("parse", "parse", stream_id=stream_id):
+                return accept(response)
+
+        async def candidate(index: int) -> Tuple[str, T, float]:
+            start = time.monotonic()
+            response = await self.ask(
+                prompt,
+                system_prompt=system_prompt,
+                sink=sink,
+                stream_id=stream_id if index == 0 else f"{stream_id}_hedge{index}",
+                parser=parser_factory(index),
+                # Only the winning reply may be cached
+                use_cache=False,
+            )
+            with trace_span("parse", "parse", stream_id=stream_id, candidate=index):
+                value = accept(response)
+            return response, value, time.monotonic() - start
 
-        async for chunk in response:
-            collected_chunks.append(chunk)  # save the chunk
-            chunk_message = chunk["choices"][0].get("delta", {}).get("content", "")
-            collected_messages.append(chunk_message)
+        hedge_after = self._hedge_after(stream_id)
+        pending: Set[asyncio.Task] = set()
+        errors: List[Exception] = []
 
-            # Print the chunk directly to console
-            print(chunk_message, end="", flush=True)
+        def launch() -> None:
+            pending.add(asyncio.create_task(candidate(len(pending) + len(errors))))
 
-        print()
-        return "".join(collected_messages).strip()
+        try:
+            launch()
+            while hedge_after <= 0 and len(pending) < candidates:
+                launch()
+            while pending:
+                started = len(pending) + len(errors)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=hedge_after if started < candidates else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    logger.info(
+                        f"{stream_id} is slower than {hedge_after:.1f}s, "
+                        f"starting candidate {started + 1}/{candidates}"
+                    )
+                    launch()
+                    continue
+                winner = None
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.warning(
+                            f"Candidate of {stream_id} failed "
+                            f"({type(e).__name__}: {e})"
+                        )
+                    else:
+                        winner = winner or result
+                if winner is not None:
+                    response, value, latency = winner
+                    _hedge_latencies[(self.model, stream_id)].append(latency)
+                    if key is not None:
+                        self._response_cache.put(key, response)
+                    return value
+                if started < candidates:
+                    # Replace the failed candidate right away
+                    launch()
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
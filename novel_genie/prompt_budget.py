@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Tuple
+
+from pydantic import BaseModel, Field
+
+from novel_genie.config import config
+from novel_genie.cost import count_tokens
+from novel_genie.logger import logger
+
+
+ELLIPSIS = "……"
+
+
+class PromptSection(BaseModel):
+    """
+    A shrinkable part of a prompt, e.g. the sliding window of previous chapters.
+
+    Items are ordered oldest first. When the prompt is over budget, sections
+    with the lowest `priority` shrink first: their oldest items are dropped
+    down to `min_items`, then the remaining items are condensed to an excerpt
+    (`keep="tail"` keeps the end of the text, `keep="head"` the beginning).
+    """
+
+    name: str
+    items: List[str] = Field(default_factory=list)
+    priority: int = 0
+    min_items: int = 1
+    keep: str = "tail"
+    separator: str = "\n\n"
+
+    def render(self) -> str:
+        return self.separator.join(self.items)
+
+
+class PromptBudgeter(BaseModel):
+    """Fit prompts under an input-token ceiling by shrinking low-priority sections."""
+
+    max_input_tokens: int = Field(
+        default_factory=lambda: config.novel.max_prompt_tokens
+    )
+    min_section_tokens: int = Field(200)
+
+    @staticmethod
+    def _condense(text: str, tokens: int, target: int, keep: str) -> str:
+        """Cut `text` to roughly `target` tokens, keeping its head or tail."""
+        keep_chars = max(int(len(text) * target / max(tokens, 1)), 0)
+        if keep_chars >= len(text):
+            return text
+        if keep == "head":
+            return text[:keep_chars] + ELLIPSIS
+        return ELLIPSIS + text[len(text) - keep_chars :]
+
+    def fit(
+        self,
+        template: str,
+        sections: List[PromptSection],
+        model: str,
+        reserved_tokens: int = 0,
+        **fields: Any,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Format `template` with `fields` and `sections`, shrinking sections
+        until the prompt fits `max_input_tokens` (0 disables shrinking).
+
+        `reserved_tokens` counts toward the ceiling without being part of the
+        template, e.g. the system prompt sent along with it.
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: The prompt and per-section telemetry.
+        """
+        base_tokens = reserved_tokens + count_tokens(
+            template.format(**fields, **{section.name: "" for section in sections}),
+            model,
+        )
+        item_tokens = {
+            section.name: [count_tokens(item, model) for item in section.items]
+            for section in sections
+        }
+        telemetry: Dict[str, Any] = {
+            "base_tokens": base_tokens,
+            "max_input_tokens": self.max_input_tokens,
+            "sections": {
+                section.name: {
+                    "items_before": len(section.items),
+                    "tokens_before": sum(item_tokens[section.name]),
+                }
+                for section in sections
+            },
+        }
+
+        def total() -> int:
+            return base_tokens + sum(sum(tokens) for tokens in item_tokens.values())
+
+        telemetry["tokens_before"] = total()
+        if self.max_input_tokens > 0:
+            # Stable sort: sections of equal priority shrink in the given order
+            for section in sorted(sections, key=lambda s: s.priority):
+                tokens = item_tokens[section.name]
+                while total() > self.max_input_tokens and len(tokens) > max(
+                    section.min_items, 0
+                ):
+                    section.items.pop(0)
+                    tokens.pop(0)
+                for index in range(len(tokens)):
+                    overflow = total() - self.max_input_tokens
+                    if overflow <= 0:
+                        break
+                    if tokens[index] <= self.min_section_tokens:
+                        continue
+                    target = max(tokens[index] - overflow, self.min_section_tokens)
+                    section.items[index] = self._condense(
+                        section.items[index], tokens[index], target, section.keep
+                    )
+                    tokens[index] = count_tokens(section.items[index], model)
+                if total() <= self.max_input_tokens:
+                    break
+
+        for section in sections:
+            telemetry["sections"][section.name].update(
+                items_after=len(section.items),
+                tokens_after=sum(item_tokens[section.name]),
+            )
+        telemetry["tokens_after"] = total()
+
+        sizes = ", ".join(
+            f"{name}={stats['tokens_before']}->{stats['tokens_after']}"
+            for name, stats in telemetry["sections"].items()
+        )
+        message = (
+            f"Prompt {telemetry['tokens_before']}->{telemetry['tokens_after']} "
+            f"tokens (base {base_tokens}, limit {self.max_input_tokens}): {sizes}"
+        )
+        if telemetry["tokens_after"] < telemetry["tokens_before"]:
+            logger.info(message)
+        else:
+            logger.debug(message)
+        if 0 < self.max_input_tokens < telemetry["tokens_after"]:
+            logger.warning(
+                f"Prompt still exceeds {self.max_input_tokens} tokens after trimming"
+            )
+
+        prompt = template.format(
+            **fields, **{section.name: section.render() for section in sections}
+        )
+        return prompt, telemetry
@@ -0,0 +1,19 @@
+CHAPTER_SUMMARY_PROMPT = """
+# 网文章节摘要生成器
+根据用户输入的网文章节生成简明的章节摘要，供后续章节创作时回顾前情使用。
+
+# 用户输入
+## 网文章节：第{volume_num}卷 第{chapter_num}章
+{chapter}
+
+# 摘要要求
+1. 字数不超过{summary_word_count}字，使用第三人称叙述
+2. 按时间顺序概括本章的关键事件、冲突及其结果
+3. 写明出场的主要人物、人物关系与状态的变化（受伤、获得能力、立场转变等）
+4. 保留新出现的地点、物品、势力等专有名词以及埋下的伏笔
+5. 交代章末的悬念或人物所处的局面，便于下一章衔接
+6. 不要评价、不要续写，不要输出与章节无关的内容
+
+# 输出格式
+只输出摘要正文，不要输出标题或其他说明
+"""
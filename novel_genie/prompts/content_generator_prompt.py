@@ -153,6 +153,9 @@ CONTENT_GENERATOR_PROMPT_V2 = """
 
 ## 已有章节
 {existing_chapters}
+
+## 相关前文（检索自较早章节，注意与其中的人物、设定和伏笔保持一致）
+{story_memory}
 ---
 # 创作核心框架
 
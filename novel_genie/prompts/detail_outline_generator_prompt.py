@@ -192,6 +192,9 @@ DETAILED_OUTLINE_GENERATOR_PROMPT_V2 = """
 ## 已有的细纲
 {existing_detailed_outlines}
 
+## 相关前文（检索自较早章节的细纲，注意与其中的人物、设定和伏笔保持一致）
+{story_memory}
+
 # 输出格式
 请你以 <storyline> 标签的格式输出你撰写的网文细纲，包含10～30个情节点。
 
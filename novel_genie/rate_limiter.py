@@ -0,0 +1,212 @@
+import asyncio
+import random
+import re
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Mapping, Optional, Tuple
+
+from novel_genie.logger import logger
+
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of `text` without a tokenizer.
+
+    CJK characters count as one token each and everything else as one token
+    per four characters, which errs on the high side for both.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds to wait according to `Retry-After` style response headers."""
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+    for key, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        value = headers.get(key)
+        if value is None:
+            continue
+        try:
+            return max(float(value) / scale, 0.0)
+        except ValueError:
+            # HTTP-date values are rare for LLM APIs; fall back to backoff
+            continue
+    return None
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff for the given zero-based attempt."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket of `capacity` units per minute.
+
+    Acquiring takes the units immediately and lets the balance go negative;
+    callers then sleep until the debt is repaid. This queues concurrent
+    callers in arrival order instead of letting small requests starve large
+    ones.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take `amount` units, waiting as long as needed. Returns the wait."""
+        # A request larger than the bucket would otherwise never be admitted
+        amount = min(amount, self.capacity)
+        self._refill()
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        wait = -self.tokens / self.rate
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.refund(amount)
+            raise
+        return wait
+
+    def refund(self, amount: float) -> None:
+        """Return units that were reserved but not used."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side admission control for an LLM endpoint.
+
+    Combines a requests-per-minute bucket, a tokens-per-minute bucket and a
+    cap on in-flight requests. A rate-limit response pauses every caller
+    sharing the limiter until the provider's `Retry-After` has passed.
+    Limits of 0 disable the corresponding check.
+    """
+
+    _shared: Dict[Tuple, "RateLimiter"] = {}
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrent_requests: int = 0,
+    ):
+        self.max_concurrent_requests = max_concurrent_requests
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        )
+        self._paused_until = 0.0
+        # asyncio semaphores are bound to the loop they are first used on
+        self._semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "throttled_seconds": 0.0,
+            "in_flight": 0,
+        }
+
+    @classmethod
+    def shared(
+        cls,
+        key: Tuple,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrent_requests: int = 0,
+    ) -> "RateLimiter":
+        """
+        Limiter shared by every client of the same endpoint and credentials,
+        so parallel generators draw on one quota.
+        """
+        key = key + (requests_per_minute, tokens_per_minute, max_concurrent_requests)
+        if key not in cls._shared:
+            cls._shared[key] = cls(
+                requests_per_minute, tokens_per_minute, max_concurrent_requests
+            )
+        return cls._shared[key]
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.max_concurrent_requests <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent_requests)
+        return self._semaphores[loop]
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all new requests for `seconds`."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def _wait_for_pause(self) -> float:
+        waited = 0.0
+        while (remaining := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+            waited += remaining
+        return waited
+
+    @asynccontextmanager
+    async def request(self, estimated_tokens: int) -> AsyncIterator["Reservation"]:
+        """
+        Admit one request expected to consume `estimated_tokens`.
+
+        The yielded reservation can be settled with the actual usage once it
+        is known, returning the unused part of the estimate to the bucket.
+        """
+        semaphore = self._semaphore()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            throttled = await self._wait_for_pause()
+            if self.request_bucket is not None:
+                throttled += await self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                throttled += await self.token_bucket.acquire(estimated_tokens)
+            if throttled:
+                logger.debug(f"Rate limiter delayed request by {throttled:.2f}s")
+            self.stats["throttled_seconds"] += throttled
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+            reservation = Reservation(self, estimated_tokens)
+            try:
+                yield reservation
+            finally:
+                self.stats["in_flight"] -= 1
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+
+class Reservation:
+    """Tokens reserved for a single admitted request."""
+
+    def __init__(self, limiter: RateLimiter, estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def settle(self, used_tokens: int) -> None:
+        """Correct the token bucket by the difference to the actual usage."""
+        bucket = self.limiter.token_bucket
+        if bucket is not None:
+            # A negative refund charges usage beyond the estimate
+            bucket.refund(self.estimated_tokens - used_tokens)
+        self.estimated_tokens = used_tokens
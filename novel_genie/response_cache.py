@@ -0,0 +1,138 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from novel_genie.logger import logger
+
+
+CACHE_MODES = ("off", "on", "replay")
+
+
+def cache_key(
+    model: str,
+    system_prompt: Optional[str],
+    prompt: str,
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    """Content address of a request: everything that determines the reply."""
+    payload = json.dumps(
+        [model, system_prompt or "", prompt, temperature, max_tokens],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded on-disk LRU cache of raw LLM responses.
+
+    Entries live in a single SQLite database keyed by `cache_key`. Reads bump
+    an entry's last-use time, and once the stored responses exceed
+    `max_bytes` the least recently used ones are evicted.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+    """
+
+    _shared: Dict[str, "ResponseCache"] = {}
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    @classmethod
+    def shared(cls, path: str, max_bytes: int) -> "ResponseCache":
+        """One cache instance per database file within the process."""
+        key = str(Path(path).resolve())
+        if key not in cls._shared:
+            cls._shared[key] = cls(path, max_bytes)
+        return cls._shared[key]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for `key`, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        self.stats["hits"] += 1
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response, evicting least recently used entries if needed."""
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            previous = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self.stats["writes"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats["evictions"] += len(evicted)
+        logger.debug(f"Evicted {len(evicted)} cached LLM responses")
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+            self._total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+        self._shared.pop(str(Path(self.path).resolve()), None)
@@ -0,0 +1,214 @@
+import asyncio
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from pydantic import BaseModel, Field
+
+from novel_genie.logger import logger
+
+
+class TaskNode(BaseModel):
+    """A single generation stage with its declared dependencies."""
+
+    node_id: str
+    func: Callable[[], Awaitable[Any]]
+    deps: List[str] = Field(default_factory=list)
+
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    status: str = "pending"  # pending | running | done | skipped | failed | cancelled
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class TaskGraph(BaseModel):
+    """
+    Dependency graph of generation stages executed by an asyncio scheduler.
+
+    Every node starts as soon as all of its dependencies have finished, with
+    at most `max_concurrency` nodes running at the same time. Nodes listed as
+    already completed (e.g. restored from a checkpoint) are skipped.
+    """
+
+    nodes: Dict[str, TaskNode] = Field(default_factory=dict)
+    max_concurrency: int = Field(4, ge=1)
+
+    def add_node(
+        self,
+        node_id: str,
+        func: Callable[[], Awaitable[Any]],
+        deps: Optional[Iterable[Optional[str]]] = None,
+    ) -> TaskNode:
+        """
+        Register a node. `None` entries in `deps` are ignored for convenience.
+
+        Raises:
+            ValueError: If a node with the same id already exists.
+        """
+        if node_id in self.nodes:
+            raise ValueError(f"Duplicate task node: {node_id}")
+        node = TaskNode(
+            node_id=node_id, func=func, deps=[dep for dep in deps or [] if dep]
+        )
+        self.nodes[node_id] = node
+        return node
+
+    def validate_graph(self) -> None:
+        """
+        Check that every dependency exists and that the graph is acyclic.
+
+        Raises:
+            ValueError: If a dependency is unknown or a cycle is detected.
+        """
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"Node {node.node_id} depends on unknown {dep}")
+
+        visiting: Set[str] = set()
+        visited: Set[str] = set()
+        for root in self.nodes:
+            if root in visited:
+                continue
+            stack = [(root, iter(self.nodes[root].deps))]
+            visiting.add(root)
+            while stack:
+                node_id, deps = stack[-1]
+                dep = next(deps, None)
+                if dep is None:
+                    stack.pop()
+                    visiting.discard(node_id)
+                    visited.add(node_id)
+                elif dep in visiting:
+                    raise ValueError(f"Cycle detected at task node {dep}")
+                elif dep not in visited:
+                    visiting.add(dep)
+                    stack.append((dep, iter(self.nodes[dep].deps)))
+
+    def timings(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-node status and timing information."""
+        return {
+            node_id: {
+                "status": node.status,
+                "started_at": node.started_at,
+                "finished_at": node.finished_at,
+                "duration": node.duration,
+            }
+            for node_id, node in self.nodes.items()
+        }
+
+    async def run(
+        self,
+        completed: Optional[Set[str]] = None,
+        drain_on: Tuple[Type[BaseException], ...] = (),
+    ) -> Set[str]:
+        """
+        Execute all nodes respecting dependencies and the concurrency limit.
+
+        Args:
+            completed: Ids of nodes that are already done. Finished node ids
+                are added to this set as the run progresses.
+            drain_on: Exception types that stop the run gracefully: no new
+                nodes are started, but running ones are allowed to finish
+                before the exception is re-raised.
+
+        Returns:
+            Set[str]: Ids of all completed nodes.
+
+        Raises:
+            Exception: The first exception raised by a node; all other running
+                nodes are cancelled.
+        """
+        self.validate_graph()
+        completed = completed if completed is not None else set()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        pending: Dict[str, Set[str]] = {}
+        for node_id, node in self.nodes.items():
+            if node_id in completed:
+                node.status = "skipped"
+            else:
+                pending[node_id] = set(node.deps) - completed
+
+        running: Dict[asyncio.Task, str] = {}
+        stop_error: Optional[BaseException] = None
+
+        def launch_ready() -> None:
+            if stop_error is not None:
+                return
+            for node_id in [n for n, deps in pending.items() if not deps]:
+                del pending[node_id]
+                task = asyncio.create_task(
+                    self._run_node(self.nodes[node_id], semaphore)
+                )
+                running[task] = node_id
+
+        launch_ready()
+        try:
+            while running:
+                finished, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    node_id = running.pop(task)
+                    error = None if task.cancelled() else task.exception()
+                    if isinstance(error, drain_on):
+                        if stop_error is None:
+                            stop_error = error
+                            logger.warning(
+                                f"Stopping after {len(running)} running nodes: {error}"
+                            )
+                        continue
+                    task.result()
+                    completed.add(node_id)
+                    for deps in pending.values():
+                        deps.discard(node_id)
+                launch_ready()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        if stop_error is not None:
+            raise stop_error
+        if pending:
+            raise RuntimeError(f"Unreachable task nodes: {sorted(pending)}")
+        return completed
+
+    @staticmethod
+    async def _run_node(node: TaskNode, semaphore: asyncio.Semaphore) -> Any:
+        async with semaphore:
+            node.status = "running"
+            node.started_at = time.perf_counter()
+            try:
+                result = await node.func()
+            except asyncio.CancelledError:
+                node.status = "cancelled"
+                raise
+            except BaseException:
+                node.status = "failed"
+                logger.error(f"Task node {node.node_id} failed")
+                raise
+            finally:
+                node.finished_at = time.perf_counter()
+            node.status = "done"
+            logger.debug(f"Task node {node.node_id} finished in {node.duration:.2f}s")
+            return result
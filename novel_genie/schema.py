@@ -1,11 +1,19 @@
-import json
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 
 from novel_genie.config import config
+from novel_genie.storage import (
+    BackgroundWriter,
+    FileStorage,
+    SQLiteStorage,
+    StatePath,
+    StorageBackend,
+    apply_write,
+    to_dict,
+)
 
 
 class OutlineType(str, Enum):
@@ -68,6 +76,8 @@ class Chapter(BaseModel):
 
     title: str = Field(..., min_length=1)
     content: str = Field(..., min_length=100)
+    optimized: bool = False
+    summary: Optional[str] = None
 
     def __str__(self):
         return f"{self.title}\n\n{self.content}"
@@ -80,6 +90,7 @@ class NovelVolume(BaseModel):
     chapter_outlines: List[Optional[ChapterOutline]] = Field(default_factory=list)
     detailed_outlines: List[Optional[DetailedOutline]] = Field(default_factory=list)
     chapters: List[Optional[Chapter]] = Field(default_factory=list)
+    prev_volume_summary: Optional[str] = None
 
 
 class NovelIntent(BaseModel):
@@ -110,69 +121,131 @@ class Novel(BaseModel):
 
 
 class NovelSaver(BaseModel):
-    """Novel saving and loading utility with organized directory structure."""
+    """Novel saving and loading utility backed by a pluggable storage backend."""
 
     base_dir: str = Field(default_factory=lambda: config.novel.workspace)
+    storage_backend: str = Field(default_factory=lambda: config.novel.storage_backend)
+    compact_interval: int = Field(
+        default_factory=lambda: config.novel.checkpoint_compact_interval
+    )
+    write_queue_size: int = Field(
+        default_factory=lambda: config.novel.checkpoint_queue_size
+    )
+    backend: Optional[StorageBackend] = Field(None, exclude=True)
+
+    _writer: Optional[BackgroundWriter] = PrivateAttr(None)
+    _journal_sizes: Dict[str, int] = PrivateAttr(default_factory=dict)
 
     class Config:
         arbitrary_types_allowed = True
 
     @model_validator(mode="after")
     def validate_structure(self) -> "NovelSaver":
-        """Ensure required subdirectory structure exists."""
+        """Ensure the workspace exists and set up the storage backend."""
         base_path = Path(self.base_dir)
         if not base_path.exists():
             raise ValueError(f"Base directory {self.base_dir} does not exist")
+        if self.backend is None:
+            if self.storage_backend == "file":
+                self.backend = FileStorage(self.base_dir)
+            elif self.storage_backend == "sqlite":
+                self.backend = SQLiteStorage(str(base_path / "novels.db"))
+            else:
+                raise ValueError(f"Unknown storage backend: {self.storage_backend}")
+        if self.write_queue_size > 0:
+            self._writer = BackgroundWriter(self.backend, self.write_queue_size)
         return self
 
-    def _ensure_dirs(self, novel_id: str) -> Dict[str, Path]:
-        """Ensure all required directories exist and return their paths."""
-        novel_dir = Path(self.base_dir) / novel_id
-        dirs = {
-            "novel": novel_dir,
-            "novel_content": novel_dir / "novel",
-            "checkpoints": novel_dir / "checkpoints",
-        }
-        for path in dirs.values():
-            path.mkdir(parents=True, exist_ok=True)
-        return dirs
+    def _write(self, method: str, *args: Any) -> None:
+        """Run a backend write on the background writer, or inline without one."""
+        if self._writer is not None:
+            self._writer.submit(method, *args)
+        else:
+            apply_write(self.backend, method, args)
+
+    def flush(self) -> None:
+        """Wait until all queued writes are persisted."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        """Flush pending writes, stop the background writer and close the backend."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.backend.close()
+
+    def write_stats(self) -> Dict[str, Any]:
+        """Write latency and queue depth of the background writer."""
+        if self._writer is None:
+            return {}
+        return {**self._writer.stats, "queue_depth": self._writer.queue_depth}
 
     def save_checkpoint(self, novel_id: str, novel_data: Dict) -> None:
-        """Save novel generation checkpoint."""
-        checkpoint_path = self._ensure_dirs(novel_id)["checkpoints"] / "checkpoint.json"
-
-        def to_dict(data):
-            if isinstance(data, BaseModel):
-                return data.model_dump()
-            elif isinstance(data, dict):
-                return {k: to_dict(v) for k, v in data.items()}
-            elif isinstance(data, list):
-                return [to_dict(item) for item in data]
-            return data
-
-        checkpoint_path.write_text(
-            json.dumps(to_dict(novel_data), ensure_ascii=False, indent=2),
-            encoding="utf-8",
+        """Save a full snapshot of the novel state, compacting any journal."""
+        # Convert on the caller's side so the snapshot reflects the state now
+        self._write("save_snapshot", novel_id, to_dict(novel_data))
+        self._journal_sizes[novel_id] = 0
+
+    def compact(self, novel_id: str) -> None:
+        """Fold the journal into the snapshot, rewriting only what changed."""
+        self._write("compact", novel_id)
+        self._journal_sizes[novel_id] = 0
+
+    def append_journal(self, novel_id: str, path: StatePath, value: Any) -> None:
+        """
+        Persist a single stage result.
+
+        Args:
+            novel_id: The novel the record belongs to.
+            path: Location of the value in the checkpoint state, e.g.
+                ["volumes", 0, "chapters", 2].
+            value: The stage result stored at `path`.
+        """
+        self._write("save_record", novel_id, path, to_dict(value))
+        if self.backend.uses_journal:
+            self._journal_sizes[novel_id] = self.journal_size(novel_id) + 1
+
+    def journal_size(self, novel_id: str) -> int:
+        """Number of records appended since the last snapshot."""
+        if novel_id not in self._journal_sizes:
+            self.flush()
+            self._journal_sizes[novel_id] = self.backend.pending_records(novel_id)
+        return self._journal_sizes[novel_id]
+
+    def needs_compaction(self, novel_id: str) -> bool:
+        """Whether the journal has grown enough to be folded into a snapshot."""
+        return (
+            self.backend.uses_journal
+            and self.journal_size(novel_id) >= self.compact_interval
         )
 
     def save_chapter(
         self, novel_id: str, volume_num: int, chapter_num: int, chapter: Chapter
     ) -> None:
         """Save individual chapter content."""
-        volume_dir = (
-            self._ensure_dirs(novel_id)["novel_content"] / f"volume_{volume_num}"
+        self._write(
+            "save_chapter_text", novel_id, volume_num, chapter_num, str(chapter)
         )
-        volume_dir.mkdir(exist_ok=True)
-
-        chapter_path = volume_dir / f"chapter_{chapter_num}.txt"
-        chapter_path.write_text(str(chapter), encoding="utf-8")
 
     def load_checkpoint(self, novel_id: str) -> Optional[Dict]:
-        """Load existing checkpoint if available."""
-        checkpoint_path = self._ensure_dirs(novel_id)["checkpoints"] / "checkpoint.json"
-        if checkpoint_path.exists():
-            return json.loads(checkpoint_path.read_text(encoding="utf-8"))
-        return None
+        """Load the latest saved state of a novel."""
+        self.flush()
+        return self.backend.load_state(novel_id)
+
+    def list_novels(self) -> List[str]:
+        """Ids of all novels saved in the workspace."""
+        self.flush()
+        return self.backend.list_novels()
+
+    def load_latest_elements(
+        self, novel_id: str, volume_num: int, attribute_name: str, limit: int
+    ) -> List[Dict]:
+        """Load the last `limit` outlines or chapters of a volume."""
+        self.flush()
+        return self.backend.load_latest_elements(
+            novel_id, volume_num, attribute_name, limit
+        )
 
 
 def create_sample_novel():
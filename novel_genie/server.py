@@ -0,0 +1,283 @@
+import asyncio
+import json
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from aiohttp import web
+
+from novel_genie.batch import BatchJob, BatchStatus, JobRunner, _job_id
+from novel_genie.config import config
+from novel_genie.llm import LLM
+from novel_genie.logger import logger
+from novel_genie.schema import NovelSaver
+from novel_genie.stream_sink import BroadcastSink, StreamEvent, StreamSink
+
+
+# Job states in which a job will not change any more
+FINAL_STATUSES = ("done", "stopped", "failed")
+
+
+def _error(error: Type[web.HTTPException], message: str) -> web.HTTPException:
+    """HTTP error carrying `message` as a JSON body rather than as its reason."""
+    return error(
+        text=json.dumps({"error": message}, ensure_ascii=False),
+        content_type="application/json",
+    )
+
+
+class NovelService(JobRunner):
+    """
+    Long-running HTTP service generating novels as jobs.
+
+    One warm process keeps the pooled LLM connections and runs at most
+    `workers` jobs at once; further jobs wait in a queue. Jobs are recorded
+    in the `service` directory of the workspace, so jobs that were queued or
+    running when the service stopped are resumed when it starts again.
+
+    Endpoints:
+        POST /jobs                       Submit {"input": ..., "id": optional},
+                                         characters of the id other than
+                                         letters, digits, ".", "-" and "_"
+                                         are replaced with "_"
+        GET  /jobs                       All jobs
+        GET  /jobs/{job_id}              Status of a job
+        POST /jobs/{job_id}/retry        Run a failed or stopped job again
+        GET  /jobs/{job_id}/stream       Server-sent events of the replies,
+                                         `?stages=content` (default) or `all`
+        GET  /novels                     Ids of the saved novels
+        GET  /novels/{novel_id}          Checkpoint of a novel as JSON
+        GET  /novels/{novel_id}/text     Chapters of a novel as plain text
+
+    Args:
+        workers (Optional[int]): Jobs generated at once
+        status_path (Optional[str]): Job table, by default in the workspace
+        llm (Optional[LLM]): Client shared by the jobs
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        status_path: Optional[str] = None,
+        llm: Optional[LLM] = None,
+    ):
+        super().__init__(
+            BatchStatus(
+                status_path or Path(config.novel.workspace) / "service" / "jobs.json"
+            ),
+            llm,
+        )
+        self.workers = workers or config.novel.batch_workers
+        self.novel_saver = NovelSaver(write_queue_size=0)
+        self._sinks: Dict[str, BroadcastSink] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def _sink(self, job: BatchJob) -> StreamSink:
+        return self._sinks.setdefault(job.job_id, BroadcastSink())
+
+    def _release_sink(self, job: BatchJob) -> None:
+        """Forget the sink of a finished job once nobody follows it."""
+        sink = self._sinks.get(job.job_id)
+        if (
+            sink is not None
+            and job.status in FINAL_STATUSES
+            and not sink.subscriber_count
+        ):
+            del self._sinks[job.job_id]
+
+    def _update(self, job: BatchJob, **changes) -> None:
+        super()._update(job, **changes)
+        if "status" in changes:
+            self._sink(job).publish(StreamEvent(job.job_id, "status", job.status))
+            self._release_sink(job)
+
+    def submit(self, user_input: str, job_id: Optional[str] = None) -> BatchJob:
+        """
+        Queue a new job.
+
+        Raises:
+            ValueError: If `job_id` is not a usable id, or a job with it
+                already exists.
+        """
+        if job_id is not None:
+            if not isinstance(job_id, str) or not job_id.strip("."):
+                raise ValueError(f"Invalid job id: {job_id!r}")
+            # Ids become URL path segments and file names
+            job_id = _job_id(job_id)
+        job_id = job_id or uuid.uuid4().hex[:12]
+        if job_id in self.status.jobs:
+            raise ValueError(f"Job {job_id} already exists")
+        job = BatchJob(job_id=job_id, user_input=user_input)
+        self.status.merge([job])
+        self._queue.put_nowait(job)
+        return job
+
+    def retry(self, job: BatchJob) -> None:
+        """
+        Queue a failed or stopped job again, resuming its novel.
+
+        Raises:
+            ValueError: If the job is still queued, running or done.
+        """
+        if job.status not in ("failed", "stopped"):
+            raise ValueError(f"Job {job.job_id} is {job.status}")
+        self._update(job, status="pending")
+        self._queue.put_nowait(job)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.run_job(job)
+            except Exception as e:
+                logger.error(f"Job {job.job_id} crashed: {e}")
+
+    async def start(self, app: web.Application) -> None:
+        for job in self.status.jobs.values():
+            if job.status in ("pending", "running"):
+                self._queue.put_nowait(job)
+        if not self._queue.empty():
+            logger.info(f"Resuming {self._queue.qsize()} unfinished jobs")
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self, app: web.Application) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        await self.llm.close()
+        self.novel_saver.close()
+
+    def _job(self, request: web.Request) -> BatchJob:
+        job = self.status.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise _error(web.HTTPNotFound, "Unknown job")
+        return job
+
+    def _checkpoint(self, request: web.Request) -> Dict:
+        novel_id = request.match_info["novel_id"]
+        if novel_id not in self.novel_saver.list_novels():
+            raise _error(web.HTTPNotFound, "Unknown novel")
+        return self.novel_saver.load_checkpoint(novel_id) or {}
+
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise _error(web.HTTPBadRequest, "Body must be JSON")
+        user_input = body.get("input") if isinstance(body, dict) else None
+        if not user_input or not isinstance(user_input, str):
+            raise _error(web.HTTPBadRequest, "input must be a non-empty string")
+        job_id = body.get("id")
+        if job_id is not None and not (isinstance(job_id, str) and job_id.strip(".")):
+            raise _error(web.HTTPBadRequest, "id must be a non-empty string")
+        try:
+            job = self.submit(user_input, job_id)
+        except ValueError as e:
+            raise _error(web.HTTPConflict, str(e))
+        return web.json_response(job.model_dump(), status=202)
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "jobs": [job.model_dump() for job in self.status.jobs.values()],
+                "counts": self.status.counts(),
+            }
+        )
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        return web.json_response(self._job(request).model_dump())
+
+    async def handle_retry(self, request: web.Request) -> web.Response:
+        job = self._job(request)
+        try:
+            self.retry(job)
+        except ValueError as e:
+            raise _error(web.HTTPConflict, str(e))
+        return web.json_response(job.model_dump(), status=202)
+
+    async def handle_stream(self, request: web.Request) -> web.StreamResponse:
+        job = self._job(request)
+        stages = request.query.get("stages", "content")
+        prefixes = (
+            None
+            if stages == "all"
+            else tuple(f"{stage}_" for stage in stages.split(","))
+        )
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+
+        async def send(event: StreamEvent) -> None:
+            data = {"stream_id": event.stream_id, "text": event.text}
+            await response.write(
+                f"event: {event.kind}\ndata: "
+                f"{json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+            )
+
+        sink = self._sink(job)
+        queue = sink.subscribe()
+        try:
+            await send(StreamEvent(job.job_id, "status", job.status))
+            while job.status not in FINAL_STATUSES:
+                event = await queue.get()
+                if event is None:
+                    # Dropped for falling behind; the client may reconnect
+                    break
+                if event.kind == "status":
+                    await send(event)
+                elif prefixes is None or event.stream_id.startswith(prefixes):
+                    await send(event)
+        finally:
+            sink.unsubscribe(queue)
+            self._release_sink(job)
+        await response.write_eof()
+        return response
+
+    async def handle_novels(self, request: web.Request) -> web.Response:
+        return web.json_response({"novels": self.novel_saver.list_novels()})
+
+    async def handle_novel(self, request: web.Request) -> web.Response:
+        return web.json_response(self._checkpoint(request))
+
+    async def handle_novel_text(self, request: web.Request) -> web.Response:
+        checkpoint = self._checkpoint(request)
+        chapters = [
+            f"{chapter['title']}\n\n{chapter['content']}"
+            for volume in checkpoint.get("volumes", [])
+            for chapter in volume.get("chapters", [])
+            if chapter
+        ]
+        return web.Response(text="\n\n".join(chapters))
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/jobs", self.handle_submit)
+        app.router.add_get("/jobs", self.handle_list)
+        app.router.add_get("/jobs/{job_id}", self.handle_status)
+        app.router.add_post("/jobs/{job_id}/retry", self.handle_retry)
+        app.router.add_get("/jobs/{job_id}/stream", self.handle_stream)
+        app.router.add_get("/novels", self.handle_novels)
+        app.router.add_get("/novels/{novel_id}", self.handle_novel)
+        app.router.add_get("/novels/{novel_id}/text", self.handle_novel_text)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
+
+
+async def serve(
+    host: str = "127.0.0.1", port: int = 8000, workers: Optional[int] = None
+) -> None:
+    """Run the novel generation service until cancelled."""
+    runner = web.AppRunner(NovelService(workers=workers).make_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Novel Genie service listening on http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
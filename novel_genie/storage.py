@@ -0,0 +1,696 @@
+import atexit
+import contextvars
+import copy
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel
+
+from novel_genie.logger import logger
+from novel_genie.tracing import trace_span
+
+
+StatePath = List[Union[str, int]]
+# A queued backend write: method name, arguments and the context it was made in
+WriteOp = Tuple[str, tuple, contextvars.Context]
+
+VOLUME_ELEMENT_KINDS = ("chapter_outlines", "detailed_outlines", "chapters")
+
+
+def to_dict(data: Any) -> Any:
+    """Recursively convert pydantic models into plain JSON-compatible data."""
+    if isinstance(data, BaseModel):
+        return data.model_dump()
+    elif isinstance(data, dict):
+        return {k: to_dict(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [to_dict(item) for item in data]
+    return data
+
+
+def apply_state_record(state: Dict, path: StatePath, value: Any) -> None:
+    """Set `value` at `path` inside `state`, creating containers as needed."""
+    target: Any = state
+    for key, next_key in zip(path, path[1:]):
+        if isinstance(target, list):
+            target.extend([None] * (key + 1 - len(target)))
+            if target[key] is None:
+                target[key] = [] if isinstance(next_key, int) else {}
+        elif target.get(key) is None:
+            target[key] = [] if isinstance(next_key, int) else {}
+        target = target[key]
+
+    key = path[-1]
+    if isinstance(target, list):
+        target.extend([None] * (key + 1 - len(target)))
+    target[key] = value
+
+
+class StorageBackend(ABC):
+    """
+    Persistence interface used by `NovelSaver`.
+
+    State is exchanged as plain dicts in the checkpoint layout
+    (`user_input`, `intent`, `rough_outline`, `volumes`, ...). Stage results
+    are addressed by a path into that layout, e.g. ["volumes", 0, "chapters", 2].
+    """
+
+    # Whether saved records accumulate until the next snapshot compacts them
+    uses_journal: bool = False
+
+    @abstractmethod
+    def save_snapshot(self, novel_id: str, state: Dict) -> None:
+        """Persist the complete novel state."""
+
+    @abstractmethod
+    def save_record(self, novel_id: str, path: StatePath, value: Any) -> None:
+        """Persist a single stage result located at `path`."""
+
+    @abstractmethod
+    def pending_records(self, novel_id: str) -> int:
+        """Number of records that could be folded into a snapshot."""
+
+    def compact(self, novel_id: str) -> None:
+        """Fold pending records into the snapshot. No-op without a journal."""
+
+    def close(self) -> None:
+        """Release open connections. No-op for backends without any."""
+
+    @abstractmethod
+    def load_state(self, novel_id: str) -> Optional[Dict]:
+        """Load the complete novel state, or None if nothing was saved."""
+
+    @abstractmethod
+    def save_chapter_text(
+        self, novel_id: str, volume_num: int, chapter_num: int, text: str
+    ) -> None:
+        """Persist the readable text of a chapter."""
+
+    @abstractmethod
+    def list_novels(self) -> List[str]:
+        """Ids of all novels with saved state."""
+
+    @abstractmethod
+    def load_latest_elements(
+        self, novel_id: str, volume_num: int, kind: str, limit: int
+    ) -> List[Dict]:
+        """Last `limit` chapter outlines, detailed outlines or chapters of a volume."""
+
+
+class FileStorage(StorageBackend):
+    """
+    Directory-per-novel storage with one text file per chapter.
+
+    Stage records are appended to `journal.jsonl` and periodically folded into
+    the snapshot. The snapshot is split so that folding only rewrites what
+    changed since the last compaction:
+
+    - `blobs/<sha256>.json`: one content-addressed file per outline or chapter,
+      written once.
+    - `volumes/volume_N.json`: per-volume shard holding the volume fields and
+      blob references of its elements; rewritten only for dirty volumes.
+    - `checkpoint.json`: small manifest with the novel-level fields and
+      references to the volume shards.
+
+    Legacy checkpoints with fully inlined state are still readable.
+    """
+
+    uses_journal = True
+
+    BLOB_KEY = "$blob"
+    SHARD_KEY = "$shard"
+
+    def __init__(self, base_dir: str):
+        self.base_dir = Path(base_dir)
+        self._records: Dict[str, List[Tuple[StatePath, Any]]] = {}
+        self._manifests: Dict[str, Dict] = {}
+        self._known_blobs: Set[Path] = set()
+        self._created_dirs: Set[Path] = set()
+
+    def _ensure_dirs(self, novel_id: str) -> Dict[str, Path]:
+        """Ensure all required directories exist and return their paths."""
+        novel_dir = self.base_dir / novel_id
+        checkpoints_dir = novel_dir / "checkpoints"
+        dirs = {
+            "novel": novel_dir,
+            "novel_content": novel_dir / "novel",
+            "checkpoints": checkpoints_dir,
+            "blobs": checkpoints_dir / "blobs",
+            "volumes": checkpoints_dir / "volumes",
+        }
+        for path in dirs.values():
+            self._mkdir(path)
+        return dirs
+
+    def _mkdir(self, path: Path) -> None:
+        if path not in self._created_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(path)
+
+    @staticmethod
+    def _write_durable(path: Path, text: str) -> None:
+        """Atomically replace `path` with `text`, flushed to disk."""
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read_journal(self, novel_id: str) -> List[Tuple[StatePath, Any]]:
+        """Records appended since the last snapshot, as currently on disk."""
+        journal_path = self._ensure_dirs(novel_id)["checkpoints"] / "journal.jsonl"
+        records = []
+        if journal_path.exists():
+            for line in journal_path.read_text(encoding="utf-8").splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn trailing record from a crash mid-write
+                    logger.warning(f"Skipping corrupt journal record for {novel_id}")
+                    continue
+                records.append((record["path"], record["value"]))
+        return records
+
+    def _journal_records(self, novel_id: str) -> List[Tuple[StatePath, Any]]:
+        """Records appended since the last snapshot, read from disk once."""
+        if novel_id not in self._records:
+            self._records[novel_id] = self._read_journal(novel_id)
+        return self._records[novel_id]
+
+    def _put_blob(self, novel_id: str, value: Any) -> Any:
+        """Store `value` as a content-addressed blob and return its reference."""
+        if value is None:
+            return None
+        text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        blob_path = self._ensure_dirs(novel_id)["blobs"] / f"{digest}.json"
+        if blob_path not in self._known_blobs:
+            if not blob_path.exists():
+                self._write_durable(blob_path, text)
+            self._known_blobs.add(blob_path)
+        return {self.BLOB_KEY: digest}
+
+    def _to_manifest_volume(self, novel_id: str, volume: Optional[Dict]) -> Any:
+        if volume is None:
+            return None
+        return {
+            key: [self._put_blob(novel_id, element) for element in value or []]
+            if key in VOLUME_ELEMENT_KINDS
+            else value
+            for key, value in volume.items()
+        }
+
+    def _to_manifest_value(self, novel_id: str, path: StatePath, value: Any) -> Any:
+        """Convert a state value at `path` into its reference form."""
+        if path == ["volumes"]:
+            return [self._to_manifest_volume(novel_id, v) for v in value or []]
+        if len(path) == 2 and path[0] == "volumes":
+            return self._to_manifest_volume(novel_id, value)
+        if isinstance(value, (dict, list)):
+            return self._put_blob(novel_id, value)
+        return value
+
+    def _resolve(self, novel_id: str, data: Any) -> Any:
+        """Replace blob references in `data` with their contents."""
+        if isinstance(data, dict):
+            if set(data) == {self.BLOB_KEY}:
+                blob_path = (
+                    self._ensure_dirs(novel_id)["blobs"] / f"{data[self.BLOB_KEY]}.json"
+                )
+                return json.loads(blob_path.read_text(encoding="utf-8"))
+            return {key: self._resolve(novel_id, value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self._resolve(novel_id, item) for item in data]
+        return data
+
+    def _read_manifest(self, novel_id: str) -> Dict:
+        """The snapshot in reference form as currently on disk, shards expanded."""
+        dirs = self._ensure_dirs(novel_id)
+        checkpoint_path = dirs["checkpoints"] / "checkpoint.json"
+        manifest = (
+            json.loads(checkpoint_path.read_text(encoding="utf-8"))
+            if checkpoint_path.exists()
+            else {}
+        )
+        volumes = manifest.get("volumes") or []
+        for index, volume in enumerate(volumes):
+            if isinstance(volume, dict) and self.SHARD_KEY in volume:
+                shard_path = dirs["volumes"] / volume[self.SHARD_KEY]
+                volumes[index] = json.loads(shard_path.read_text(encoding="utf-8"))
+        return manifest
+
+    def _load_manifest(self, novel_id: str) -> Dict:
+        """The snapshot in reference form, read from disk once."""
+        if novel_id not in self._manifests:
+            self._manifests[novel_id] = self._read_manifest(novel_id)
+        return self._manifests[novel_id]
+
+    def _write_manifest(
+        self, novel_id: str, manifest: Dict, dirty_volumes: Set[int]
+    ) -> None:
+        # Shards go first and the journal is truncated last. Replaying records
+        # is idempotent, so a crash between the steps is harmless.
+        dirs = self._ensure_dirs(novel_id)
+        volumes = manifest.get("volumes") or []
+        for index in sorted(dirty_volumes):
+            if index < len(volumes):
+                self._write_durable(
+                    dirs["volumes"] / f"volume_{index + 1}.json",
+                    json.dumps(volumes[index], ensure_ascii=False),
+                )
+        on_disk = {
+            **manifest,
+            "volumes": [
+                {self.SHARD_KEY: f"volume_{index + 1}.json"}
+                if volume is not None
+                else None
+                for index, volume in enumerate(volumes)
+            ],
+        }
+        self._write_durable(
+            dirs["checkpoints"] / "checkpoint.json",
+            json.dumps(on_disk, ensure_ascii=False, indent=2),
+        )
+        self._write_durable(dirs["checkpoints"] / "journal.jsonl", "")
+        self._manifests[novel_id] = manifest
+        self._records[novel_id] = []
+
+    def save_snapshot(self, novel_id: str, state: Dict) -> None:
+        manifest = {
+            key: self._to_manifest_value(novel_id, [key], value)
+            for key, value in state.items()
+        }
+        manifest.setdefault("volumes", [])
+        self._write_manifest(novel_id, manifest, set(range(len(manifest["volumes"]))))
+
+    def compact(self, novel_id: str) -> None:
+        records = self._journal_records(novel_id)
+        if not records:
+            return
+        # Only the last value written to a path ends up in the snapshot
+        folded: Dict[Tuple, Tuple[StatePath, Any]] = {}
+        for path, value in records:
+            folded.pop(tuple(path), None)
+            folded[tuple(path)] = (path, value)
+
+        manifest = self._load_manifest(novel_id)
+        dirty_volumes: Set[int] = set()
+        for path, value in folded.values():
+            if path[0] == "volumes":
+                if len(path) == 1:
+                    dirty_volumes.update(range(len(value or [])))
+                else:
+                    dirty_volumes.add(path[1])
+            apply_state_record(
+                manifest, path, self._to_manifest_value(novel_id, path, value)
+            )
+        self._write_manifest(novel_id, manifest, dirty_volumes)
+
+    def save_record(self, novel_id: str, path: StatePath, value: Any) -> None:
+        records = self._journal_records(novel_id)
+        journal_path = self._ensure_dirs(novel_id)["checkpoints"] / "journal.jsonl"
+        record = json.dumps({"path": path, "value": value}, ensure_ascii=False)
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write(record + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        records.append((path, value))
+
+    def pending_records(self, novel_id: str) -> int:
+        return len(self._journal_records(novel_id))
+
+    def load_state(self, novel_id: str) -> Optional[Dict]:
+        # Read from disk rather than the caches, which only track the writes
+        # of this instance: another saver, e.g. of a running job, may have
+        # compacted or appended records since.
+        manifest = self._read_manifest(novel_id)
+        records = self._read_journal(novel_id)
+        if not manifest and not records:
+            return None
+
+        state = self._resolve(novel_id, manifest)
+        for path, value in records:
+            apply_state_record(state, path, copy.deepcopy(value))
+        return state or None
+
+    def save_chapter_text(
+        self, novel_id: str, volume_num: int, chapter_num: int, text: str
+    ) -> None:
+        volume_dir = (
+            self._ensure_dirs(novel_id)["novel_content"] / f"volume_{volume_num}"
+        )
+        self._mkdir(volume_dir)
+        (volume_dir / f"chapter_{chapter_num}.txt").write_text(text, encoding="utf-8")
+
+    def list_novels(self) -> List[str]:
+        return sorted(
+            path.parent.parent.name
+            for path in self.base_dir.glob("*/checkpoints/checkpoint.json")
+        )
+
+    def load_latest_elements(
+        self, novel_id: str, volume_num: int, kind: str, limit: int
+    ) -> List[Dict]:
+        if limit <= 0:
+            return []
+        # Rebuild just this volume in reference form and resolve the tail
+        volumes = self._load_manifest(novel_id).get("volumes") or []
+        volume = (
+            copy.deepcopy(volumes[volume_num - 1])
+            if volume_num <= len(volumes)
+            else None
+        )
+        index = volume_num - 1
+        for path, value in self._journal_records(novel_id):
+            if path == ["volumes"]:
+                volume = (
+                    copy.deepcopy(value[index]) if index < len(value or []) else None
+                )
+            elif path[0] == "volumes" and path[1] == index:
+                if len(path) == 2:
+                    volume = copy.deepcopy(value)
+                else:
+                    volume = volume if volume is not None else {}
+                    apply_state_record(volume, path[2:], value)
+        if not volume:
+            return []
+        return self._resolve(novel_id, (volume.get(kind) or [])[-limit:])
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Single-database storage for a whole workspace.
+
+    Novel-level fields live in one row per novel, and every chapter outline,
+    detailed outline and chapter is its own row keyed by
+    (novel_id, volume_num, kind, idx). Saving a stage result is one small
+    transaction, so there is no journal to compact.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS novels (
+        novel_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS volumes (
+        novel_id TEXT NOT NULL,
+        volume_num INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (novel_id, volume_num)
+    );
+    CREATE TABLE IF NOT EXISTS volume_elements (
+        novel_id TEXT NOT NULL,
+        volume_num INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        data TEXT,
+        PRIMARY KEY (novel_id, volume_num, kind, idx)
+    );
+    CREATE TABLE IF NOT EXISTS chapter_texts (
+        novel_id TEXT NOT NULL,
+        volume_num INTEGER NOT NULL,
+        chapter_num INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (novel_id, volume_num, chapter_num)
+    );
+    CREATE INDEX IF NOT EXISTS idx_novels_updated_at ON novels (updated_at);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+    def _load_novel_row(self, novel_id: str) -> Dict:
+        row = self._conn.execute(
+            "SELECT state FROM novels WHERE novel_id = ?", (novel_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _upsert_novel_row(self, novel_id: str, state: Dict) -> None:
+        self._conn.execute(
+            "INSERT INTO novels (novel_id, state, updated_at) "
+            "VALUES (?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(novel_id) DO UPDATE SET "
+            "state = excluded.state, updated_at = excluded.updated_at",
+            (novel_id, self._dumps(state)),
+        )
+
+    def _upsert_volume(self, novel_id: str, volume: Dict) -> None:
+        volume_num = volume["volume_num"]
+        fields = {k: v for k, v in volume.items() if k not in VOLUME_ELEMENT_KINDS}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO volumes (novel_id, volume_num, data) "
+            "VALUES (?, ?, ?)",
+            (novel_id, volume_num, self._dumps(fields)),
+        )
+        self._conn.execute(
+            "DELETE FROM volume_elements WHERE novel_id = ? AND volume_num = ?",
+            (novel_id, volume_num),
+        )
+        self._conn.executemany(
+            "INSERT INTO volume_elements (novel_id, volume_num, kind, idx, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (novel_id, volume_num, kind, idx, self._dumps(element))
+                for kind in VOLUME_ELEMENT_KINDS
+                for idx, element in enumerate(volume.get(kind) or [])
+            ],
+        )
+
+    def save_snapshot(self, novel_id: str, state: Dict) -> None:
+        novel_fields = {k: v for k, v in state.items() if k != "volumes"}
+        with self._lock, self._conn:
+            self._upsert_novel_row(novel_id, novel_fields)
+            for volume in state.get("volumes") or []:
+                self._upsert_volume(novel_id, volume)
+
+    def save_record(self, novel_id: str, path: StatePath, value: Any) -> None:
+        with self._lock, self._conn:
+            if path[0] != "volumes":
+                novel_fields = self._load_novel_row(novel_id)
+                apply_state_record(novel_fields, path, value)
+                self._upsert_novel_row(novel_id, novel_fields)
+            elif len(path) == 2:
+                self._upsert_volume(novel_id, value)
+            elif len(path) == 4 and path[2] in VOLUME_ELEMENT_KINDS:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO volume_elements "
+                    "(novel_id, volume_num, kind, idx, data) VALUES (?, ?, ?, ?, ?)",
+                    (novel_id, path[1] + 1, path[2], path[3], self._dumps(value)),
+                )
+            else:
+                volume_num = path[1] + 1
+                row = self._conn.execute(
+                    "SELECT data FROM volumes WHERE novel_id = ? AND volume_num = ?",
+                    (novel_id, volume_num),
+                ).fetchone()
+                fields = json.loads(row[0]) if row else {"volume_num": volume_num}
+                apply_state_record(fields, path[2:], value)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO volumes (novel_id, volume_num, data) "
+                    "VALUES (?, ?, ?)",
+                    (novel_id, volume_num, self._dumps(fields)),
+                )
+
+    def pending_records(self, novel_id: str) -> int:
+        return 0
+
+    def load_state(self, novel_id: str) -> Optional[Dict]:
+        with self._lock:
+            state = self._load_novel_row(novel_id)
+            volume_rows = self._conn.execute(
+                "SELECT volume_num, data FROM volumes WHERE novel_id = ? "
+                "ORDER BY volume_num",
+                (novel_id,),
+            ).fetchall()
+            element_rows = self._conn.execute(
+                "SELECT volume_num, kind, idx, data FROM volume_elements "
+                "WHERE novel_id = ? ORDER BY volume_num, kind, idx",
+                (novel_id,),
+            ).fetchall()
+        if not state and not volume_rows:
+            return None
+
+        volumes = {num: json.loads(data) for num, data in volume_rows}
+        for volume in volumes.values():
+            for kind in VOLUME_ELEMENT_KINDS:
+                volume.setdefault(kind, [])
+        for volume_num, kind, idx, data in element_rows:
+            volume = volumes.setdefault(volume_num, {"volume_num": volume_num})
+            apply_state_record(volume, [kind, idx], json.loads(data))
+        state["volumes"] = [volumes[num] for num in sorted(volumes)]
+        return state
+
+    def save_chapter_text(
+        self, novel_id: str, volume_num: int, chapter_num: int, text: str
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chapter_texts "
+                "(novel_id, volume_num, chapter_num, text) VALUES (?, ?, ?, ?)",
+                (novel_id, volume_num, chapter_num, text),
+            )
+
+    def list_novels(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT novel_id FROM novels ORDER BY updated_at, novel_id"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_latest_elements(
+        self, novel_id: str, volume_num: int, kind: str, limit: int
+    ) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM volume_elements "
+                "WHERE novel_id = ? AND volume_num = ? AND kind = ? "
+                "ORDER BY idx DESC LIMIT ?",
+                (novel_id, volume_num, kind, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+
+def apply_write(backend: StorageBackend, method: str, args: tuple) -> None:
+    """Run a backend write, timed as a span of the traced run making it, if any."""
+    with trace_span(method, "checkpoint_write", novel_id=args[0]):
+        getattr(backend, method)(*args)
+
+
+class BackgroundWriter:
+    """
+    Apply storage writes on a dedicated thread fed by a bounded queue.
+
+    Writes already queued for a novel are dropped when a later snapshot of the
+    same novel is in the same batch, since the snapshot supersedes them, and
+    only the last compaction of a batch is kept.
+    Pending writes are flushed on `close()` and at interpreter exit.
+    """
+
+    def __init__(self, backend: StorageBackend, max_queue_size: int):
+        self.backend = backend
+        self._queue: "queue.Queue[Optional[WriteOp]]" = queue.Queue(
+            maxsize=max_queue_size
+        )
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self.stats = {
+            "writes": 0,
+            "coalesced": 0,
+            "total_write_seconds": 0.0,
+            "max_write_seconds": 0.0,
+            "max_queue_depth": 0,
+        }
+        self._thread = threading.Thread(
+            target=self._run, name="novel-saver-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, method: str, *args: Any) -> None:
+        """Queue a backend write; blocks while the queue is full."""
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError("Background writer is closed")
+        # The write runs in a copy of the caller's context, so that it is
+        # traced as part of the run that made it
+        self._queue.put((method, args, contextvars.copy_context()))
+        self.stats["max_queue_depth"] = max(
+            self.stats["max_queue_depth"], self._queue.qsize()
+        )
+
+    def flush(self) -> None:
+        """Block until every queued write has been applied."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Flush pending writes and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        logger.debug(f"Checkpoint writer stopped: {self.stats}")
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    @staticmethod
+    def _coalesce(ops: List[WriteOp]) -> List[WriteOp]:
+        last_snapshot: Dict[str, int] = {}
+        last_compaction: Dict[str, int] = {}
+        for index, (method, args, _) in enumerate(ops):
+            if method == "save_snapshot":
+                last_snapshot[args[0]] = index
+            if method in ("save_snapshot", "compact"):
+                last_compaction[args[0]] = index
+        return [
+            (method, args, context)
+            for index, (method, args, context) in enumerate(ops)
+            if method == "save_chapter_text"
+            or (
+                index >= last_snapshot.get(args[0], -1)
+                and (method != "compact" or index == last_compaction[args[0]])
+            )
+        ]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            ops = [item for item in batch if item is not None]
+            coalesced = self._coalesce(ops)
+            self.stats["coalesced"] += len(ops) - len(coalesced)
+            for method, args, context in coalesced:
+                start = time.perf_counter()
+                try:
+                    context.run(apply_write, self.backend, method, args)
+                except Exception as e:
+                    logger.error(f"Background checkpoint write failed: {e}")
+                    self._error = e
+                elapsed = time.perf_counter() - start
+                self.stats["writes"] += 1
+                self.stats["total_write_seconds"] += elapsed
+                self.stats["max_write_seconds"] = max(
+                    self.stats["max_write_seconds"], elapsed
+                )
+
+            for _ in batch:
+                self._queue.task_done()
+            if len(ops) != len(batch):
+                return
@@ -0,0 +1,264 @@
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pydantic import BaseModel
+
+from novel_genie.logger import logger
+
+
+# CJK runs are indexed as character bigrams, so names, places and other
+# multi-character terms match without a word segmenter; other scripts by word.
+TERM_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[A-Za-z0-9]+")
+CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+
+PASSAGE_KINDS = ("chapter", "summary", "detailed_outline")
+
+
+def tokenize(text: str) -> List[str]:
+    """Index terms of `text`: CJK character bigrams and lowercased words."""
+    terms = []
+    for run in TERM_PATTERN.findall(text):
+        if CJK_PATTERN.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run.lower())
+    return terms
+
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Split `text` into passages of about `max_chars`, on paragraph boundaries."""
+    chunks, current = [], ""
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > max_chars:
+            chunks.append(current)
+            current = ""
+        while len(paragraph) > max_chars:
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class Passage(BaseModel):
+    """A retrievable piece of the story."""
+
+    kind: str
+    volume_num: int
+    chapter_num: int
+    text: str
+
+    def __str__(self):
+        labels = {"chapter": "正文", "summary": "摘要", "detailed_outline": "细纲"}
+        return f"（第{self.chapter_num}章{labels.get(self.kind, '')}）{self.text}"
+
+
+class StoryMemory:
+    """
+    BM25 index over the passages of a novel, for long-range continuity.
+
+    Passages are grouped per (kind, chapter): chapter text chunks, chapter
+    summaries and detailed outlines. Adding a group replaces the previous one,
+    so regenerating a chapter never leaves stale passages behind. Groups are
+    appended to a JSON lines file in the novel workspace and replayed, last
+    one wins, when the index is opened again.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        max_query_terms: int = 16,
+    ):
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self._passages: List[Optional[Passage]] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._groups: Dict[Tuple[str, int], List[int]] = {}
+        self._live = 0
+        if self.path and self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return self._live
+
+    def _load(self) -> None:
+        lines = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    group = json.loads(line)
+                    self._index_group(**group)
+                    lines += 1
+        # Rewrite the file once replaced groups make up most of it
+        if lines > 2 * len(self._groups):
+            self._rewrite()
+        logger.debug(f"Loaded {self._live} story memory passages from {self.path}")
+
+    @staticmethod
+    def _group_line(
+        kind: str, volume_num: int, chapter_num: int, texts: Sequence[str]
+    ) -> str:
+        group = {
+            "kind": kind,
+            "volume_num": volume_num,
+            "chapter_num": chapter_num,
+            "texts": list(texts),
+        }
+        return json.dumps(group, ensure_ascii=False) + "\n"
+
+    def _rewrite(self) -> None:
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for (kind, chapter_num), doc_ids in self._groups.items():
+                passages = [self._passages[doc_id] for doc_id in doc_ids]
+                f.write(
+                    self._group_line(
+                        kind,
+                        passages[0].volume_num,
+                        chapter_num,
+                        [passage.text for passage in passages],
+                    )
+                )
+        tmp_path.replace(self.path)
+
+    def _remove_group(self, key: Tuple[str, int]) -> None:
+        for doc_id in self._groups.pop(key, []):
+            for term in set(tokenize(self._passages[doc_id].text)):
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+            self._passages[doc_id] = None
+            self._live -= 1
+
+    def _index_group(
+        self, kind: str, volume_num: int, chapter_num: int, texts: Sequence[str]
+    ) -> None:
+        key = (kind, chapter_num)
+        self._remove_group(key)
+        doc_ids = []
+        for text in texts:
+            terms = tokenize(text)
+            if not terms:
+                continue
+            doc_id = len(self._passages)
+            self._passages.append(
+                Passage(
+                    kind=kind, volume_num=volume_num, chapter_num=chapter_num, text=text
+                )
+            )
+            self._lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            self._live += 1
+            doc_ids.append(doc_id)
+        if doc_ids:
+            self._groups[key] = doc_ids
+
+    def add(
+        self, kind: str, volume_num: int, chapter_num: int, texts: Sequence[str]
+    ) -> None:
+        """Index the passages of one chapter and kind, replacing earlier ones."""
+        if kind not in PASSAGE_KINDS:
+            raise ValueError(f"Unknown passage kind: {kind}")
+        texts = [text for text in texts if text.strip()]
+        self._index_group(kind, volume_num, chapter_num, texts)
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(self._group_line(kind, volume_num, chapter_num, texts))
+
+    def has(self, kind: str, chapter_num: int) -> bool:
+        return (kind, chapter_num) in self._groups
+
+    def query(
+        self,
+        text: str,
+        k: int,
+        before_chapter: int,
+        kinds: Iterable[str] = PASSAGE_KINDS,
+        volume_num: Optional[int] = None,
+    ) -> List[Passage]:
+        """
+        The `k` passages most relevant to `text`, at most one per chapter.
+
+        Args:
+            text (str): Query, e.g. the outline of the chapter being written
+            k (int): Number of passages to return
+            before_chapter (int): Only chapters numbered below this are searched
+            kinds (Iterable[str]): Passage kinds to search
+            volume_num (Optional[int]): Restrict the search to one volume
+
+        Returns:
+            List[Passage]: Matching passages in story order.
+        """
+        if k <= 0 or not self._live:
+            return []
+        kinds: Set[str] = set(kinds)
+        # Statistics are taken over the searchable passages only, so results
+        # do not depend on how far concurrent stages have indexed ahead
+        eligible: Set[int] = set()
+        for (kind, chapter_num), doc_ids in self._groups.items():
+            if kind in kinds and chapter_num < before_chapter:
+                if volume_num is None or (
+                    self._passages[doc_ids[0]].volume_num == volume_num
+                ):
+                    eligible.update(doc_ids)
+        if not eligible:
+            return []
+        average_length = sum(self._lengths[doc_id] for doc_id in eligible) / len(
+            eligible
+        )
+
+        postings_by_term, weights = {}, {}
+        for term, query_count in Counter(tokenize(text)).items():
+            postings = [
+                (doc_id, count)
+                for doc_id, count in self._postings.get(term, {}).items()
+                if doc_id in eligible
+            ]
+            if postings:
+                postings_by_term[term] = postings
+                weights[term] = query_count * math.log(
+                    1 + (len(eligible) - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+        # Only the most distinctive query terms are scored: names, places and
+        # props repeated in the query outweigh filler, and long queries stay cheap
+        query_terms = sorted(weights, key=lambda term: (-weights[term], term))[
+            : self.max_query_terms
+        ]
+
+        scores: Dict[int, float] = {}
+        for term in query_terms:
+            for doc_id, count in postings_by_term[term]:
+                norm = self.k1 * (
+                    1 - self.b + self.b * self._lengths[doc_id] / average_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + weights[term] * count * (
+                    self.k1 + 1
+                ) / (count + norm)
+
+        best: Dict[int, Tuple[float, Passage]] = {}
+        for doc_id, score in scores.items():
+            passage = self._passages[doc_id]
+            chapter_num = passage.chapter_num
+            if chapter_num not in best or score > best[chapter_num][0]:
+                best[chapter_num] = (score, passage)
+        top = sorted(best.items(), key=lambda item: (-item[1][0], item[0]))[:k]
+        return [passage for _, (_, passage) in sorted(top)]
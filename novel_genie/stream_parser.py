@@ -0,0 +1,227 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+from novel_genie.exceptions import MalformedResponseError
+from novel_genie.schema import OutlineType
+from novel_genie.stream_validator import StreamValidator
+from novel_genie.utils import OUTLINE_TAGS
+
+
+FENCE = "```"
+FENCE_PATTERN = re.compile(r"```(\w*)")
+
+# Called with the tag, its position among the elements of that tag and the
+# stripped element content
+TagCallback = Callable[[str, int, str], None]
+
+
+class _TagScan:
+    """Search state of one watched tag over the growing text."""
+
+    def __init__(self, tag: str, is_list: bool):
+        self.open = f"<{tag}>"
+        self.close = f"</{tag}>"
+        self.is_list = is_list
+        self.content_start: Optional[int] = None
+        self.scan_from = 0
+        self.done = False
+
+
+class StreamParser:
+    """
+    Incremental parser of a streamed LLM reply.
+
+    Drops ```thinking code blocks while the text arrives, the same blocks
+    `filter_thinking_blocks` removes from the final reply, and reports every
+    watched `<tag>...</tag>` element as soon as its closing tag arrives.
+    Single tags report their first element only and list tags every element,
+    as `extract_outline` reads them. A validator, if given, checks the text
+    as it arrives and aborts replies that cannot be used.
+
+    Args:
+        tags (Dict[str, bool]): Watched tags, mapped to whether they repeat
+        on_tag (Optional[TagCallback]): Called for every completed element
+        drop_language (str): Language of the code blocks to drop
+        validator (Optional[StreamValidator]): Format check of the reply
+    """
+
+    def __init__(
+        self,
+        tags: Optional[Dict[str, bool]] = None,
+        on_tag: Optional[TagCallback] = None,
+        drop_language: str = "thinking",
+        validator: Optional[StreamValidator] = None,
+    ):
+        self.tags = dict(tags or {})
+        self.on_tag = on_tag
+        self.drop_language = drop_language
+        self.validator = validator
+        self.reset()
+
+    @classmethod
+    def for_outline(
+        cls,
+        outline_type: OutlineType,
+        on_tag: Optional[TagCallback] = None,
+        validator: Optional[StreamValidator] = None,
+    ) -> "StreamParser":
+        """Parser watching the tags `extract_outline` reads for `outline_type`."""
+        tags = dict(OUTLINE_TAGS[outline_type].values())
+        return cls(tags=tags, on_tag=on_tag, validator=validator)
+
+    def reset(self) -> None:
+        """Start over, e.g. when a failed request is retried from scratch."""
+        self.elements: Dict[str, List[str]] = {tag: [] for tag in self.tags}
+        self._scans = [_TagScan(tag, is_list) for tag, is_list in self.tags.items()]
+        # Text that may still hold a watched element, starting at `_offset`
+        self._window = ""
+        self._offset = 0
+        self._pending = ""
+        self._mode = "text"  # "text", "code" (kept block) or "drop"
+        self._dropped: List[str] = []
+        if self.validator is not None:
+            self.validator.reset()
+
+    def feed(self, delta: str) -> str:
+        """
+        Consume the next piece of the reply.
+
+        Returns:
+            str: The newly available text, without dropped code blocks.
+
+        Raises:
+            MalformedResponseError: If the validator rejects the reply.
+        """
+        self._pending += delta
+        out = self._filter(final=False)
+        self._scan(out)
+        self._validate(out, final=False)
+        return out
+
+    def close(self) -> str:
+        """
+        Consume the end of the reply. An unterminated dropped block is kept,
+        as it would be by `filter_thinking_blocks`.
+
+        Returns:
+            str: The remaining text.
+
+        Raises:
+            MalformedResponseError: If the validator rejects the reply.
+        """
+        out = self._filter(final=True)
+        if self._mode == "drop":
+            out += "".join(self._dropped)
+            self._dropped.clear()
+            self._mode = "text"
+        self._scan(out)
+        self._validate(out, final=True)
+        return out
+
+    def parse(self, text: str) -> str:
+        """Parse a complete reply from scratch, e.g. one answered from cache."""
+        self.reset()
+        return self.feed(text) + self.close()
+
+    def _validate(self, text: str, final: bool) -> None:
+        if self.validator is None:
+            return
+        reason = self.validator.check(text, self.elements, final)
+        if reason is not None:
+            raise MalformedResponseError(reason)
+
+    @staticmethod
+    def _split_backticks(text: str, final: bool) -> int:
+        """Length of `text` that cannot be part of a fence still arriving."""
+        if final:
+            return len(text)
+        return len(text.rstrip("`")) if text.endswith("`") else len(text)
+
+    def _filter(self, final: bool) -> str:
+        out = []
+        pending = self._pending
+        while pending:
+            index = pending.find(FENCE)
+            if index < 0:
+                safe = self._split_backticks(pending, final)
+                if self._mode == "drop":
+                    self._dropped.append(pending[:safe])
+                else:
+                    out.append(pending[:safe])
+                pending = pending[safe:]
+                break
+
+            if self._mode != "text":
+                end = index + len(FENCE)
+                if self._mode == "drop":
+                    self._dropped.clear()
+                else:
+                    out.append(pending[:end])
+                pending = pending[end:]
+                self._mode = "text"
+                continue
+
+            match = FENCE_PATTERN.match(pending, index)
+            if match.end() == len(pending) and not final:
+                # The language name may continue in the next delta
+                out.append(pending[:index])
+                pending = pending[index:]
+                break
+            out.append(pending[:index])
+            fence = match.group(0)
+            if match.group(1).lower() == self.drop_language:
+                self._mode = "drop"
+                self._dropped = [fence]
+            else:
+                self._mode = "code"
+                out.append(fence)
+            pending = pending[match.end() :]
+        self._pending = pending
+        return "".join(out)
+
+    def _scan(self, text: str) -> None:
+        """Look for watched elements completed by `text`."""
+        active = [scan for scan in self._scans if not scan.done]
+        if not text or not active:
+            return
+        self._window += text
+        window, offset = self._window, self._offset
+        end = offset + len(window)
+        for scan in active:
+            # Positions are absolute, `window` starts at `offset`
+            while not scan.done:
+                if scan.content_start is None:
+                    index = window.find(scan.open, scan.scan_from - offset)
+                    if index < 0:
+                        scan.scan_from = max(scan.scan_from, end - len(scan.open) + 1)
+                        break
+                    scan.content_start = scan.scan_from = (
+                        offset + index + len(scan.open)
+                    )
+                index = window.find(scan.close, scan.scan_from - offset)
+                if index < 0:
+                    scan.scan_from = max(scan.content_start, end - len(scan.close) + 1)
+                    break
+                start = scan.content_start - offset
+                self._emit(scan, window[start:index].strip())
+                scan.content_start = None
+                scan.scan_from = offset + index + len(scan.close)
+                scan.done = not scan.is_list
+
+        # Drop the text no scan will look at again
+        keep = min(
+            (
+                scan.scan_from if scan.content_start is None else scan.content_start
+                for scan in self._scans
+                if not scan.done
+            ),
+            default=end,
+        )
+        self._window = window[keep - offset :]
+        self._offset = keep
+
+    def _emit(self, scan: _TagScan, content: str) -> None:
+        tag = scan.open[1:-1]
+        self.elements[tag].append(content)
+        if self.on_tag is not None:
+            self.on_tag(tag, len(self.elements[tag]) - 1, content)
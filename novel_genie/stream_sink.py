@@ -0,0 +1,243 @@
+import asyncio
+import re
+import sys
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import IO, Dict, List, NamedTuple, Optional, Set, TextIO
+
+from novel_genie.logger import logger
+
+
+STREAM_SINKS = ("null", "console", "file")
+
+
+class StreamSink(ABC):
+    """
+    Destination of streamed LLM replies.
+
+    Every reply is a separate stream, identified by a stream id such as
+    `content_1_3`, so concurrent replies can be kept apart. A stream is
+    opened again from the start when its request is retried.
+    """
+
+    async def open(self, stream_id: str) -> None:
+        """A stream starts, or restarts after a failed attempt."""
+
+    @abstractmethod
+    async def write(self, stream_id: str, text: str) -> None:
+        """Append a batch of text to a stream."""
+
+    async def close(self, stream_id: str) -> None:
+        """A stream ends, successfully or not."""
+
+
+class NullSink(StreamSink):
+    """Discards streamed text."""
+
+    async def write(self, stream_id: str, text: str) -> None:
+        pass
+
+
+class ConsoleSink(StreamSink):
+    """
+    Prints streamed text line by line, each line prefixed with its stream id,
+    so concurrent streams do not interleave mid-line.
+    """
+
+    def __init__(self, out: Optional[TextIO] = None, prefix: bool = True):
+        self.out = out or sys.stdout
+        self.prefix = prefix
+        self._partial: Dict[str, str] = {}
+
+    def _emit(self, stream_id: str, lines: List[str]) -> None:
+        if self.prefix:
+            lines = [f"[{stream_id}] {line}" for line in lines]
+        self.out.write("\n".join(lines) + "\n")
+        self.out.flush()
+
+    async def open(self, stream_id: str) -> None:
+        self._partial[stream_id] = ""
+
+    async def write(self, stream_id: str, text: str) -> None:
+        lines = (self._partial.get(stream_id, "") + text).split("\n")
+        self._partial[stream_id] = lines.pop()
+        if lines:
+            self._emit(stream_id, lines)
+
+    async def close(self, stream_id: str) -> None:
+        partial = self._partial.pop(stream_id, "")
+        if partial:
+            self._emit(stream_id, [partial])
+
+
+class FileSink(StreamSink):
+    """Writes every stream to its own file, e.g. one file per chapter."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._files: Dict[str, IO[str]] = {}
+
+    def path(self, stream_id: str) -> Path:
+        return self.directory / (re.sub(r"[^\w.-]", "_", stream_id) + ".txt")
+
+    async def open(self, stream_id: str) -> None:
+        await self.close(stream_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files[stream_id] = open(self.path(stream_id), "w", encoding="utf-8")
+
+    async def write(self, stream_id: str, text: str) -> None:
+        if stream_id not in self._files:
+            await self.open(stream_id)
+        self._files[stream_id].write(text)
+
+    async def close(self, stream_id: str) -> None:
+        file = self._files.pop(stream_id, None)
+        if file is not None:
+            file.close()
+
+
+class StreamEvent(NamedTuple):
+    stream_id: str
+    kind: str  # "open", "text" or "close", or "status" of a job
+    text: str = ""
+
+
+class QueueSink(StreamSink):
+    """
+    Publishes stream events to an asyncio queue, e.g. for a UI or websocket.
+
+    A bounded queue applies backpressure: generation waits for the consumer
+    instead of buffering without limit.
+    """
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, maxsize: int = 1000):
+        self.queue: asyncio.Queue = queue or asyncio.Queue(maxsize=maxsize)
+
+    async def open(self, stream_id: str) -> None:
+        await self.queue.put(StreamEvent(stream_id, "open"))
+
+    async def write(self, stream_id: str, text: str) -> None:
+        await self.queue.put(StreamEvent(stream_id, "text", text))
+
+    async def close(self, stream_id: str) -> None:
+        await self.queue.put(StreamEvent(stream_id, "close"))
+
+
+class BroadcastSink(StreamSink):
+    """
+    Publishes stream events to every subscribed queue, e.g. one per HTTP
+    client following a job.
+
+    Unlike `QueueSink`, a slow subscriber never holds up generation: once
+    its queue is full it is dropped and receives `None` instead of the
+    events it missed.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.maxsize)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: StreamEvent) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def open(self, stream_id: str) -> None:
+        self.publish(StreamEvent(stream_id, "open"))
+
+    async def write(self, stream_id: str, text: str) -> None:
+        self.publish(StreamEvent(stream_id, "text", text))
+
+    async def close(self, stream_id: str) -> None:
+        self.publish(StreamEvent(stream_id, "close"))
+
+
+def create_sink(name: str, directory: Optional[str] = None) -> StreamSink:
+    """Sink by its configured name, see `STREAM_SINKS`."""
+    if name == "null":
+        return NullSink()
+    if name == "console":
+        return ConsoleSink()
+    if name == "file":
+        if not directory:
+            raise ValueError("The file stream sink requires a directory")
+        return FileSink(directory)
+    raise ValueError(f"Unknown stream sink: {name}")
+
+
+class StreamWriter:
+    """
+    Batches the deltas of one stream before handing them to a sink.
+
+    Deltas are joined until `batch_chars` characters are pending or
+    `flush_interval` seconds have passed, so the sink sees a few writes per
+    second instead of one per token.
+    """
+
+    def __init__(
+        self,
+        sink: StreamSink,
+        stream_id: str,
+        batch_chars: int = 256,
+        flush_interval: float = 0.2,
+    ):
+        self.sink = sink
+        self.stream_id = stream_id
+        self.batch_chars = batch_chars
+        self.flush_interval = flush_interval
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+    async def _call(self, method: str, *args: str) -> None:
+        # Output is best effort and must not fail the request
+        try:
+            await getattr(self.sink, method)(self.stream_id, *args)
+        except Exception as e:
+            logger.warning(f"Stream sink {method} failed for {self.stream_id}: {e}")
+
+    async def __aenter__(self) -> "StreamWriter":
+        await self._call("open")
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.flush()
+        await self._call("close")
+
+    async def write(self, delta: str) -> None:
+        if not delta:
+            return
+        self._pending.append(delta)
+        self._pending_chars += len(delta)
+        if (
+            self._pending_chars >= self.batch_chars
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._pending_chars = 0
+        await self._call("write", text)
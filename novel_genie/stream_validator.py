@@ -0,0 +1,123 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Pattern
+
+from novel_genie.schema import OutlineType
+from novel_genie.utils import CHAPTER_TITLE_PATTERN, OUTLINE_TAGS
+
+
+class StreamValidator(ABC):
+    """
+    Stage-specific check of the format of a streamed LLM reply.
+
+    A `StreamParser` hands every piece of filtered text to its validator as
+    it arrives, so a reply that drifted from the requested format can be
+    aborted before the rest of it is paid for, and retried with `correction`
+    appended to the prompt.
+    """
+
+    # Reminder appended to the prompt of the retried request
+    correction: str = ""
+
+    def reset(self) -> None:
+        """Start over with a new reply."""
+
+    @abstractmethod
+    def check(
+        self, text: str, elements: Dict[str, List[str]], final: bool
+    ) -> Optional[str]:
+        """
+        Check the reply after another piece of it arrived.
+
+        Args:
+            text (str): The newly arrived text, without thinking blocks
+            elements (Dict[str, List[str]]): Tag elements completed so far
+            final (bool): Whether the reply is complete
+
+        Returns:
+            Optional[str]: Why the reply cannot be used, None while it can.
+        """
+
+
+class PrefixValidator(StreamValidator):
+    """
+    Requires `pattern` to appear within the first `within_chars` characters
+    of the reply, or anywhere in it if `within_chars` is 0.
+
+    Args:
+        pattern (Pattern): Expected start of the reply, e.g. a heading
+        within_chars (int): Characters after which a missing match aborts
+        expected (str): Description of the match for error messages
+        correction (str): Reminder appended to the prompt of a retry
+    """
+
+    def __init__(
+        self, pattern: Pattern, within_chars: int, expected: str, correction: str
+    ):
+        self.pattern = pattern
+        self.within_chars = within_chars
+        self.expected = expected
+        self.correction = correction
+        self.reset()
+
+    def reset(self) -> None:
+        self._prefix = ""
+        self._found = False
+
+    def check(
+        self, text: str, elements: Dict[str, List[str]], final: bool
+    ) -> Optional[str]:
+        if self._found:
+            return None
+        self._prefix += text
+        if self.within_chars <= 0 and not final:
+            # Only the complete reply is checked
+            return None
+        if self.pattern.search(self._prefix):
+            self._found = True
+            self._prefix = ""
+            return None
+        if final:
+            return f"no {self.expected} in the reply"
+        if len(self._prefix) > self.within_chars:
+            return f"no {self.expected} within the first {self.within_chars} characters"
+        return None
+
+
+class OutlineValidator(PrefixValidator):
+    """
+    Requires an opening outline tag early in the reply and every tag
+    `extract_outline` reads for `outline_type` by its end.
+    """
+
+    def __init__(self, outline_type: OutlineType, within_chars: int):
+        self.tags = [tag for tag, _ in OUTLINE_TAGS[outline_type].values()]
+        tag_list = "、".join(f"<{tag}></{tag}>" for tag in self.tags)
+        super().__init__(
+            pattern=re.compile("|".join(f"<{tag}>" for tag in self.tags)),
+            within_chars=within_chars,
+            expected="opening outline tag",
+            correction=f"请严格按照输出格式，用 {tag_list} 标签包裹对应内容，不要在标签之前输出多余的说明。",
+        )
+
+    def check(
+        self, text: str, elements: Dict[str, List[str]], final: bool
+    ) -> Optional[str]:
+        reason = super().check(text, elements, final)
+        if reason is None and final:
+            missing = [tag for tag in self.tags if not elements.get(tag)]
+            if missing:
+                reason = f"missing outline tags {', '.join(missing)}"
+        return reason
+
+
+class ChapterValidator(PrefixValidator):
+    """Requires the chapter heading `generate_chapter` splits the title at."""
+
+    def __init__(self, within_chars: int):
+        super().__init__(
+            pattern=CHAPTER_TITLE_PATTERN,
+            within_chars=within_chars,
+            expected="chapter heading",
+            correction="请严格按照输出格式，以“## 第X章 章节标题”作为第一行开始输出正文，不要在标题之前输出多余的说明。",
+        )
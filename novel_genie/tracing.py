@@ -0,0 +1,320 @@
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from novel_genie.config import config
+from novel_genie.logger import logger
+
+
+TRACE_FORMATS = ("off", "chrome", "otlp")
+
+
+class Span:
+    """One timed operation of a traced run, such as a stage or an LLM request."""
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        span_id: int,
+        parent: Optional["Span"],
+        name: str,
+        category: str,
+        track: int,
+        attributes: Dict[str, Any],
+    ):
+        self.tracer = tracer
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.category = category
+        # Chrome trace rows: spans of one asyncio task share a track and nest
+        self.track = track
+        self.attributes = attributes
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes, e.g. sizes known only once the operation ran."""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, value: float) -> None:
+        """Accumulate a numeric attribute, e.g. time spent across retries."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+
+# The span new spans are nested under. Context variables are copied into
+# every asyncio task, so the stages of the task graph nest under the run.
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer(BaseModel):
+    """
+    Per-stage timing of a generation run, exported as a trace file.
+
+    Spans cover the generation stages, the LLM requests they make (with time
+    to first token and prompt and reply sizes), parsing of the replies and
+    checkpoint writes. Writes are timed where they are applied, usually on
+    the background writer thread (`checkpoint_write` spans), while the
+    `checkpoint` spans of the stages cover serializing and queueing them.
+    When the outermost span ends, the trace is written to
+    `directory` as Chrome trace JSON, which chrome://tracing and Perfetto
+    open, or as OTLP JSON, which OpenTelemetry collectors import.
+    """
+
+    trace_format: str = Field(default_factory=lambda: config.novel.trace_format)
+    # Where the trace is written, e.g. the directory of the novel
+    directory: Optional[str] = None
+
+    _spans: List[Span] = PrivateAttr(default_factory=list)
+    _span_ids: Iterator[int] = PrivateAttr(default_factory=lambda: itertools.count(1))
+    _tracks: Dict[int, int] = PrivateAttr(default_factory=dict)
+    _track_names: Dict[int, str] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _started_at: datetime = PrivateAttr(default_factory=datetime.now)
+    # Converts perf_counter_ns to Unix time for OTLP
+    _epoch_offset_ns: int = PrivateAttr(
+        default_factory=lambda: time.time_ns() - time.perf_counter_ns()
+    )
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format: {self.trace_format}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.trace_format != "off"
+
+    @property
+    def spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key, name = (
+            (id(task), task.get_name())
+            if task is not None
+            else (threading.get_ident(), threading.current_thread().name)
+        )
+        with self._lock:
+            if key not in self._tracks:
+                self._tracks[key] = len(self._tracks) + 1
+                self._track_names[self._tracks[key]] = name
+            return self._tracks[key]
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "stage", **attributes: Any
+    ) -> Iterator[Span]:
+        """Time the enclosed block as a span nested under the current one."""
+        parent = current_span.get()
+        if parent is not None and parent.tracer is not self:
+            parent = None
+        span = Span(
+            self,
+            next(self._span_ids),
+            parent,
+            name,
+            category,
+            self._track(),
+            attributes,
+        )
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            current_span.reset(token)
+            with self._lock:
+                self._spans.append(span)
+            if parent is None and self.directory:
+                self.export()
+
+    def export(self, path: Optional[str] = None) -> Optional[Path]:
+        """
+        Write the finished spans as a trace file.
+
+        Args:
+            path (Optional[str]): Trace file, by default named after the start
+                of the run in `directory`
+
+        Returns:
+            Optional[Path]: The written file, None if nothing was traced.
+        """
+        if not self._spans:
+            return None
+        if path is None:
+            suffix = "otlp.json" if self.trace_format == "otlp" else "json"
+            path = (
+                Path(self.directory)
+                / f"trace_{self._started_at.strftime('%Y%m%d_%H%M%S')}.{suffix}"
+            )
+        path = Path(path)
+        trace = self.to_otlp() if self.trace_format == "otlp" else self.to_chrome()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(trace, f, ensure_ascii=False)
+            tmp_path.replace(path)
+        except OSError as e:
+            # A trace is diagnostics only and must never fail a run
+            logger.warning(f"Failed to write trace {path}: {e}")
+            return None
+        logger.info(f"Wrote {len(self._spans)} trace spans to {path}")
+        return path
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Spans as Chrome trace event JSON, one complete event per span."""
+        pid = os.getpid()
+        origin_ns = min(span.start_ns for span in self._spans)
+        events: List[Dict[str, Any]] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": track,
+                "args": {"name": name},
+            }
+            for track, name in self._track_names.items()
+        ]
+        for span in self._spans:
+            args = dict(span.attributes, span_id=span.span_id)
+            if span.parent_id is not None:
+                args["parent_id"] = span.parent_id
+            if span.error is not None:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": (span.start_ns - origin_ns) / 1000,
+                    "dur": (span.end_ns - span.start_ns) / 1000,
+                    "pid": pid,
+                    "tid": span.track,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    @staticmethod
+    def _otlp_value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Spans as an OTLP/JSON trace export request."""
+        trace_id = uuid.uuid4().hex
+        spans = []
+        for span in self._spans:
+            otlp_span = {
+                "traceId": trace_id,
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns + self._epoch_offset_ns),
+                "endTimeUnixNano": str(span.end_ns + self._epoch_offset_ns),
+                "attributes": [
+                    {"key": key, "value": self._otlp_value(value)}
+                    for key, value in dict(
+                        span.attributes, category=span.category
+                    ).items()
+                ],
+                "status": (
+                    {"code": 2, "message": span.error}  # STATUS_CODE_ERROR
+                    if span.error is not None
+                    else {"code": 1}  # STATUS_CODE_OK
+                ),
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": "novel-genie"},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "novel_genie"}, "spans": spans}],
+                }
+            ]
+        }
+
+
+@contextmanager
+def trace_span(
+    name: str, category: str = "stage", **attributes: Any
+) -> Iterator[Optional[Span]]:
+    """
+    Time the enclosed block in the tracer of the current span, if any.
+
+    Code that does not own a tracer, such as the LLM client, traces through
+    this; outside of a traced run it yields None and records nothing.
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, category, **attributes) as span:
+        yield span
+
+
+def traced(name: str, category: str = "stage") -> Callable:
+    """
+    Decorator timing a generator method as a span in the generator's
+    `tracer`, tagged with the volume and chapter it was called for.
+
+    Args:
+        name (str): Span name, e.g. the stage
+        category (str): Span category, to filter the trace by
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable]:
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if not self.tracer.enabled:
+                return await func(self, *args, **kwargs)
+            call_args = signature.bind(self, *args, **kwargs).arguments
+            attributes = {
+                key: call_args[key]
+                for key in ("volume_num", "chapter_num")
+                if call_args.get(key) is not None
+            }
+            with self.tracer.span(name, category, **attributes):
+                return await func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -24,11 +24,10 @@ from novel_genie.schema import (
     ChapterOutline,
     CheckpointType,
     DetailedOutline,
-    Novel,
-    NovelVolume,
     OutlineType,
     RoughOutline,
 )
+from novel_genie.tracing import trace_span
 
 
 T = TypeVar("T", bound=BaseModel)
@@ -200,87 +199,61 @@ def process_edit_commands(original_content: str, commands: List[str]) -> str:
 
 def save_checkpoint(checkpoint_type: CheckpointType):
     """
-    Decorator for saving complete novel state during generation.
+    Decorator for checkpointing novel state during generation.
+
+    Chapter checkpoints only write the chapter text; the stage result itself
+    is appended to the checkpoint journal by the generator once it has been
+    attached to the novel state. Volume and novel checkpoints journal the
+    novel-level progress and compact the journal.
 
     Args:
         checkpoint_type (CheckpointType): Type of checkpoint to save
     """
 
     def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        signature = inspect.signature(func)
+
         @wraps(func)
         async def wrapper(self, *args, **kwargs) -> T:
             result = await func(self, *args, **kwargs)
 
-            # Base checkpoint data with novel-level info
-            checkpoint_data = {
-                "intent": self.intent.model_dump() if self.intent else None,
-                "rough_outline": self.rough_outline.model_dump()
-                if self.rough_outline
-                else None,
-                "volumes": [v.model_dump() for v in self.volumes],
-                "current_volume_num": self.current_volume_num,
-                "current_chapter_num": self.current_chapter_num,
-            }
-
-            if checkpoint_type == CheckpointType.VOLUME:
-                volume = cast(NovelVolume, result)
-                checkpoint_data["current_volume"] = volume.model_dump()
-
-            elif checkpoint_type == CheckpointType.CHAPTER:
-                chapter = cast(Chapter, result)
-                # Save chapter content separately
-                if self.current_volume_num and self.current_chapter_num:
-                    self.novel_saver.save_chapter(
-                        self.novel_id,
-                        self.current_volume_num,
-                        self.current_chapter_num,
-                        chapter,
+            with trace_span("checkpoint", "checkpoint", type=checkpoint_type.value):
+                # Stages may run concurrently, so prefer the volume/chapter the
+                # call was made for over the generator's "current" position.
+                call_args = signature.bind(self, *args, **kwargs).arguments
+                volume_num = call_args.get("volume_num") or self.current_volume_num
+                chapter_num = call_args.get("chapter_num") or self.current_chapter_num
+
+                if checkpoint_type == CheckpointType.CHAPTER:
+                    chapter = cast(Chapter, result)
+                    # Save chapter content separately
+                    if volume_num and chapter_num:
+                        self.novel_saver.save_chapter(
+                            self.novel_id,
+                            volume_num,
+                            chapter_num,
+                            chapter,
+                        )
+                    logger.info(
+                        f"Saved {checkpoint_type.value} content for novel {self.novel_id}"
                     )
-
-                # Update checkpoint with current chapter data
-                checkpoint_data.update(
-                    {
-                        "current_chapter": {
-                            "title": chapter.title,
-                            "content": chapter.content,
-                        },
-                        # "chapter_outline": self.chapter_outlines.model_dump()
-                        "chapter_outlines": [
-                            co.model_dump()
-                            for co in self.volumes[
-                                self.current_volume_num - 1
-                            ].chapter_outlines
-                        ]
-                        if self.volumes
-                        else None,
-                        # "detailed_outline": self.detailed_outlines.model_dump()
-                        "detailed_outlines": [
-                            do.model_dump()
-                            for do in self.volumes[
-                                self.current_volume_num - 1
-                            ].detailed_outlines
-                        ]
-                        if self.volumes
-                        else None,
-                    }
+                    return result
+
+                # Stage results are already journaled, so only the novel-level
+                # progress and token usage are added before compacting
+                self.save_progress(
+                    current_volume_num=self.current_volume_num,
+                    current_chapter_num=self.current_chapter_num,
+                    cost_info=self.cost_tracker.get(),
                 )
-
-            elif checkpoint_type == CheckpointType.NOVEL:
-                novel = cast(Novel, result)
-                checkpoint_data.update(
-                    {
-                        "intent": novel.intent.model_dump(),
-                        "rough_outline": novel.rough_outline.model_dump(),
-                        "volumes": [v.model_dump() for v in novel.volumes],
-                        "cost_info": novel.cost_info,
-                    }
+                if checkpoint_type == CheckpointType.NOVEL:
+                    # The run ends once its checkpoint is on disk, which also
+                    # keeps the queued writes within the run's trace
+                    self.novel_saver.flush()
+                logger.info(
+                    f"Saved {checkpoint_type.value} checkpoint for novel {self.novel_id}"
                 )
-
-            self.novel_saver.save_checkpoint(self.novel_id, checkpoint_data)
-            logger.info(
-                f"Saved {checkpoint_type.value} checkpoint for novel {self.novel_id}"
-            )
-            return result
+                return result
 
         return wrapper
 
@@ -360,6 +333,24 @@ def load_outline_from_dict(
     return outline_class.model_validate(data)
 
 
+# Heading that starts the text of a generated chapter
+CHAPTER_TITLE_PATTERN = re.compile(r"## 第\s*[0-9零一二三四五六七八九]+\s*章\s+.+")
+
+# Tag mappings for different outline types: field -> (tag, is list)
+OUTLINE_TAGS = {
+    OutlineType.ROUGH: {
+        "worldview_system": ("worldview_system", False),
+        "character_system": ("character_system", False),
+        "volume_design": ("volume_design", True),  # Now marked as a list
+    },
+    OutlineType.CHAPTER: {
+        "chapter_overview": ("chapter_overview", False),
+        "characters_content": ("characters_content", False),
+    },
+    OutlineType.DETAILED: {"storyline": ("storyline", False)},
+}
+
+
 def extract_outline(
     document: str, outline_type: OutlineType
 ) -> Union[RoughOutline, ChapterOutline, DetailedOutline]:
@@ -398,23 +389,9 @@ def extract_outline(
             match = re.search(pattern, document, re.DOTALL)
             return match.group(1).strip() if match else None
 
-    # Tag mappings for different outline types with type hints
-    tag_mappings = {
-        OutlineType.ROUGH: {
-            "worldview_system": ("worldview_system", False),
-            "character_system": ("character_system", False),
-            "volume_design": ("volume_design", True),  # Now marked as a list
-        },
-        OutlineType.CHAPTER: {
-            "chapter_overview": ("chapter_overview", False),
-            "characters_content": ("characters_content", False),
-        },
-        OutlineType.DETAILED: {"storyline": ("storyline", False)},
-    }
-
     # Extract content based on outline type
     content = {}
-    for key, (tag, is_list) in tag_mappings[outline_type].items():
+    for key, (tag, is_list) in OUTLINE_TAGS[outline_type].items():
         extracted_content = extract_tag_content(tag, is_list)
         if extracted_content is None:
             raise ValueError(f"Required content '{tag}' not found in document")
@@ -24,13 +24,10 @@ setup(
     packages=find_packages(),
     install_requires=[
         "openai~=0.28.0",
+        "aiohttp~=3.9",
         "pyyaml~=6.0.2",
         "pydantic~=2.10.2",
         "loguru~=0.7.2",
-        "easyocr~=1.7.2",
-        "pyautogui~=0.9.54",
-        "pynput~=1.7.7",
-        "Pillow~=11.0.0",
     ],
     entry_points={
         "console_scripts": [
@@ -41,6 +38,15 @@ setup(
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
     ],
+    extras_require={
+        "tokenizer": ["tiktoken"],
+        "screenshot": [
+            "easyocr~=1.7.2",
+            "pyautogui~=0.9.54",
+            "pynput~=1.7.7",
+            "Pillow~=11.0.0",
+        ],
+    },
     python_requires=">=3.10",
     package_data={
         "novel_genie": ["README.md", "README_EN.md"],